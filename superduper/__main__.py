@@ -2,12 +2,13 @@ import sys
 
 import click
 
-from superduper.cli import app, apply, info
+from superduper.cli import app, apply, info, jobs
 from superduper.cli.serve import cdc, local_cluster, ray_serve, vector_search
 
 __all__ = (
     'apply',
     'info',
+    'jobs',
     'local_cluster',
     'vector_search',
     'cdc',
@@ -9,7 +9,10 @@ from superduper.backends.mongodb.metadata import MongoMetaDataStore
 from superduper.backends.sqlalchemy.metadata import SQLAlchemyMetadata
 from superduper.vector_search.atlas import MongoAtlasVectorSearcher
 from superduper.vector_search.in_memory import InMemoryVectorSearcher
+from superduper.vector_search.in_memory_ivf import InMemoryIVFVectorSearcher
+from superduper.vector_search.in_memory_pq import InMemoryPQVectorSearcher
 from superduper.vector_search.lance import LanceVectorSearcher
+from superduper.vector_search.sharded import ShardedVectorSearcher
 
 data_backends = {
     'mongodb': MongoDataBackend,
@@ -29,6 +32,9 @@ metadata_stores = {
 vector_searcher_implementations = {
     'lance': LanceVectorSearcher,
     'in_memory': InMemoryVectorSearcher,
+    'in_memory_ivf': InMemoryIVFVectorSearcher,
+    'in_memory_pq': InMemoryPQVectorSearcher,
+    'in_memory_sharded': ShardedVectorSearcher,
     'mongodb+srv': MongoAtlasVectorSearcher,
 }
 
@@ -1,7 +1,12 @@
+import atexit
+import threading
 import time
 import typing as t
+import weakref
 from abc import ABC, abstractmethod
 
+from superduper import logging
+
 from .data_backend import DataBackendProxy
 
 if t.TYPE_CHECKING:
@@ -107,6 +112,38 @@ class MetaDataStore(ABC):
         """
         pass
 
+    def update_jobs(self, updates: t.Dict[str, t.Dict[str, t.Any]]):
+        """
+        Update several fields of several jobs in the metadata store.
+
+        Backends override this to write all updates in one round trip.
+
+        :param updates: mapping of job identifier to the fields to update
+        """
+        for job_id, fields in updates.items():
+            for key, value in fields.items():
+                self.update_job(job_id, key, value)
+
+    def flush_job_updates(self):
+        """Write buffered updates of jobs; see ``MetaDataStoreProxy``."""
+        pass
+
+    def show_job_ids(
+        self,
+        component_identifier: t.Optional[str] = None,
+        type_id: t.Optional[str] = None,
+    ) -> t.List[str]:
+        """
+        Show the identifiers of the jobs of a component.
+
+        :param component_identifier: identifier of component
+        :param type_id: type of component
+        """
+        jobs = self.show_jobs(
+            component_identifier=component_identifier, type_id=type_id
+        )
+        return [r['identifier'] for r in jobs or ()]
+
     def watch_job(self, identifier: str):
         """
         Listen to a job.
@@ -340,8 +377,175 @@ class MetaDataStoreProxy(DataBackendProxy):
     """
     Proxy class to DataBackend which acts as middleware for performing fallbacks.
 
+    Updates of jobs are buffered and merged per job, and written together
+    with ``update_jobs`` (see ``CFG.job_updates``); reads of jobs write the
+    buffered updates first, and a timer writes them once they waited
+    ``job_updates_interval`` seconds, as does the exit of the process. The
+    identifiers of the jobs of each component are cached for
+    ``job_updates_interval`` seconds, and kept up to date with the jobs
+    created through this proxy.
+
     :param backend: Instance of `MetaDataStore`.
     """
 
     def __init__(self, backend):
         super().__init__(backend=backend)
+        from superduper import CFG
+
+        self.job_updates_interval = CFG.job_updates.interval
+        self.job_updates_max_pending = CFG.job_updates.max_pending
+        self._job_updates: t.Dict[str, t.Dict[str, t.Any]] = {}
+        self._job_updates_since = 0.0
+        self._job_updates_timer: t.Optional[threading.Timer] = None
+        # Identifiers of jobs by component, with the time they were read
+        self._job_ids: t.Dict[t.Tuple, t.Tuple[float, t.List[str]]] = {}
+        self._jobs_lock = threading.RLock()
+        atexit.register(_flush_job_updates, weakref.ref(self))
+
+    def update_job(self, job_id: str, key: str, value: t.Any):
+        """
+        Buffer an update of a job.
+
+        :param job_id: job identifier
+        :param key: key to be updated
+        :param value: value to be updated
+        """
+        with self._jobs_lock:
+            if not self._job_updates:
+                self._job_updates_since = time.monotonic()
+            self._job_updates.setdefault(job_id, {})[key] = value
+            due = (
+                len(self._job_updates) >= self.job_updates_max_pending
+                or time.monotonic() - self._job_updates_since
+                >= self.job_updates_interval
+            )
+            if not due and self._job_updates_timer is None:
+                self._job_updates_timer = threading.Timer(
+                    self.job_updates_interval,
+                    _flush_job_updates,
+                    args=(weakref.ref(self),),
+                )
+                self._job_updates_timer.daemon = True
+                self._job_updates_timer.start()
+        if due:
+            self.flush_job_updates()
+
+    def flush_job_updates(self):
+        """Write the buffered updates of jobs.
+
+        If the write fails, the updates stay buffered.
+        """
+        with self._jobs_lock:
+            if self._job_updates_timer is not None:
+                self._job_updates_timer.cancel()
+                self._job_updates_timer = None
+            updates, self._job_updates = self._job_updates, {}
+            if not updates:
+                return
+            try:
+                self.__getattr__('update_jobs')(updates)
+            except Exception:
+                self._job_updates = updates
+                raise
+
+    def create_job(self, info: t.Dict):
+        """
+        Create a job in the metadata store.
+
+        :param info: dictionary containing information about the job.
+        """
+        self.__getattr__('create_job')(info)
+        with self._jobs_lock:
+            component, type_id = info.get('component_identifier'), info.get('type_id')
+            for key in {
+                (component, type_id),
+                (component, None),
+                (None, type_id),
+                (None, None),
+            }:
+                if key in self._job_ids:
+                    self._job_ids[key][1].append(info['identifier'])
+
+    def show_job_ids(
+        self,
+        component_identifier: t.Optional[str] = None,
+        type_id: t.Optional[str] = None,
+    ) -> t.List[str]:
+        """
+        Show the identifiers of the jobs of a component.
+
+        The identifiers are read from the metadata store at most once every
+        ``job_updates_interval`` seconds per component, so that jobs created
+        in other processes are seen after at most that long.
+
+        :param component_identifier: identifier of component
+        :param type_id: type of component
+        """
+        key = (component_identifier, type_id)
+        with self._jobs_lock:
+            read_at, job_ids = self._job_ids.get(key, (None, None))
+            now = time.monotonic()
+            if job_ids is None or now - read_at >= self.job_updates_interval:
+                job_ids = self.__getattr__('show_job_ids')(
+                    component_identifier=component_identifier, type_id=type_id
+                )
+                self._job_ids[key] = (now, job_ids)
+            return list(job_ids)
+
+    def get_job(self, job_id: str):
+        """
+        Get a job from the metadata store.
+
+        :param job_id: job identifier
+        """
+        self.flush_job_updates()
+        return self.__getattr__('get_job')(job_id)
+
+    def show_jobs(
+        self,
+        component_identifier: t.Optional[str] = None,
+        type_id: t.Optional[str] = None,
+    ):
+        """Show all jobs in the metadata store.
+
+        :param component_identifier: identifier of component
+        :param type_id: type of component
+        """
+        self.flush_job_updates()
+        return self.__getattr__('show_jobs')(
+            component_identifier=component_identifier, type_id=type_id
+        )
+
+    def watch_job(self, identifier: str):
+        """
+        Listen to a job.
+
+        :param identifier: job identifier
+        """
+        self.flush_job_updates()
+        return self.__getattr__('watch_job')(identifier)
+
+    def drop(self, force: bool = False):
+        """
+        Drop the metadata store.
+
+        :param force: whether to force the drop (without confirmation)
+        """
+        with self._jobs_lock:
+            if self._job_updates_timer is not None:
+                self._job_updates_timer.cancel()
+                self._job_updates_timer = None
+            self._job_updates.clear()
+            self._job_ids.clear()
+        return self.__getattr__('drop')(force=force)
+
+
+def _flush_job_updates(ref: 'weakref.ref[MetaDataStoreProxy]'):
+    # Called by the timer and at exit, which mustn't keep the proxy alive
+    proxy = ref()
+    if proxy is None:
+        return
+    try:
+        proxy.flush_job_updates()
+    except Exception as e:
+        logging.warn(f'Failed to write buffered updates of jobs: {e}')
@@ -239,17 +239,23 @@ class IbisQuery(Query):
         if isinstance(like, Document):
             like = like.unpack()
         pre_like_query = IbisQuery(db=self.db, table=self.table, parts=pre_like_parts)
-        within_ids = [
-            r[self.primary_id] for r in pre_like_query.select_ids._execute(parent)
-        ]
+        # Selecting columns does not restrict the rows, so the vector search
+        # only needs the ids of the parent query if it filters rows.
+        within_ids = None
+        if any(isinstance(p, str) or p[0] != 'select' for p in pre_like_parts):
+            within_ids = [
+                str(r[self.primary_id])
+                for r in pre_like_query.select_ids._execute(parent)
+            ]
         similar_ids, similar_scores = self.db.select_nearest(
             like, vector_index=vector_index, n=like_kwargs.get('n', 10), ids=within_ids
         )
         similar_scores = dict(zip(similar_ids, similar_scores))
 
-        t = self.db[pre_like_query._get_parent().get_name()]
+        table_name = pre_like_query._get_parent().get_name()
+        t = self.db[table_name]
         filter_query = pre_like_query.filter(
-            getattr(t, self.primary_id).isin(similar_ids)
+            getattr(t, self.primary_id).isin(self._native_ids(table_name, similar_ids))
         )
 
         parts = filter_query.parts + post_like_parts
@@ -259,6 +265,14 @@ class IbisQuery(Query):
         outputs.scores = similar_scores
         return outputs
 
+    def _native_ids(self, table_name: str, ids: t.Sequence) -> t.List:
+        # Vector searchers keep ids as strings; filters on integer primary
+        # keys need the ids as integers
+        schema = self.db.databackend.conn.table(table_name).schema()
+        if schema[self.primary_id].is_integer():
+            return [int(id) for id in ids]
+        return list(ids)
+
     def _execute_select(self, parent):
         return self._execute(parent)
 
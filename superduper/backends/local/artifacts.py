@@ -1,6 +1,7 @@
 import os
 import shutil
 import typing as t
+import uuid
 from pathlib import Path
 
 import click
@@ -80,8 +81,11 @@ class FileSystemArtifactStore(ArtifactStore):
         path = os.path.join(self.conn, file_id)
         if os.path.exists(path):
             logging.warn(f"File {path} already exists")
-        with open(path, 'wb') as f:
+        # Replace the file at once, since jobs running in parallel may read it
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'wb') as f:
             f.write(serialized)
+        os.replace(tmp_path, path)
 
     def get_bytes(self, file_id: str) -> bytes:
         """
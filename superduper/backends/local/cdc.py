@@ -0,0 +1,260 @@
+import threading
+import traceback
+import typing as t
+
+from superduper import logging
+from superduper.base.config import LogBasedStrategy, PollingStrategy
+from superduper.base.document import _OUTPUTS_KEY
+from superduper.base.enums import DBType
+from superduper.misc.runnable.thread import HasThread
+
+if t.TYPE_CHECKING:
+    from superduper.base.datalayer import Datalayer
+
+# Seconds between reads of change streams, which don't block
+CHANGE_STREAM_INTERVAL = 1.0
+STRATEGIES = {'incremental': PollingStrategy, 'logbased': LogBasedStrategy}
+CHANGE_STREAM_EVENTS = {
+    'insert': 'insert',
+    'update': 'upsert',
+    'replace': 'upsert',
+    'delete': 'delete',
+}
+
+
+class LocalCDC:
+    """Change data capture running in a thread of the process of a ``Datalayer``.
+
+    While it runs, writes to the tables read by listeners return without
+    running the listeners (writes of outputs still trigger the listeners
+    downstream at once). Every ``strategy.frequency`` seconds the tables are
+    polled, and the ids changed since the last poll are sent to the listeners
+    and vector indices in batches of up to ``batch_size`` ids, so that many
+    small writes share one job. Changes are found with:
+
+    * ``PollingStrategy(auto_increment_field=...)``: rows with a larger value
+      of the field than the largest seen; only inserts are captured
+    * ``PollingStrategy()``: the ids of each table against those seen at the
+      last poll; inserts and deletes are captured. Each poll reads every id
+      of the table, and the ids are held in memory, so this suits small
+      tables only; otherwise use one of the other strategies
+    * ``LogBasedStrategy()``: MongoDB change streams; inserts, updates and
+      deletes are captured
+
+    Writes of events which aren't captured still run the listeners at once.
+    Changes of a table are captured from when a listener of it is applied;
+    earlier rows are computed by the listener itself. The thread needs
+    thread-safe connections (e.g. MongoDB, not SQLite); otherwise call
+    ``poll``.
+
+    :param db: Datalayer instance
+    :param strategy: How changes are found; defaults to ``CFG.cluster.cdc``
+    :param batch_size: Maximum number of ids sent to listeners in one event
+    """
+
+    def __init__(
+        self,
+        db: 'Datalayer',
+        strategy: t.Optional[t.Union[PollingStrategy, LogBasedStrategy]] = None,
+        batch_size: t.Optional[int] = None,
+    ):
+        cdc = db.cfg.cluster.cdc
+        self.db = db
+        strategy = strategy or cdc.strategy
+        if isinstance(strategy, dict):
+            # The configuration loads strategies as dicts
+            strategy = STRATEGIES[strategy['type']](**strategy)
+        self.strategy = strategy
+        self.batch_size = batch_size or cdc.batch_size
+        if isinstance(self.strategy, LogBasedStrategy):
+            if db.databackend.db_type != DBType.MONGODB:
+                raise ValueError('Log-based change data capture needs MongoDB')
+            self.frequency = CHANGE_STREAM_INTERVAL
+        else:
+            self.frequency = float(self.strategy.frequency)
+        self.watermarks: t.Dict[str, t.Any] = {}
+        self.resume_tokens: t.Dict[str, t.Any] = {}
+        self._streams: t.Dict[str, t.Any] = {}
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: t.Optional[HasThread] = None
+
+    def tables(self) -> t.List[str]:
+        """Return the tables read by listeners, excluding tables of outputs."""
+        tables = set()
+        for identifier in self.db.show('listener'):
+            table = self.db.listeners[identifier].select.table
+            if not table.startswith(_OUTPUTS_KEY):
+                tables.add(table)
+        return sorted(tables)
+
+    def captures(self, event_type: str) -> bool:
+        """Return whether events of the type are captured by the strategy.
+
+        :param event_type: Type of event, e.g. ``'insert'``
+        """
+        if isinstance(self.strategy, LogBasedStrategy):
+            return event_type in ('insert', 'update', 'upsert', 'delete')
+        if self.strategy.auto_increment_field:
+            return event_type == 'insert'
+        return event_type in ('insert', 'delete')
+
+    def watch(self):
+        """Start capturing the changes of tables of new listeners.
+
+        ``Datalayer.apply`` calls this once the jobs of the listener ran, so
+        that rows written since then are captured; otherwise the next poll
+        starts capturing them.
+        """
+        with self._lock:
+            for table in self.tables():
+                if table not in self.watermarks and table not in self._streams:
+                    self._read(table)
+
+    def poll(self) -> t.Dict[str, t.Dict[str, t.List]]:
+        """Find the changes of each table and send them to the listeners.
+
+        Returns the ids sent, by table and type of event.
+        """
+        changes = {}
+        with self._lock:
+            for table in self.tables():
+                events = {k: v for k, v in self._read(table).items() if v}
+                if events:
+                    self._dispatch(table, events)
+                    changes[table] = events
+        return changes
+
+    def _read(self, table: str) -> t.Dict[str, t.List]:
+        if isinstance(self.strategy, LogBasedStrategy):
+            return self._tail(table)
+        if self.strategy.auto_increment_field:
+            return self._poll_increments(table)
+        return self._poll_ids(table)
+
+    def _dispatch(self, table: str, events: t.Dict[str, t.List]):
+        query = self.db[table]
+        for event_type, ids in events.items():
+            logging.info(f'CDC: {len(ids)} {event_type} events in {table}')
+            for i in range(0, len(ids), self.batch_size):
+                self.db.on_event(
+                    query, ids=ids[i : i + self.batch_size], event_type=event_type
+                )
+
+    def _poll_increments(self, table: str) -> t.Dict[str, t.List]:
+        field = self.strategy.auto_increment_field
+        assert field is not None
+        if table not in self.watermarks:
+            self.watermarks[table] = self._max(table, field)
+            return {}
+        last = self.watermarks[table]
+        # Rows without a value of the field are never captured, since they
+        # would be captured again at every poll
+        if self.db.databackend.db_type == DBType.MONGODB:
+            collection = self.db.databackend.get_table_or_collection(table)
+            condition = {'$ne': None} if last is None else {'$gt': last}
+            cursor = collection.find({field: condition}, {'_id': 1, field: 1})
+            rows = [(r['_id'], r[field]) for r in cursor]
+        else:
+            primary_id = self.db[table].primary_id
+            expr = self.db.databackend.conn.table(table)
+            expr = expr.filter(expr[field].notnull())
+            if last is not None:
+                expr = expr.filter(expr[field] > last)
+            df = expr.select(primary_id, field).execute()
+            rows = list(zip(df[primary_id].tolist(), df[field].tolist()))
+        if rows:
+            self.watermarks[table] = max(value for _, value in rows)
+        return {'insert': [id for id, _ in rows]}
+
+    def _max(self, table: str, field: str):
+        if self.db.databackend.db_type == DBType.MONGODB:
+            collection = self.db.databackend.get_table_or_collection(table)
+            r = collection.find_one({field: {'$ne': None}}, sort=[(field, -1)])
+            return None if r is None else r[field]
+        expr = self.db.databackend.conn.table(table)
+        value = expr[field].max().execute()
+        return None if value != value else value  # ``nan`` of empty tables
+
+    def _poll_ids(self, table: str) -> t.Dict[str, t.List]:
+        # A full scan of the ids of the table, held in memory between polls
+        if self.db.databackend.db_type == DBType.MONGODB:
+            collection = self.db.databackend.get_table_or_collection(table)
+            ids = [r['_id'] for r in collection.find({}, {'_id': 1})]
+        else:
+            primary_id = self.db[table].primary_id
+            expr = self.db.databackend.conn.table(table)
+            ids = expr.select(primary_id).execute()[primary_id].tolist()
+        seen = self.watermarks.get(table)
+        self.watermarks[table] = set(ids)
+        if seen is None:
+            return {}
+        return {
+            'insert': [id for id in ids if id not in seen],
+            'delete': list(seen - self.watermarks[table]),
+        }
+
+    def _tail(self, table: str) -> t.Dict[str, t.List]:
+        from superduper.backends.mongodb.query import ChangeStream
+
+        if table not in self._streams:
+            kwargs = {}
+            token = self.resume_tokens.get(table) or self.strategy.resume_token
+            if token:
+                kwargs['resume_after'] = token
+            stream = ChangeStream(collection=table, kwargs=kwargs)
+            self._streams[table] = stream(self.db)
+        stream = self._streams[table]
+        events: t.Dict[str, t.List] = {}
+        while True:
+            change = stream.try_next()
+            if change is None:
+                break
+            self.resume_tokens[table] = change['_id']
+            event_type = CHANGE_STREAM_EVENTS.get(change['operationType'])
+            if event_type is not None:
+                events.setdefault(event_type, []).append(change['documentKey']['_id'])
+        return events
+
+    def _step(self):
+        self._wake.wait(self.frequency)
+        self._wake.clear()
+        if self._thread is None or not self._thread.running:
+            return
+        try:
+            self.poll()
+        except Exception:
+            # A failed poll is tried again at the next one
+            logging.error(f'CDC: poll failed\n{traceback.format_exc()}')
+
+    def start(self):
+        """Start polling in a thread, and stop running listeners on writes."""
+        if self._thread is not None:
+            return
+        self.poll()
+        self._thread = HasThread(
+            callback=self._step, daemon=True, looping=True, name='cdc'
+        )
+        # Stopping the thread wakes it from waiting for the next poll
+        self._thread.running.on_set.append(self._wake.set)
+        self.db.cdc = self
+        self._thread.start()
+
+    def stop(self, timeout: t.Optional[float] = None):
+        """Stop polling; writes run listeners again.
+
+        Changes made since the last poll are sent to the listeners first.
+
+        :param timeout: Seconds to wait for the thread to stop
+        """
+        if self._thread is None:
+            return
+        thread, self._thread = self._thread, None
+        thread.stop()
+        thread.join(timeout)
+        if self.db.cdc is self:
+            self.db.cdc = None
+        self.poll()
+        for stream in self._streams.values():
+            stream.close()
+        self._streams.clear()
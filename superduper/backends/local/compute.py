@@ -1,21 +1,70 @@
+import concurrent.futures
+import threading
 import typing as t
 import uuid
 
 from superduper import logging
 from superduper.backends.base.compute import ComputeBackend
-from superduper.jobs.queue import LocalSequentialQueue
+from superduper.base.config import EventQueue
+from superduper.jobs.queue import LocalCoalescingQueue, LocalSequentialQueue
+
+POOLS = ('thread', 'process')
+
+
+def _copy_outcome(source: concurrent.futures.Future, target: concurrent.futures.Future):
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
 
 
 class LocalComputeBackend(ComputeBackend):
     """
-    A mockup backend for running jobs locally.
+    A backend for running jobs locally.
+
+    With ``num_workers=0`` jobs run inline, when they are submitted. Otherwise
+    they run on a pool of ``num_workers`` threads or processes: each job
+    starts once the jobs it depends on are complete, so that independent jobs
+    run in parallel. ``submit`` returns a ``concurrent.futures.Future``.
+
+    Jobs on threads share the ``Datalayer`` of the caller, so its connections
+    must be thread-safe (e.g. MongoDB, not SQLite). Jobs in processes connect
+    their own ``Datalayer`` from the configuration of the caller.
+
+    The events of writes are consumed when published, unless
+    ``queue.asynchronous`` is set; see ``LocalCoalescingQueue``.
 
     :param _uri: Optional uri param.
+    :param num_workers: Number of jobs run at the same time; 0 runs jobs inline
+    :param pool: ``'thread'`` or ``'process'``
+    :param queue: Configuration of the queue of events
     """
 
-    def __init__(self, _uri: t.Optional[str] = None):
-        self.__outputs: t.Dict = {}
-        self.queue = LocalSequentialQueue()
+    def __init__(
+        self,
+        _uri: t.Optional[str] = None,
+        num_workers: int = 0,
+        pool: str = 'thread',
+        queue: t.Optional[EventQueue] = None,
+    ):
+        if pool not in POOLS:
+            raise ValueError(f'Unknown pool {pool!r}; expected one of {POOLS}')
+        self.num_workers = num_workers
+        self.pool = pool
+        self.__outputs: t.Dict[str, concurrent.futures.Future] = {}
+        self._executor: t.Optional[concurrent.futures.Executor] = None
+        self._lock = threading.Lock()
+        self.queue: LocalSequentialQueue
+        if queue is not None and queue.asynchronous:
+            self.queue = LocalCoalescingQueue(
+                window=queue.window,
+                max_batch_size=queue.max_batch_size,
+                max_pending=queue.max_pending,
+            )
+        else:
+            self.queue = LocalSequentialQueue()
 
     @property
     def remote(self) -> bool:
@@ -46,34 +95,116 @@ class LocalComputeBackend(ComputeBackend):
 
     def submit(
         self, function: t.Callable, *args, compute_kwargs: t.Dict = {}, **kwargs
-    ) -> t.Tuple[str, str]:
+    ) -> concurrent.futures.Future:
         """
         Submits a function for local execution.
 
+        The function starts once the jobs in ``kwargs['dependencies']`` are
+        complete; these are futures or identifiers of jobs submitted earlier.
+
         :param function: The function to be executed.
         :param args: Positional arguments to be passed to the function.
         :param compute_kwargs: Do not use this parameter.
         :param kwargs: Keyword arguments to be passed to the function.
         """
         logging.info(f"Submitting job. function:{function}")
-        future = function(*args, **kwargs)
-
-        future_key = str(uuid.uuid4())
-        self.__outputs[future_key] = future
+        future_key = kwargs.get('job_id') or str(uuid.uuid4())
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        with self._lock:
+            self.__outputs[future_key] = future
+
+        if not self.num_workers:
+            try:
+                future.set_result(function(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+                raise
+        else:
+            self._schedule(future, function, args, kwargs)
 
         logging.success(
             f"Job submitted on {self}.  function:{function} future:{future_key}"
         )
-        return future_key, future_key
+        return future
+
+    def _upstream(self, dependencies) -> t.List[concurrent.futures.Future]:
+        upstream = []
+        with self._lock:
+            for dependency in dependencies or ():
+                if isinstance(dependency, concurrent.futures.Future):
+                    upstream.append(dependency)
+                elif isinstance(dependency, str) and dependency in self.__outputs:
+                    upstream.append(self.__outputs[dependency])
+        return upstream
+
+    def _schedule(self, future, function, args, kwargs):
+        upstream = self._upstream(kwargs.get('dependencies'))
+        if 'dependencies' in kwargs:
+            # Futures can't be sent to other processes, and aren't needed
+            kwargs['dependencies'] = ()
+        if self.pool == 'process' and kwargs.get('db') is not None:
+            kwargs['cfg'] = kwargs.pop('db').cfg.dict()
+            kwargs['db'] = None
+
+        def start():
+            for dependency in upstream:
+                if not dependency.cancelled() and dependency.exception() is None:
+                    continue
+                error = RuntimeError(f'A dependency of {function} failed')
+                if not dependency.cancelled():
+                    error.__cause__ = dependency.exception()
+                future.set_exception(error)
+                return
+            try:
+                running = self._get_executor().submit(function, *args, **kwargs)
+            except RuntimeError as e:
+                # The backend was shut down
+                future.set_exception(e)
+                return
+            running.add_done_callback(lambda f: _copy_outcome(f, future))
+
+        waiting = [len(upstream)]
+        waiting_lock = threading.Lock()
+
+        def on_done(_):
+            with waiting_lock:
+                waiting[0] -= 1
+                ready = waiting[0] == 0
+            if ready:
+                start()
+
+        if not upstream:
+            start()
+        for dependency in upstream:
+            dependency.add_done_callback(on_done)
+
+    def _get_executor(self) -> concurrent.futures.Executor:
+        with self._lock:
+            if self._executor is None:
+                if self.pool == 'process':
+                    self._executor = concurrent.futures.ProcessPoolExecutor(
+                        max_workers=self.num_workers
+                    )
+                else:
+                    self._executor = concurrent.futures.ThreadPoolExecutor(
+                        max_workers=self.num_workers, thread_name_prefix='local-compute'
+                    )
+            return self._executor
 
     @property
-    def tasks(self) -> t.Dict[str, t.Any]:
+    def tasks(self) -> t.Dict[str, concurrent.futures.Future]:
         """List for all pending tasks."""
         return self.__outputs
 
     def wait_all(self) -> None:
-        """Waits for all pending tasks to complete."""
-        pass
+        """Waits for all queued events and pending tasks to complete."""
+        self.queue.flush()
+        while True:
+            with self._lock:
+                pending = [f for f in self.__outputs.values() if not f.done()]
+            if not pending:
+                return
+            concurrent.futures.wait(pending)
 
     def result(self, identifier: str) -> t.Any:
         """Retrieves the result of a previously submitted task.
@@ -82,12 +213,16 @@ class LocalComputeBackend(ComputeBackend):
 
         :param identifier: The identifier of the submitted task.
         """
-        return self.__outputs[identifier]
+        return self.__outputs[identifier].result()
 
     def disconnect(self) -> None:
         """Disconnect the local client."""
-        pass
+        self.shutdown()
 
     def shutdown(self) -> None:
         """Shuts down the local cluster."""
-        pass
+        self.queue.close()
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
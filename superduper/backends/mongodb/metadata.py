@@ -1,6 +1,7 @@
 import typing as t
 
 import click
+from pymongo import UpdateOne
 from pymongo.results import DeleteResult, InsertOneResult, UpdateResult
 
 from superduper import logging
@@ -173,6 +174,21 @@ class MongoMetaDataStore(MetaDataStore):
             {'identifier': identifier}, {'$set': {key: value}}
         )
 
+    def update_jobs(self, updates: t.Dict[str, t.Dict[str, t.Any]]):
+        """Update several jobs in the metadata store with one bulk write.
+
+        :param updates: mapping of job identifier to the fields to update
+        """
+        if not updates:
+            return
+        self.job_collection.bulk_write(
+            [
+                UpdateOne({'identifier': identifier}, {'$set': fields})
+                for identifier, fields in updates.items()
+            ],
+            ordered=False,
+        )
+
     def show_components(self, type_id: t.Optional[str] = None):
         """Show components in the metadata store.
 
@@ -227,17 +227,21 @@ class MongoQuery(Query):
 
         like_args = self.parts[1][1]
 
-        like_kwargs = self.parts[1][2]
-        r = like_args[0] or like_kwargs.pop('r')
+        like_kwargs = dict(self.parts[1][2])
+        r = like_args[0] if like_args else like_kwargs.pop('r')
         if isinstance(r, Document):
             r = r.unpack()
         range = like_kwargs.pop('range', None)
 
-        parent_query = self[:-1].select_ids
-        if range:
-            parent_query = parent_query.limit(range)
-
-        relevant_ids = [str(r['_id']) for r in parent_query.do_execute()]
+        # An unfiltered ``find`` matches every document, so the vector search
+        # does not need to be restricted to the ids of the parent query.
+        filter_ = find_args[0] if find_args else find_kwargs.get('filter')
+        relevant_ids = None
+        if range or filter_:
+            parent_query = self[:-1].select_ids
+            if range:
+                parent_query = parent_query.limit(range)
+            relevant_ids = [str(r['_id']) for r in parent_query.do_execute()]
 
         similar_ids, scores = self.db.select_nearest(
             like=r,
@@ -248,12 +252,19 @@ class MongoQuery(Query):
         scores = dict(zip(similar_ids, scores))
         similar_ids = [ObjectId(id) for id in similar_ids]
 
-        final_args = find_args[:]
-        if not final_args:
-            final_args = [{}]
-        final_args[0]['_id'] = {'$in': similar_ids}
+        final_args = list(find_args)
+        final_kwargs = dict(find_kwargs)
+        filter_ = (
+            {'$and': [filter_, {'_id': {'$in': similar_ids}}]}
+            if filter_
+            else {'_id': {'$in': similar_ids}}
+        )
+        if final_args:
+            final_args[0] = filter_
+        else:
+            final_kwargs['filter'] = filter_
 
-        final_query = self.table_or_collection.find(*final_args, **find_kwargs)
+        final_query = self.table_or_collection.find(*final_args, **final_kwargs)
         result = final_query._execute(parent)
 
         result.scores = scores
@@ -511,9 +522,8 @@ class MongoQuery(Query):
     @applies_to('find', 'update_many', 'delete_many', 'delete_one')
     def select_ids(self):
         """Select the ids of the documents."""
-        filter_ = {}
-        if self.parts[0][1]:
-            filter_ = self.parts[0][1][0]
+        args, kwargs = self.parts[0][1:]
+        filter_ = args[0] if args else kwargs.get('filter') or {}
         projection = {'_id': 1}
         coll = type(self)(table=self.table, db=self.db)
         return coll.find(filter_, projection)
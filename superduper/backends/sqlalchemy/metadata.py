@@ -536,6 +536,22 @@ class SQLAlchemyMetadata(MetaDataStore):
             )
             session.execute(stmt)
 
+    def update_jobs(self, updates: t.Dict[str, t.Dict[str, t.Any]]):
+        """Update several jobs in one transaction.
+
+        :param updates: mapping of job identifier to the fields to update
+        """
+        if not updates:
+            return
+        with self.session_context() as session:
+            for job_id, fields in updates.items():
+                stmt = (
+                    self.job_table.update()
+                    .where(self.job_table.c.identifier == job_id)
+                    .values(fields)
+                )
+                session.execute(stmt)
+
     # --------------- Query ID -----------------
 
     def disconnect(self):
@@ -148,6 +148,13 @@ def build_compute(compute):
     module = importlib.import_module(path)
     compute_cls = getattr(module, cls)
 
+    if compute.uri is None:
+        return compute_cls(
+            compute.uri,
+            num_workers=compute.num_workers,
+            pool=compute.pool,
+            queue=compute.queue,
+        )
     return compute_cls(compute.uri)
 
 
@@ -181,6 +188,11 @@ def build_datalayer(cfg=None, databackend=None, **kwargs) -> Datalayer:
     # Keep the real configuration in the datalayer object.
     datalayer.cfg = cfg
 
+    if cfg.cluster.cdc.local and cfg.cluster.cdc.uri is None:
+        from superduper.backends.local.cdc import LocalCDC
+
+        LocalCDC(datalayer).start()
+
     show_configuration(cfg)
     return datalayer
 
@@ -111,12 +111,18 @@ class CDCConfig(BaseConfig):
 
     :param uri: The URI for the CDC service
     :param strategy: The strategy to use for CDC
+    :param local: Run CDC in a thread of the process of the datalayer when
+                  ``uri`` is not set; see ``LocalCDC``
+    :param batch_size: The largest number of changed ids sent to listeners
+                       in one event by local CDC
     """
 
     uri: t.Optional[str] = None  # None implies local mode
     strategy: t.Union[PollingStrategy, LogBasedStrategy] = dc.field(
         default_factory=PollingStrategy
     )
+    local: bool = False
+    batch_size: int = 10000
 
 
 @dc.dataclass
@@ -126,11 +132,22 @@ class VectorSearch(BaseConfig):
     :param uri: The URI for the vector search service
     :param type: The type of vector search service
     :param backfill_batch_size: The size of the backfill batch
+    :param searcher_kwargs: Keyword arguments to pass to the vector searcher
+    :param snapshot_home: Directory for snapshots of in-memory vector indices;
+                          if set, only outputs predicted since the snapshot
+                          are loaded on startup
+    :param binary_vectors: Send vectors to the service as raw ``float32``
+                           buffers instead of JSON; the service must decode
+                           them with ``decode_vectors``
     """
 
     uri: t.Optional[str] = None  # None implies local mode
-    type: str = 'in_memory'  # in_memory|lance
+    # in_memory|in_memory_ivf|in_memory_pq|in_memory_sharded|lance
+    type: str = 'in_memory'
     backfill_batch_size: int = 100
+    searcher_kwargs: t.Dict = dc.field(default_factory=dict)
+    snapshot_home: t.Optional[str] = None
+    binary_vectors: bool = False
 
 
 @dc.dataclass
@@ -166,17 +183,46 @@ class SchedulerConfig(BaseConfig):
     uri: t.Optional[str] = None  # None implies local mode
 
 
+@dc.dataclass
+class EventQueue(BaseConfig):
+    """Describes how the local compute backend queues the events of writes.
+
+    :param asynchronous: Return from writes at once, and run the jobs of their
+                         events in a background thread; the connections of the
+                         data backend must be thread-safe (e.g. MongoDB)
+    :param window: Seconds an event waits to be merged with later events
+    :param max_batch_size: Number of queued events of a component which start
+                           its jobs before the end of the window
+    :param max_pending: Number of queued events above which writes block
+    """
+
+    asynchronous: bool = False
+    window: float = 0.1
+    max_batch_size: int = 1000
+    max_pending: int = 100000
+
+
 @dc.dataclass
 class Compute(BaseConfig):
     """Describes the configuration for distributed computing.
 
     :param uri: The URI for the compute service.
     :param compute_kwargs: The keyword arguments to pass to the compute service.
+    :param num_workers: Number of jobs run in parallel in local mode;
+                        0 runs jobs one after another, when submitted
+    :param pool: Workers of jobs in local mode: ``'thread'`` or ``'process'``
+    :param queue: Queue of the events of writes in local mode
+    :param max_cached_components: Number of components a worker process keeps
+                                  loaded across jobs
     :param _path: Compute backend path.
     """
 
     uri: t.Optional[str] = None  # None implies local mode
     compute_kwargs: t.Dict = dc.field(default_factory=dict)
+    num_workers: int = 0
+    pool: str = 'thread'
+    queue: EventQueue = dc.field(default_factory=EventQueue)
+    max_cached_components: int = 8
     _path: t.Optional[str] = 'superduper.backends.local.compute.LocalComputeBackend'
 
 
@@ -255,6 +301,46 @@ class Downloads(BaseConfig):
     timeout: t.Optional[int] = None
 
 
+@dc.dataclass
+class API(BaseConfig):
+    """Describes how API models send their requests.
+
+    :param max_concurrency: The maximum number of requests in flight
+                            across all API models
+    :param pool_size: The number of keep-alive connections kept per host
+    :param max_retries: The number of retries of a rate-limited request
+    :param backoff: The wait in seconds before the first retry,
+                    doubled on each further retry
+    :param max_backoff: The maximum wait in seconds between retries
+    """
+
+    max_concurrency: int = 16
+    pool_size: int = 16
+    max_retries: int = 5
+    backoff: float = 0.5
+    max_backoff: float = 30.0
+
+
+@dc.dataclass
+class JobUpdates(BaseConfig):
+    """Describes how updates of job records are written to the metadata store.
+
+    Updates are buffered and merged per job, and written in one batch when
+    the oldest waited ``interval`` seconds or ``max_pending`` jobs have
+    updates, when a job ends, before job records are read, or when the
+    process exits.
+
+    :param interval: The longest time in seconds an update is buffered, and
+                     the identifiers of the jobs of a component are cached;
+                     0 writes each update at once
+    :param max_pending: The number of jobs with buffered updates which
+                        triggers a write
+    """
+
+    interval: float = 1.0
+    max_pending: int = 100
+
+
 @dc.dataclass
 class Config(BaseConfig):
     """The data class containing all configurable superduper values.
@@ -263,11 +349,16 @@ class Config(BaseConfig):
     :param data_backend: The URI for the data backend
     :param lance_home: The home directory for the Lance vector indices,
                        Default: .superduper/vector_indices
+    :param predict_cache_home: The home directory of models' ``disk``
+                               prediction caches,
+                               Default: .superduper/predict_cache
     :param artifact_store: The URI for the artifact store
     :param metadata_store: The URI for the metadata store
     :param cluster: Settings distributed computing and change data capture
     :param retries: Settings for retrying failed operations
     :param downloads: Settings for downloading files
+    :param api: Settings for the requests of API models
+    :param job_updates: Settings for writing updates of job records
     :param fold_probability: The probability of validation fold
     :param log_level: The severity level of the logs
     :param logging_type: The type of logging to use
@@ -280,6 +371,7 @@ class Config(BaseConfig):
 
     data_backend: str = 'mongodb://mongodb:27017/test_db'
     lance_home: str = os.path.join('.superduper', 'vector_indices')
+    predict_cache_home: str = os.path.join('.superduper', 'predict_cache')
 
     artifact_store: t.Optional[str] = None
     metadata_store: t.Optional[str] = None
@@ -287,6 +379,8 @@ class Config(BaseConfig):
     cluster: Cluster = dc.field(default_factory=Cluster)
     retries: Retry = dc.field(default_factory=Retry)
     downloads: Downloads = dc.field(default_factory=Downloads)
+    api: API = dc.field(default_factory=API)
+    job_updates: JobUpdates = dc.field(default_factory=JobUpdates)
 
     fold_probability: float = 0.05
 
@@ -310,7 +404,7 @@ class Config(BaseConfig):
     def comparables(self):
         """A dict of `self` excluding some defined attributes."""
         _dict = dc.asdict(self)
-        list(map(_dict.pop, ('cluster', 'retries', 'downloads')))
+        list(map(_dict.pop, ('cluster', 'retries', 'downloads', 'api', 'job_updates')))
         return _dict
 
     def match(self, cfg: t.Dict):
@@ -1,8 +1,12 @@
 import dataclasses as dc
+import hashlib
+import json
+import os
 import random
 import typing as t
 import warnings
 from collections import namedtuple
+from datetime import datetime
 
 import click
 import networkx
@@ -16,12 +20,13 @@ from superduper.backends.base.compute import ComputeBackend
 from superduper.backends.base.data_backend import BaseDataBackend
 from superduper.backends.base.metadata import MetaDataStore
 from superduper.backends.base.query import Query
+from superduper.backends.local.cdc import LocalCDC
 from superduper.backends.local.compute import LocalComputeBackend
 from superduper.base import exceptions
 from superduper.base.config import Config
 from superduper.base.constant import KEY_BUILDS
 from superduper.base.cursor import SuperDuperCursor
-from superduper.base.document import Document
+from superduper.base.document import _OUTPUTS_KEY, Document
 from superduper.components.component import Component
 from superduper.components.datatype import DataType, _BaseEncodable
 from superduper.components.schema import Schema
@@ -46,6 +51,13 @@ PredictResult = t.Union[Document, t.Sequence[Document]]
 ExecuteResult = t.Union[SelectResult, DeleteResult, UpdateResult, InsertResult]
 
 
+def _as_datetime(value) -> datetime:
+    # Metadata stores without a datetime type return the time of jobs as text
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value))
+
+
 @dc.dataclass
 class Event:
     """Event to represent database events."""
@@ -127,6 +139,8 @@ class Datalayer:
         self.compute.queue.db = self
         self._server_mode = False
         self._cfg = s.CFG
+        self._components_by_uuid: t.Dict[str, Component] = {}
+        self.cdc: t.Optional[LocalCDC] = None
 
     def __getitem__(self, item):
         return self.databackend.get_query_builder(item)
@@ -200,9 +214,26 @@ class Datalayer:
 
         id_field = query.table_or_collection.primary_id
 
+        snapshot_path = self._vector_snapshot_path(vi)
+        changed = True
+        if snapshot_path is not None:
+            # Taken before the outputs are read, so outputs written meanwhile
+            # are read again from the next snapshot
+            watermark = self._vector_snapshot_watermark(vi)
+            restored = searcher.load_snapshot(snapshot_path)
+            if restored is not None:
+                query, changed = self._vector_snapshot_delta(
+                    vi,
+                    searcher,
+                    query,
+                    restored=restored,
+                    watermark=searcher.snapshot_watermark(snapshot_path),
+                    current=watermark,
+                )
+
         progress = tqdm.tqdm(desc='Loading vectors into vector-table...')
         for record_batch in ibatch(
-            self.execute(query),
+            self.execute(query) if changed else [],
             s.CFG.cluster.vector_search.backfill_batch_size,
         ):
             items = []
@@ -218,6 +249,89 @@ class Datalayer:
 
         searcher.post_create()
 
+        if snapshot_path is not None and changed:
+            searcher.save_snapshot(snapshot_path, watermark=watermark)
+
+    def _vector_snapshot_delta(
+        self, vi, searcher, query, restored, watermark, current
+    ) -> t.Tuple[Query, bool]:
+        # Returns the query of the outputs which changed since the snapshot
+        # was saved, and whether there are any. The outputs are not
+        # timestamped, so the changed ids are those of the prediction jobs
+        # started since the snapshot.
+        if watermark.get('model') != current['model']:
+            logging.info(
+                f'Model of {vi.identifier} changed since the snapshot; '
+                'loading all vectors'
+            )
+            searcher.delete(restored)
+            return query, True
+
+        ids = self._predicted_ids_since(vi, watermark.get('created_at'))
+        if ids is None:
+            logging.info(
+                f'Outputs of {vi.identifier} were predicted again without ids '
+                'since the snapshot; loading all vectors'
+            )
+            searcher.delete(restored)
+            return query, True
+
+        logging.info(
+            f'{len(ids)} outputs of {vi.identifier} were predicted or deleted '
+            'since the snapshot'
+        )
+        # Re-predicted outputs are loaded again, outputs of deleted rows are gone
+        searcher.delete(list(ids))
+        return query.select_using_ids(list(ids)), bool(ids)
+
+    def _predicted_ids_since(self, vi, created_at) -> t.Optional[t.Set[str]]:
+        # Returns ``None`` if unknown ids may have been predicted
+        if created_at is None:
+            return None
+        since = datetime.fromisoformat(created_at)
+        listener = vi.indexing_listener
+        ids: t.Set[str] = set()
+        for job in self.metadata.show_jobs(listener.model.identifier, 'model'):
+            kwargs = job.get('kwargs') or {}
+            if (
+                job.get('method_name') != 'predict_in_db'
+                or kwargs.get('predict_id') != listener.predict_id
+                or _as_datetime(job['time']) < since
+            ):
+                continue
+            if kwargs.get('ids') is None:
+                return None
+            ids.update(str(_id) for _id in kwargs['ids'])
+        return ids
+
+    def _vector_snapshot_watermark(self, vi) -> t.Dict:
+        listener = vi.indexing_listener
+        created_at = datetime.now()
+        for job in self.metadata.show_jobs(listener.model.identifier, 'model'):
+            # Jobs which are still running may write outputs after the snapshot
+            if (job.get('kwargs') or {}).get(
+                'predict_id'
+            ) == listener.predict_id and job.get('status') in ('pending', 'running'):
+                created_at = min(created_at, _as_datetime(job['time']))
+        # Refitting or replacing the model changes its metadata, after which all
+        # of the outputs may change
+        info = self.metadata.get_component_by_uuid(listener.model.uuid)
+        record = json.dumps(info, sort_keys=True, default=str)
+        return {
+            'created_at': created_at.isoformat(),
+            'model': hashlib.sha1(record.encode()).hexdigest(),
+        }
+
+    def _vector_snapshot_path(self, vi) -> t.Optional[str]:
+        snapshot_home = s.CFG.cluster.vector_search.snapshot_home
+        if snapshot_home is None:
+            return None
+        # The predict_id changes with the indexing listener, so snapshots of
+        # outputs from a previous version of the listener are never loaded.
+        return os.path.join(
+            snapshot_home, vi.identifier, vi.indexing_listener.predict_id
+        )
+
     # TODO - needed?
     def set_compute(self, new: ComputeBackend):
         """
@@ -239,9 +353,12 @@ class Datalayer:
 
         logging.info(f"Connecting to compute engine: {new.name}")
         self.compute = new
+        self.compute.queue.db = self
 
     def disconnect(self):
         """Disconnect from the compute engine."""
+        if self.cdc is not None:
+            self.cdc.stop()
         self.compute.disconnect()
 
     def get_compute(self):
@@ -358,7 +475,7 @@ class Datalayer:
         :param delete: The delete query object specifying the data to be deleted.
         """
         result = delete.do_execute(self)
-        cdc_status = s.CFG.cluster.cdc.uri is not None
+        cdc_status = self._cdc_active(delete, Event.delete)
         if refresh and not cdc_status:
             return result, self.on_event(delete, ids=result, event_type=Event.delete)
         return result, None
@@ -393,7 +510,7 @@ class Datalayer:
 
         inserted_ids = insert.do_execute(self)
 
-        cdc_status = s.CFG.cluster.cdc.uri is not None
+        cdc_status = self._cdc_active(insert, Event.insert)
 
         if refresh:
             if cdc_status:
@@ -414,6 +531,16 @@ class Datalayer:
         """
         return select.do_execute(db=self)
 
+    def _cdc_active(self, query: Query, event_type: str) -> bool:
+        # Local CDC watches the tables of inputs for the events its strategy
+        # captures; other events and writes of outputs trigger the listeners
+        # at once
+        if s.CFG.cluster.cdc.uri is not None:
+            return True
+        if self.cdc is None or not self.cdc.captures(event_type):
+            return False
+        return not (query.is_output_query or query.table.startswith(_OUTPUTS_KEY))
+
     def on_event(self, query: Query, ids: t.Sequence[str], event_type: str = 'insert'):
         """
         Trigger computation jobs after data insertion.
@@ -437,24 +564,22 @@ class Datalayer:
         """
         write_result, updated_ids, deleted_ids = write.do_execute(self)
 
-        cdc_status = s.CFG.cluster.cdc.uri is not None
         if refresh:
-            if cdc_status:
-                logging.warn('CDC service is active, skipping model/listener refresh')
-            else:
-                jobs = []
-                if updated_ids:
-                    job = self.on_event(
-                        query=write, ids=updated_ids, event_type=Event.update
-                    )
-                    jobs.append(job)
-                if deleted_ids:
-                    job = self.on_event(
-                        query=write, ids=deleted_ids, event_type=Event.delete
+            jobs = []
+            for event_type, ids in (
+                (Event.update, updated_ids),
+                (Event.delete, deleted_ids),
+            ):
+                if not ids:
+                    continue
+                if self._cdc_active(write, event_type):
+                    logging.warn(
+                        'CDC service is active, skipping model/listener refresh'
                     )
+                else:
+                    job = self.on_event(query=write, ids=ids, event_type=event_type)
                     jobs.append(job)
-
-                return updated_ids, deleted_ids, jobs
+            return updated_ids, deleted_ids, jobs
         return updated_ids, deleted_ids, None
 
     def _update(self, update: Query, refresh: bool = True) -> UpdateResult:
@@ -469,7 +594,7 @@ class Datalayer:
         """
         updated_ids = update.do_execute(self)
 
-        cdc_status = s.CFG.cluster.cdc.uri is not None
+        cdc_status = self._cdc_active(update, Event.upsert)
         if refresh and updated_ids:
             if cdc_status:
                 logging.warn('CDC service is active, skipping model/listener refresh')
@@ -511,7 +636,10 @@ class Datalayer:
         """
         if not isinstance(object, Component):
             raise ValueError('Only components can be applied')
-        return self._apply(object=object, dependencies=dependencies), object
+        jobs = self._apply(object=object, dependencies=dependencies)
+        if self.cdc is not None:
+            self.cdc.watch()
+        return jobs, object
 
     def remove(
         self,
@@ -572,6 +700,7 @@ class Datalayer:
 
             for v in sorted(versions_in_use):
                 self.metadata.hide_component_version(type_id, identifier, v)
+            self._components_by_uuid.clear()
         else:
             logging.warn('aborting.')
 
@@ -582,6 +711,7 @@ class Datalayer:
         version: t.Optional[int] = None,
         allow_hidden: bool = False,
         uuid: t.Optional[str] = None,
+        cached: bool = False,
     ) -> Component:
         """
         Load a component using uniquely identifying information.
@@ -597,6 +727,9 @@ class Datalayer:
         :param allow_hidden: Toggle to ``True`` to allow loading
                              of deprecated components.
         :param uuid: [Optional] UUID of the component to load.
+        :param cached: Toggle to ``True`` to reuse the component loaded
+                       earlier with the same ``uuid``; the cache is cleared
+                       when components are replaced or removed.
         """
         if type_id == 'encoder':
             logging.warn(
@@ -618,6 +751,8 @@ class Datalayer:
                 allow_hidden=allow_hidden,
             )
         else:
+            if cached and uuid in self._components_by_uuid:
+                return self._components_by_uuid[uuid]
             info = self.metadata.get_component_by_uuid(
                 uuid=uuid,
                 allow_hidden=allow_hidden,
@@ -634,6 +769,8 @@ class Datalayer:
                 getattr(self, cm)[m.identifier] = m
             except KeyError:
                 raise exceptions.ComponentException('%s not found in %s cache'.format())
+        if uuid is not None:
+            self._components_by_uuid[uuid] = m
         return m
 
     def _add_child_components(self, components, parent):
@@ -802,6 +939,7 @@ class Datalayer:
 
             self.artifact_store.delete_artifact(info)
             self.metadata.delete_component_version(type_id, identifier, version=version)
+            self._components_by_uuid.clear()
 
     def _get_content_for_filter(self, filter) -> Document:
         if isinstance(filter, dict):
@@ -828,6 +966,7 @@ class Datalayer:
                        the object doesn't exist yet.
         """
         old_uuid = None
+        self._components_by_uuid.clear()
         try:
             info = self.metadata.get_component(
                 object.type_id, object.identifier, version=object.version
@@ -890,20 +1029,51 @@ class Datalayer:
         :param outputs: (Optional) Seed outputs dictionary.
         :param n: Get top k results from vector search.
         """
+        like = self._get_like_document(like)
+        vi = self.vector_indices[vector_index]
+        outs = self._get_seed_outputs(outputs)
+        logging.info(str(outs))
+        return vi.get_nearest(like, db=self, ids=ids, n=n, outputs=outs)
+
+    def select_nearest_batch(
+        self,
+        likes: t.Sequence[t.Union[t.Dict, Document]],
+        vector_index: str,
+        ids: t.Optional[t.Sequence[str]] = None,
+        outputs: t.Optional[Document] = None,
+        n: int = 100,
+    ) -> t.List[t.Tuple[t.List[str], t.List[float]]]:
+        """
+        Performs vector search queries of several documents together.
+
+        Returns the result IDs and scores of each document, in order.
+
+        :param likes: Vector search documents to search.
+        :param vector_index: Vector index to search.
+        :param ids: (Optional) IDs to search within.
+        :param outputs: (Optional) Seed outputs dictionary.
+        :param n: Get top k results from vector search, per document.
+        """
+        likes = [self._get_like_document(like) for like in likes]
+        vi = self.vector_indices[vector_index]
+        outs = self._get_seed_outputs(outputs)
+        return vi.get_nearest_batch(likes, db=self, ids=ids, n=n, outputs=outs)
+
+    def _get_like_document(self, like: t.Union[t.Dict, Document]) -> Document:
         # TODO - make this un-ambiguous
         if not isinstance(like, Document):
             assert isinstance(like, dict)
             like = Document(like)
-        like = self._get_content_for_filter(like)
-        vi = self.vector_indices[vector_index]
+        return self._get_content_for_filter(like)
+
+    @staticmethod
+    def _get_seed_outputs(outputs: t.Optional[Document]) -> t.Dict:
         if outputs is None:
-            outs: t.Dict = {}
-        else:
-            outs = outputs.encode()
-            if not isinstance(outs, dict):
-                raise TypeError(f'Expected dict, got {type(outputs)}')
-        logging.info(str(outs))
-        return vi.get_nearest(like, db=self, ids=ids, n=n, outputs=outs)
+            return {}
+        outs = outputs.encode()
+        if not isinstance(outs, dict):
+            raise TypeError(f'Expected dict, got {type(outputs)}')
+        return outs
 
     def close(self):
         """Gracefully shutdown the Datalayer."""
@@ -0,0 +1,63 @@
+import typing as t
+
+from superduper import superduper
+
+from . import command
+
+
+@command(help='Show the jobs of a `superduper` deployment and their progress')
+def jobs(component: t.Optional[str] = None, type_id: t.Optional[str] = None):
+    """Show the jobs, with the completion percentage of checkpointed jobs.
+
+    :param component: Only show the jobs of this component.
+    :param type_id: Only show the jobs of components of this type.
+    """
+    db = superduper()
+    try:
+        for r in db.metadata.show_jobs(component_identifier=component, type_id=type_id):
+            print(_format_job(r))
+    finally:
+        db.disconnect()
+
+
+@command(help='Run a job again, continuing from its last checkpoint')
+def resume(job_id: str):
+    """Run a job again, e.g. after it failed or its worker died.
+
+    Jobs which checkpoint their progress, such as ``predict_in_db``,
+    continue after the last checkpoint.
+
+    :param job_id: Identifier of the job.
+    """
+    from superduper.jobs.job import ComponentJob
+
+    db = superduper()
+    try:
+        r = db.metadata.get_job(job_id)
+        if r is None:
+            raise ValueError(f'Job {job_id} not found')
+        if not r.get('method_name'):
+            raise ValueError(f'Job {job_id} is not a component job')
+        job = ComponentJob(
+            component_identifier=r['component_identifier'],
+            type_id=r['type_id'],
+            method_name=r['method_name'],
+            args=r.get('args'),
+            kwargs=r.get('kwargs'),
+            identifier=r['identifier'],
+            db=db,
+        )
+        job.submit()
+    finally:
+        db.disconnect()
+
+
+def _format_job(r: t.Dict) -> str:
+    name = r.get('method_name') or r.get('_path', '').split(';')[-1]
+    if r.get('component_identifier'):
+        name = f'{r["component_identifier"]}.{name}'
+    line = f'{r["identifier"]}  {r.get("status", "")}  {name}'
+    progress = (r.get('info') or {}).get('progress')
+    if progress:
+        line += f'  {progress["percent"]:.1f}% ({progress["done"]}/{progress["total"]})'
+    return line
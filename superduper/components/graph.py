@@ -1,3 +1,4 @@
+import concurrent.futures
 import dataclasses as dc
 import typing as t
 
@@ -234,6 +235,12 @@ class Graph(Model):
     :param input: Graph root node.
     :param outputs: Graph output nodes.
     :param signature: Graph signature.
+    :param batch_size: Number of data points streamed through the graph
+                       at once by ``predict_batches``.
+
+    With ``num_workers`` set, ``predict_batches`` runs nodes whose inputs
+    are ready concurrently on that many threads, with up to ``num_workers``
+    batches in flight.
 
     Example:
     -------
@@ -255,6 +262,7 @@ class Graph(Model):
     input: Model
     outputs: t.List[t.Union[str, Model]] = dc.field(default_factory=list)
     signature: Signature = '*args,**kwargs'
+    batch_size: int = 1000
 
     def __post_init__(self, db, artifacts):
         self.G = nx.DiGraph()
@@ -451,29 +459,86 @@ class Graph(Model):
             kwargs = {}
         return args, kwargs
 
-    def _predict_on_node(self, *args, node=None, cache={}, one=True, **kwargs):
+    def _predict_on_node(self, *args, node=None, cache=None, **kwargs):
+        if cache is None:
+            cache = {}
         if node not in cache:
             predecessors = list(self.G.predecessors(node))
             outputs = [
-                self._predict_on_node(*args, **kwargs, one=one, node=p, cache=cache)
+                self._predict_on_node(*args, **kwargs, node=p, cache=cache)
                 for p in predecessors
             ]
-
             edges = [self.G.get_edge_data(p, node) for p in predecessors]
-
-            if one is True:
-                args, kwargs = self._fetch_input(
-                    args, kwargs, edges=edges, outputs=outputs
-                )
-                cache[node] = self.nodes[node].predict(*args, **kwargs)
-            else:
-                dataset = self._fetch_inputs(
-                    args[0], edges=edges, outputs=outputs, node=node
-                )
-                cache[node] = self.nodes[node].predict_batches(dataset=dataset)
-            return cache[node]
+            args, kwargs = self._fetch_input(args, kwargs, edges=edges, outputs=outputs)
+            cache[node] = self.nodes[node].predict(*args, **kwargs)
         return cache[node]
 
+    def _predict_node_batch(self, node, batch, outputs):
+        predecessors = list(self.G.predecessors(node))
+        dataset = self._fetch_inputs(
+            batch,
+            edges=[self.G.get_edge_data(p, node) for p in predecessors],
+            outputs=[outputs[p] for p in predecessors],
+            node=node,
+        )
+        return self.nodes[node].predict_batches(dataset=dataset)
+
+    def _stream_batches(self, dataset, nodes):
+        # Yield the outputs of ``nodes`` on consecutive batches of ``dataset``;
+        # the outputs of the other nodes are dropped after each batch
+        for start in range(0, len(dataset), self.batch_size):
+            end = min(start + self.batch_size, len(dataset))
+            batch = [dataset[i] for i in range(start, end)]
+            outputs: t.Dict[str, t.List] = {}
+            for node in nodes:
+                outputs[node] = self._predict_node_batch(node, batch, outputs)
+            yield outputs
+
+    def _stream_batches_concurrently(self, dataset, nodes):
+        # As ``_stream_batches``, running each node as soon as the outputs of
+        # its predecessors on the same batch are ready. Batches are read in
+        # the calling thread, since lazy datasets may hold connections which
+        # can't be shared across threads.
+        starts = list(range(0, len(dataset), self.batch_size))
+        batches: t.Dict[int, t.List] = {}
+        outputs: t.Dict[int, t.Dict[str, t.List]] = {}
+        submitted: t.Dict[int, t.Set[str]] = {}
+        pending: t.Dict[concurrent.futures.Future, t.Tuple[int, str]] = {}
+        next_batch = 0
+
+        def submit_ready(executor):
+            for live, ready in outputs.items():
+                for node in nodes:
+                    if node in submitted[live] or any(
+                        p not in ready for p in self.G.predecessors(node)
+                    ):
+                        continue
+                    future = executor.submit(
+                        self._predict_node_batch, node, batches[live], ready
+                    )
+                    pending[future] = (live, node)
+                    submitted[live].add(node)
+
+        with concurrent.futures.ThreadPoolExecutor(self.num_workers) as executor:
+            for b in range(len(starts)):
+                while next_batch < len(starts) and next_batch - b < self.num_workers:
+                    start = starts[next_batch]
+                    end = min(start + self.batch_size, len(dataset))
+                    batches[next_batch] = [dataset[i] for i in range(start, end)]
+                    outputs[next_batch] = {}
+                    submitted[next_batch] = set()
+                    next_batch += 1
+                while len(outputs[b]) < len(nodes):
+                    submit_ready(executor)
+                    done, _ = concurrent.futures.wait(
+                        pending, return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+                    for future in done:
+                        live, node = pending.pop(future)
+                        outputs[live][node] = future.result()
+                del batches[b], submitted[b]
+                yield outputs.pop(b)
+
     @ensure_initialized
     def predict(self, *args, **kwargs):
         """Predict on single data point.
@@ -536,19 +601,32 @@ class Graph(Model):
         else:
             self.validate(self.output_identifiers)
 
-        if isinstance(dataset, QueryDataset):
-            raise TypeError('QueryDataset is not supported in graph mode')
-        cache: t.Dict[str, t.Any] = {}
+        output_identifiers = (
+            self.output_identifiers
+            if isinstance(self.output_identifiers, list)
+            else [self.output_identifiers]
+        )
+        # Only the ancestors of the outputs are predicted, in an order in
+        # which each node follows its predecessors
+        needed = set(output_identifiers)
+        for node in output_identifiers:
+            needed |= nx.ancestors(self.G, node)
+        nodes = [n for n in nx.topological_sort(self.G) if n in needed]
+
+        stream = (
+            self._stream_batches_concurrently(dataset, nodes)
+            if self.num_workers
+            else self._stream_batches(dataset, nodes)
+        )
+        columns: t.Dict[str, t.List] = {node: [] for node in output_identifiers}
+        for batch_outputs in stream:
+            for node in output_identifiers:
+                columns[node].extend(batch_outputs[node])
 
         if isinstance(self.output_identifiers, list):
-            outputs = [
-                self._predict_on_node(dataset, node=output, cache=cache, one=False)
-                for output in self.output_identifiers
-            ]
+            outputs = [columns[node] for node in output_identifiers]
         else:
-            outputs = self._predict_on_node(
-                dataset, node=self.output_identifiers, cache=cache, one=False
-            )
+            outputs = columns[self.output_identifiers]
         # TODO: check if output schema and datatype required
         return outputs
 
@@ -213,18 +213,19 @@ class Listener(Component):
             return []
         assert not isinstance(self.model, str)
 
+        # Upstream listeners and the ids of their jobs are cached, since this
+        # runs for every batch of events
         dependencies_ids = []
         for predict_id in self.dependencies:
             try:
-                upstream_listener = db.load(uuid=predict_id)
+                upstream_listener = db.load(uuid=predict_id, cached=True)
                 upstream_model = upstream_listener.model
             except Exception:
                 logging.warn(
                     f"Could not find the upstream listener with uuid {predict_id}"
                 )
                 continue
-            jobs = self.db.metadata.show_jobs(upstream_model.identifier, 'model') or []
-            job_ids = [job['job_id'] for job in jobs]
+            job_ids = db.metadata.show_job_ids(upstream_model.identifier, 'model')
             dependencies_ids.extend(job_ids)
 
         dependencies = {*dependencies_ids, *dependencies}
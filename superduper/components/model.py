@@ -1,16 +1,20 @@
 from __future__ import annotations
 
+import collections
 import concurrent.futures
 import dataclasses as dc
 import inspect
 import multiprocessing
 import os
 import re
+import threading
+import time
 import typing as t
+import uuid
+import weakref
 from abc import abstractmethod
 from functools import wraps
 
-import requests
 import tqdm
 
 from superduper import logging
@@ -25,7 +29,12 @@ from superduper.components.component import Component, ensure_initialized
 from superduper.components.datatype import DataType, dill_lazy
 from superduper.components.metric import Metric
 from superduper.components.schema import Schema
+from superduper.ext.utils import estimate_tokens, pack_batches
 from superduper.jobs.job import ComponentJob, Job
+from superduper.jobs.progress import JobProgress
+from superduper.misc.api_transport import get_rate_limit, get_transport, too_large
+from superduper.misc.batching import MicroBatcher
+from superduper.misc.predict_cache import MISSING, get_predict_cache, hash_input
 
 if t.TYPE_CHECKING:
     from superduper.base.datalayer import Datalayer
@@ -330,6 +339,10 @@ class _Fittable:
             logging.info(f'Adding model {self.identifier} to db')
             assert isinstance(self, Component)
             db.add(self)
+        if isinstance(self, Model):
+            # Workers and cached outputs are from before training
+            self.shutdown_workers()
+            self.clear_predict_cache()
         return self.trainer.fit(
             self,
             train_dataset=train_dataset,
@@ -468,6 +481,67 @@ class ModelMeta(LeafMeta):
         return cls
 
 
+_worker_model: t.Optional['Model'] = None
+_micro_batcher_lock = threading.Lock()
+
+
+def _init_worker(model: 'Model'):
+    global _worker_model
+    _worker_model = model
+
+
+def _predict_in_worker(data):
+    assert _worker_model is not None
+    return _worker_model._wrapper(data)
+
+
+def _no_worker_pool():
+    return None
+
+
+def _shutdown_pool(pool):
+    pool.close()
+    pool.join()
+
+
+class _WorkerPool:
+    """Long-lived pool of processes, each holding its own copy of a model.
+
+    The model is sent to each worker once, when the worker starts, and
+    data points are sent to the workers in chunks.
+
+    :param model: Model to predict with
+    :param processes: Number of worker processes
+    """
+
+    # Number of chunks sent to each worker per call of ``map``
+    _CHUNKS_PER_WORKER = 4
+
+    def __init__(self, model: 'Model', processes: int):
+        self.processes = processes
+        self._pool = multiprocessing.Pool(
+            processes=processes, initializer=_init_worker, initargs=(model,)
+        )
+        self._finalizer = weakref.finalize(self, _shutdown_pool, self._pool)
+
+    def map(self, dataset) -> t.List:
+        """Predict on each data point of ``dataset`` in the workers.
+
+        :param dataset: Series of data points to predict on
+        """
+        chunksize = max(1, len(dataset) // (self._CHUNKS_PER_WORKER * self.processes))
+        return self._pool.map(_predict_in_worker, dataset, chunksize=chunksize)
+
+    def close(self):
+        """Stop the worker processes."""
+        self._finalizer()
+
+    def __reduce__(self):
+        # Copies of the model, e.g. those sent to the workers, don't share
+        # the pool
+        return _no_worker_pool, ()
+
+
 class Model(Component, metaclass=ModelMeta):
     """Base class for components which can predict.
 
@@ -483,6 +557,18 @@ class Model(Component, metaclass=ModelMeta):
     :param validation: The validation ``Dataset`` instances to use.
     :param metric_values: The metrics to evaluate on.
     :param num_workers: Number of workers to use for parallel prediction.
+    :param predict_cache: Cache outputs in the database by a hash of the inputs
+                          and skip ``predict`` on cached inputs; outputs are
+                          kept in ``memory``, on ``disk`` or in the
+                          ``artifact_store``, or not cached if unset.
+    :param deduplicate: Predict once on identical inputs in a chunk of
+                        ``predict_in_db`` and copy the output to each of
+                        them; always done with ``predict_cache``.
+    :param micro_batch_size: Largest batch of concurrent ``predict_online``
+                             calls run by one ``predict_batches`` call
+                             (0 predicts each call on its own)
+    :param micro_batch_latency: Longest time in seconds a ``predict_online``
+                                call waits for others to batch with
     """
 
     type_id: t.ClassVar[str] = 'model'
@@ -496,6 +582,10 @@ class Model(Component, metaclass=ModelMeta):
     validation: t.Optional[Validation] = None
     metric_values: t.Dict = dc.field(default_factory=dict)
     num_workers: int = 0
+    predict_cache: t.Optional[str] = None
+    deduplicate: bool = False
+    micro_batch_size: int = 0
+    micro_batch_latency: float = 0.005
 
     def __post_init__(self, db, artifacts):
         super().__post_init__(db, artifacts)
@@ -535,16 +625,137 @@ class Model(Component, metaclass=ModelMeta):
         """
         outputs = []
         if self.num_workers:
-            pool = multiprocessing.Pool(processes=self.num_workers)
-            for r in pool.map(self._wrapper, dataset):  # type: ignore[arg-type]
-                outputs.append(r)
-            pool.close()
-            pool.join()
+            outputs = self._get_worker_pool().map(dataset)
         else:
             for i in range(len(dataset)):
                 outputs.append(self._wrapper(dataset[i]))
         return outputs
 
+    def predict_online(self, *args, **kwargs):
+        """Predict on a single data point at query time.
+
+        With ``micro_batch_size`` set, calls from concurrent threads are
+        collected for up to ``micro_batch_latency`` seconds and predicted
+        together with ``predict_batches``.
+
+        :param args: Positional arguments to predict on.
+        :param kwargs: Keyword arguments to predict on.
+        """
+        if not self.micro_batch_size:
+            return self.predict(*args, **kwargs)
+        return self._get_micro_batcher().submit(self._pack_input(args, kwargs))
+
+    def _pack_input(self, args, kwargs):
+        # Inverse of ``handle_input_type``
+        if self.signature == 'singleton':
+            return args[0] if args else next(iter(kwargs.values()))
+        elif self.signature == '*args':
+            return args
+        elif self.signature == '**kwargs':
+            return kwargs
+        return args, kwargs
+
+    def _get_micro_batcher(self) -> MicroBatcher:
+        with _micro_batcher_lock:
+            batcher = getattr(self, '_micro_batcher', None)
+            if batcher is None:
+                batcher = self._micro_batcher = MicroBatcher(
+                    self.predict_batches,
+                    max_batch_size=self.micro_batch_size,
+                    max_latency=self.micro_batch_latency,
+                    name=self.identifier,
+                )
+            return batcher
+
+    @property
+    def micro_batch_stats(self) -> t.Optional[t.Dict]:
+        """Histograms of the batch sizes and queue times of ``predict_online``."""
+        batcher = getattr(self, '_micro_batcher', None)
+        return batcher.stats if batcher is not None else None
+
+    def _get_worker_pool(self) -> _WorkerPool:
+        pool = getattr(self, '_worker_pool', None)
+        if pool is None or pool.processes != self.num_workers:
+            if pool is not None:
+                pool.close()
+            logging.info(f'Starting {self.num_workers} workers of {self.identifier}')
+            pool = self._worker_pool = _WorkerPool(self, self.num_workers)
+        return pool
+
+    def shutdown_workers(self):
+        """Stop the worker processes and the micro-batching thread.
+
+        They are started again when next needed, with the current model.
+        """
+        pool = getattr(self, '_worker_pool', None)
+        if pool is not None:
+            pool.close()
+            self._worker_pool = None
+        batcher = getattr(self, '_micro_batcher', None)
+        if batcher is not None:
+            batcher.close()
+            self._micro_batcher = None
+
+    def _predict_batches_in_db(self, dataset, predict_id: str) -> t.List:
+        if self.predict_cache is None and not self.deduplicate:
+            return self.predict_batches(dataset)
+        inputs = [dataset[i] for i in range(len(dataset))]
+        # Identical inputs are predicted once, and the output is scattered
+        # back to each of them; inputs which can't be hashed are kept apart
+        positions: t.Dict[str, int] = {}
+        unique_inputs: t.List = []
+        unique_hashes: t.List[t.Optional[str]] = []
+        slots = []
+        for x in inputs:
+            input_hash = hash_input(x)
+            if input_hash is None or input_hash not in positions:
+                if input_hash is not None:
+                    positions[input_hash] = len(unique_inputs)
+                slots.append(len(unique_inputs))
+                unique_inputs.append(x)
+                unique_hashes.append(input_hash)
+            else:
+                slots.append(positions[input_hash])
+        if len(unique_inputs) < len(inputs):
+            logging.info(
+                f'Deduplicated {len(inputs)} inputs of {predict_id} to '
+                f'{len(unique_inputs)} ({1 - len(unique_inputs) / len(inputs):.1%} '
+                'fewer predictions)'
+            )
+        outputs = self._predict_batches_cached(unique_inputs, unique_hashes, predict_id)
+        return [outputs[slot] for slot in slots]
+
+    def _predict_batches_cached(
+        self, inputs: t.List, hashes: t.List[t.Optional[str]], predict_id: str
+    ) -> t.List:
+        if self.predict_cache is None:
+            return self.predict_batches(inputs)
+        cache = get_predict_cache(self)
+        keys = [None if h is None else cache.key(h) for h in hashes]
+        outputs = [MISSING if key is None else cache.get(key) for key in keys]
+        missing = [i for i, output in enumerate(outputs) if output is MISSING]
+        if missing:
+            computed = self.predict_batches([inputs[i] for i in missing])
+            for i, output in zip(missing, computed):
+                outputs[i] = output
+                if keys[i] is not None:
+                    cache.put(keys[i], output)
+        cache.record(predict_id, hits=len(inputs) - len(missing), misses=len(missing))
+        return outputs
+
+    def clear_predict_cache(self):
+        """Drop the cached outputs of the current version of the model."""
+        if self.predict_cache is not None:
+            get_predict_cache(self).clear()
+
+    def cleanup(self, db: Datalayer):
+        """Clean up the model.
+
+        :param db: The datalayer to cleanup
+        """
+        self.shutdown_workers()
+        super().cleanup(db)
+
     # TODO handle in job creation
     def _prepare_select_for_predict(self, select, db):
         if isinstance(select, dict):
@@ -563,6 +774,8 @@ class Model(Component, metaclass=ModelMeta):
         dependencies: t.Sequence[Job] = (),
         in_memory: bool = True,
         overwrite: bool = False,
+        pipeline_depth: int = 0,
+        checkpoint: bool = False,
     ):
         """Run a prediction job in the database.
 
@@ -578,11 +791,19 @@ class Model(Component, metaclass=ModelMeta):
         :param dependencies: List of dependencies (jobs)
         :param in_memory: Load data into memory or not
         :param overwrite: Overwrite all documents or only new documents
+        :param pipeline_depth: Number of chunks predicted ahead of the output
+                               writes; see ``predict_in_db``
+        :param checkpoint: Checkpoint the progress of the job, so that running
+                           it again continues after the last written chunk;
+                           worth it for jobs over many ids
         """
+        # A checkpointing job passes its own id, under which it saves its progress
+        job_id = str(uuid.uuid4())
         job = ComponentJob(
             component_identifier=self.identifier,
             method_name='predict_in_db',
             type_id='model',
+            identifier=job_id,
             kwargs={
                 'select': select.encode() if select else None,
                 'predict_id': predict_id,
@@ -590,6 +811,8 @@ class Model(Component, metaclass=ModelMeta):
                 'max_chunk_size': max_chunk_size,
                 'in_memory': in_memory,
                 'overwrite': overwrite,
+                'pipeline_depth': pipeline_depth,
+                'job_id': job_id if checkpoint else None,
                 'X': X,
             },
             compute_kwargs=self.compute_kwargs,
@@ -646,12 +869,23 @@ class Model(Component, metaclass=ModelMeta):
         max_chunk_size: t.Optional[int] = None,
         in_memory: bool = True,
         overwrite: bool = False,
+        pipeline_depth: int = 0,
+        job_id: t.Optional[str] = None,
     ) -> t.Any:
         """Predict on the data points in the database.
 
         Execute a single prediction on a data point
         given by positional and keyword arguments as a job.
 
+        With ``max_chunk_size`` and a positive ``pipeline_depth``, chunks are
+        streamed: while the model predicts on one chunk in a worker thread,
+        the next chunk is read and the outputs of earlier chunks are written.
+        At most ``pipeline_depth`` predicted chunks wait to be written.
+
+        With a ``job_id``, the progress is checkpointed in the job record
+        after each chunk is written (see ``JobProgress``). Running the job
+        again with the same ``job_id`` continues after the last written chunk.
+
         :param X: combination of input keys to be mapped to the model
         :param db: Datalayer instance
         :param predict_id: Identifier for saving outputs.
@@ -660,6 +894,9 @@ class Model(Component, metaclass=ModelMeta):
         :param max_chunk_size: Chunks of data
         :param in_memory: Load data into memory or not
         :param overwrite: Overwrite all documents or only new documents
+        :param pipeline_depth: Number of chunks predicted ahead of the output
+                               writes (0 processes chunks one after another)
+        :param job_id: Identifier of the job checkpointing the progress
         """
         message = (
             f'Requesting prediction in db\n'
@@ -676,15 +913,24 @@ class Model(Component, metaclass=ModelMeta):
         assert isinstance(
             self.version, int
         ), 'Something has gone wrong setting `self.version`'
-        predict_ids = self._get_ids_from_select(
-            X=X,
-            select=select,
-            db=db,
-            ids=ids,
-            overwrite=overwrite,
-            predict_id=predict_id,
-        )
-        return self._predict_with_select_and_ids(
+        progress = JobProgress.resume(db, job_id) if job_id else None
+        if progress is not None:
+            logging.info(
+                f'Resuming job {job_id} after {progress.done}/{progress.total} ids'
+            )
+            predict_ids = list(progress.remaining)
+        else:
+            predict_ids = self._get_ids_from_select(
+                X=X,
+                select=select,
+                db=db,
+                ids=ids,
+                overwrite=overwrite,
+                predict_id=predict_id,
+            )
+            if job_id:
+                progress = JobProgress.start(db, job_id, predict_ids)
+        self._predict_with_select_and_ids(
             X=X,
             predict_id=predict_id,
             select=select,
@@ -692,7 +938,11 @@ class Model(Component, metaclass=ModelMeta):
             db=db,
             max_chunk_size=max_chunk_size,
             in_memory=in_memory,
+            pipeline_depth=pipeline_depth,
+            progress=progress,
         )
+        if progress is not None:
+            progress.finish()
 
     def _prepare_inputs_from_select(
         self,
@@ -758,10 +1008,24 @@ class Model(Component, metaclass=ModelMeta):
         ids: t.List[str],
         in_memory: bool = True,
         max_chunk_size: t.Optional[int] = None,
+        pipeline_depth: int = 0,
+        progress: t.Optional[JobProgress] = None,
     ):
         if not ids:
             return
 
+        if max_chunk_size is not None and pipeline_depth > 0:
+            return self._predict_pipelined(
+                X=X,
+                predict_id=predict_id,
+                db=db,
+                select=select,
+                ids=ids,
+                max_chunk_size=max_chunk_size,
+                pipeline_depth=pipeline_depth,
+                progress=progress,
+            )
+
         if max_chunk_size is not None:
             it = 0
             for i in range(0, len(ids), max_chunk_size):
@@ -774,6 +1038,7 @@ class Model(Component, metaclass=ModelMeta):
                     max_chunk_size=None,
                     in_memory=in_memory,
                     predict_id=predict_id,
+                    progress=progress,
                 )
                 it += 1
             return
@@ -786,7 +1051,88 @@ class Model(Component, metaclass=ModelMeta):
             in_memory=in_memory,
         )
 
-        outputs = self.predict_batches(dataset)
+        outputs = self._predict_batches_in_db(dataset, predict_id)
+        self._write_outputs(
+            outputs=outputs, predict_id=predict_id, db=db, select=select, ids=ids
+        )
+        if progress is not None:
+            progress.advance(len(ids))
+
+    def _predict_pipelined(
+        self,
+        X: t.Any,
+        predict_id: str,
+        db: Datalayer,
+        select: Query,
+        ids: t.List[str],
+        max_chunk_size: int,
+        pipeline_depth: int,
+        progress: t.Optional[JobProgress] = None,
+    ):
+        # Reads and writes stay in the calling thread, since data backend
+        # connections (e.g. SQLite) may not be shared between threads; only
+        # ``predict_batches`` runs in the worker thread.
+        stats = {'read': 0.0, 'predict': 0.0, 'write': 0.0}
+
+        def predict(dataset):
+            start = time.perf_counter()
+            outputs = self._predict_batches_in_db(dataset, predict_id)
+            stats['predict'] += time.perf_counter() - start
+            return outputs
+
+        def write(chunk, future):
+            outputs = future.result()
+            start = time.perf_counter()
+            self._write_outputs(
+                outputs=outputs, predict_id=predict_id, db=db, select=select, ids=chunk
+            )
+            stats['write'] += time.perf_counter() - start
+            # Chunks are written in order, so the ids done are a prefix
+            if progress is not None:
+                progress.advance(len(chunk))
+
+        n_chunks = -(-len(ids) // max_chunk_size)
+        pending: t.Deque = collections.deque()
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            try:
+                for it, i in enumerate(range(0, len(ids), max_chunk_size)):
+                    logging.info(f'Computing chunk {it}/{n_chunks}')
+                    chunk = ids[i : i + max_chunk_size]
+                    read_start = time.perf_counter()
+                    # Chunks are loaded in memory, so that the worker thread
+                    # doesn't query the data backend
+                    dataset, _ = self._prepare_inputs_from_select(
+                        X=X, db=db, select=select, ids=chunk, in_memory=True
+                    )
+                    stats['read'] += time.perf_counter() - read_start
+                    pending.append((chunk, executor.submit(predict, dataset)))
+                    while len(pending) > pipeline_depth:
+                        write(*pending.popleft())
+                while pending:
+                    write(*pending.popleft())
+            finally:
+                for _, future in pending:
+                    future.cancel()
+
+        elapsed = time.perf_counter() - start
+        throughput = ', '.join(
+            f'{stage} {seconds:.2f}s ({len(ids) / max(seconds, 1e-9):.0f} rows/s)'
+            for stage, seconds in stats.items()
+        )
+        logging.info(
+            f'Pipelined prediction of {len(ids)} rows for {predict_id} took '
+            f'{elapsed:.2f}s; {throughput}'
+        )
+
+    def _write_outputs(
+        self,
+        outputs: t.List,
+        predict_id: str,
+        db: Datalayer,
+        select: Query,
+        ids: t.List[str],
+    ):
         self._infer_auto_schema(outputs, predict_id)
         # TODO implement this so that we can toggle between different ibis/ mongodb
         outputs = self.encode_outputs(outputs)
@@ -1154,12 +1500,17 @@ class ObjectModel(Model):
 class APIBaseModel(Model):
     """APIBaseModel component which is used to make the type of API request.
 
+    Batches of requests are sent concurrently by the transport shared by all
+    API models, configured by ``CFG.api``.
+
     :param model: The Model to use, e.g. ``'text-embedding-ada-002'``
-    :param max_batch_size: Maximum  batch size.
+    :param max_batch_size: Maximum number of concurrent requests of the model.
+    :param requests_per_second: Rate limit of the requests of the model.
     """
 
     model: t.Optional[str] = None
     max_batch_size: int = 8
+    requests_per_second: t.Optional[float] = None
 
     def __post_init__(self, db, artifacts):
         super().__post_init__(db, artifacts)
@@ -1167,24 +1518,84 @@ class APIBaseModel(Model):
             assert self.identifier is not None
             self.model = self.identifier
 
+    def _map_requests(
+        self, fn: t.Callable, items: t.Sequence, return_exceptions: bool = False
+    ) -> t.List:
+        return get_transport().map(
+            fn,
+            items,
+            concurrency=self.max_batch_size,
+            rate_limit=get_rate_limit(self.identifier, self.requests_per_second),
+            return_exceptions=return_exceptions,
+        )
+
+    def predict_batches(self, dataset: t.Union[t.List, QueryDataset]) -> t.List:
+        """Predict on a dataset with concurrent requests.
+
+        :param dataset: Series of data points to predict on.
+        """
+        return self._map_requests(
+            self._wrapper, [dataset[i] for i in range(len(dataset))]
+        )
+
+    def _predict_in_batches(
+        self,
+        dataset: t.Union[t.List, QueryDataset],
+        batch_size: int,
+        max_batch_tokens: t.Optional[int] = None,
+    ) -> t.List:
+        # Concurrent requests of ``_predict_a_batch`` on batches packed up to
+        # ``batch_size`` inputs and an estimated ``max_batch_tokens`` tokens
+        inputs = [dataset[i] for i in range(len(dataset))]
+        batches = pack_batches(
+            [estimate_tokens(x) for x in inputs], batch_size, max_batch_tokens
+        )
+        start = time.time()
+        outputs = self._map_requests(
+            self._predict_or_split, [[inputs[i] for i in b] for b in batches]
+        )
+        elapsed = max(time.time() - start, 1e-9)
+        logging.info(
+            f'{self.identifier}: predicted {len(inputs)} inputs in {len(batches)} '
+            f'requests ({len(inputs) / elapsed:.1f} inputs/s)'
+        )
+        return [output for batch in outputs for output in batch]
+
+    def _predict_or_split(self, batch: t.List) -> t.List:
+        # A batch which is too large (e.g. in tokens) is split in halves, so
+        # that only the inputs too large on their own fail the prediction.
+        # Transient errors are retried by ``_predict_a_batch`` and
+        # rate-limited requests by the transport, so they aren't split
+        try:
+            return self._predict_a_batch(batch)
+        except Exception as e:
+            if len(batch) == 1 or not too_large(e):
+                raise
+            logging.warn(
+                f'{self.identifier}: request of {len(batch)} inputs failed '
+                f'({e}); retrying it in two halves'
+            )
+            half = len(batch) // 2
+            return self._predict_or_split(batch[:half]) + self._predict_or_split(
+                batch[half:]
+            )
+
+    def _predict_a_batch(self, batch: t.List) -> t.List:
+        # One request per input; models with a batched endpoint override this
+        return [self.predict(x) for x in batch]
+
     @ensure_initialized
     def _multi_predict(
         self, dataset: t.Union[t.List, QueryDataset], *args, **kwargs
     ) -> t.List:
-        """Use multi-threading to predict on a series of data points.
+        """Use concurrent requests to predict on a series of data points.
 
         :param dataset: Series of data points.
         """
-        with concurrent.futures.ThreadPoolExecutor(
-            max_workers=self.max_batch_size
-        ) as executor:
-            results = list(
-                executor.map(
-                    lambda x: self.predict(x, *args, **kwargs),
-                    dataset,  # type: ignore[arg-type]
-                )
-            )
-        return results
+        return self._map_requests(
+            lambda x: self.predict(x, *args, **kwargs),
+            [dataset[i] for i in range(len(dataset))],
+        )
 
 
 class APIModel(APIBaseModel):
@@ -1204,7 +1615,6 @@ class APIModel(APIBaseModel):
 
     def __post_init__(self, db, artifacts):
         super().__post_init__(db, artifacts)
-        self.params['model'] = self.model
         env_variables = re.findall('{([A-Z0-9\_]+)}', self.url)
         runtime_variables = re.findall('{([a-z0-9\_]+)}', self.url)
         runtime_variables = [x for x in runtime_variables if x != 'model']
@@ -1216,7 +1626,9 @@ class APIModel(APIBaseModel):
 
         :param params: url params.
         """
-        return self.url.format(**params, **{k: os.environ[k] for k in self.envs})
+        return self.url.format(
+            **params, model=self.model, **{k: os.environ[k] for k in self.envs}
+        )
 
     def predict(self, *args, **kwargs):
         """Predict on a single data point.
@@ -1228,7 +1640,8 @@ class APIModel(APIBaseModel):
         :param kwargs: Keyword arguments to predict on.
         """
         runtime_params = self.inputs(*args, **kwargs)
-        out = requests.get(self.build_url(params=runtime_params)).json()
+        url = self.build_url(params=runtime_params)
+        out = get_transport().request('GET', url).json()
         if self.postprocess is not None:
             out = self.postprocess(out)
         return out
@@ -30,6 +30,10 @@ class VectorIndex(Component):
     :param compatible_listener: Listener which is applied to vectors to be compared
     :param measure: Measure to use for comparison
     :param metric_values: Metric values for this index
+    :param quantization: Precision of the vectors held by in-memory
+                         searchers (float16|int8); full precision if unset
+    :param rerank_factor: Re-rank ``rerank_factor * n`` quantized candidates
+                          at full precision (0 disables re-ranking)
     """
 
     type_id: t.ClassVar[str] = 'vector_index'
@@ -38,6 +42,8 @@ class VectorIndex(Component):
     compatible_listener: t.Optional[Listener] = None
     measure: VectorIndexMeasureType = VectorIndexMeasureType.cosine
     metric_values: t.Optional[t.Dict] = dc.field(default_factory=dict)
+    quantization: t.Optional[str] = None
+    rerank_factor: int = 0
 
     @override
     def on_load(self, db: Datalayer) -> None:
@@ -115,7 +121,7 @@ class VectorIndex(Component):
         data = Mapping(key, model.signature)(document)
         args, kwargs = model.handle_input_type(data, model.signature)
         return (
-            model.predict(*args, **kwargs),
+            model.predict_online(*args, **kwargs),
             model.identifier,
             key,
         )
@@ -148,7 +154,7 @@ class VectorIndex(Component):
 
         if isinstance(like, dict) and id_field in like:
             return db.fast_vector_searchers[self.identifier].find_nearest_from_id(
-                str(like[id_field]), within_ids=within_ids, limit=n
+                str(like[id_field]), within_ids=within_ids, n=n
             )
         h = self.get_vector(
             like=like,
@@ -162,6 +168,56 @@ class VectorIndex(Component):
 
         return searcher.find_nearest_from_array(h, within_ids=within_ids, n=n)
 
+    def get_nearest_batch(
+        self,
+        likes: t.Sequence[Document],
+        db: t.Any,
+        id_field: str = '_id',
+        outputs: t.Optional[t.Dict] = None,
+        ids: t.Optional[t.Sequence[str]] = None,
+        n: int = 100,
+    ) -> t.List[t.Tuple[t.List[str], t.List[float]]]:
+        """Get nearest results in this vector index for several documents.
+
+        The vectors of the documents are searched together, with one call
+        to ``find_nearest_from_arrays``; returns a pair of lists of result
+        IDs and scores per document, in order.
+
+        :param likes: The documents to compare against
+        :param db: The datalayer to use
+        :param id_field: Identifier field
+        :param outputs: An optional dictionary
+        :param ids: A list of ids to match
+        :param n: Number of items to return per document
+        """
+        models, keys = self.models_keys
+        if len(models) != len(keys):
+            raise ValueError(f'len(model={models}) != len(keys={keys})')
+        within_ids = ids or ()
+        searcher = db.fast_vector_searchers[self.identifier]
+
+        results: t.List = [None] * len(likes)
+        positions, vectors = [], []
+        for i, like in enumerate(likes):
+            if isinstance(like, dict) and id_field in like:
+                results[i] = searcher.find_nearest_from_id(
+                    str(like[id_field]), within_ids=within_ids, n=n
+                )
+                continue
+            h = self.get_vector(
+                like=like, models=models, keys=keys, db=db, outputs=outputs
+            )[0]
+            positions.append(i)
+            vectors.append(searcher.to_numpy(h))
+
+        if vectors:
+            found = searcher.find_nearest_from_arrays(
+                np.stack(vectors), within_ids=within_ids, n=n
+            )
+            for i, result in zip(positions, found):
+                results[i] = result
+        return results
+
     def cleanup(self, db: Datalayer):
         """Clean up the vector index.
 
@@ -271,12 +327,16 @@ class EncodeArray:
     def __call__(self, x, info: t.Optional[t.Dict] = None):
         """Encode an array.
 
+        Floating point arrays are cast to the floating point ``dtype``.
+
         :param x: The array to encode
         :param info: Optional info
         """
         x = np.asarray(x)
         if x.dtype != self.dtype:
-            raise TypeError(f'dtype was {x.dtype}, expected {self.dtype}')
+            if x.dtype.kind != 'f' or np.dtype(self.dtype).kind != 'f':
+                raise TypeError(f'dtype was {x.dtype}, expected {self.dtype}')
+            x = x.astype(self.dtype)
         return memoryview(x).tobytes()
 
 
@@ -322,18 +382,22 @@ def vector(shape, identifier: t.Optional[str] = None):
 
 
 @component()
-def sqlvector(shape, bytes_encoding: str = 'Bytes'):
+def sqlvector(shape, bytes_encoding: str = 'Bytes', dtype: str = 'float64'):
     """Create an encoder for a vector (list of ints/ floats) of a given shape.
 
     This is used for compatibility with SQL databases, as the default vector
 
     :param shape: The shape of the vector
     :param bytes_encoding: The encoding of the bytes
+    :param dtype: The datatype the vector is stored as, e.g. float32 or float16
     """
+    identifier = f'sqlvector[{str_shape(shape)}]'
+    if dtype != 'float64':
+        identifier = f'sqlvector[{str_shape(shape)},{dtype}]'
     return DataType(
-        identifier=f'sqlvector[{str_shape(shape)}]',
+        identifier=identifier,
         shape=shape,
-        encoder=EncodeArray(dtype='float64'),
-        decoder=DecodeArray(dtype='float64'),
+        encoder=EncodeArray(dtype=dtype),
+        decoder=DecodeArray(dtype=dtype),
         bytes_encoding=bytes_encoding,
     )
@@ -2,7 +2,6 @@ import dataclasses as dc
 import typing as t
 
 import cohere
-import tqdm
 from cohere.error import CohereAPIError, CohereConnectionError
 
 from superduper.backends.ibis.data_backend import IbisDataBackend
@@ -31,17 +30,26 @@ class Cohere(APIBaseModel):
         super().__post_init__(db, artifacts)
         self.identifier = self.identifier or self.model
 
+    @property
+    def client(self):
+        """The Cohere client, created once so that its connections are reused."""
+        if getattr(self, '_client', None) is None:
+            self._client = cohere.Client(get_key(KEY_NAME), **self.client_kwargs)
+        return self._client
+
 
 class CohereEmbed(Cohere):
     """Cohere embedding predictor.
 
     :param shape: The shape as ``tuple`` of the embedding.
-    :param batch_size: The batch size to use for the predictor.
+    :param batch_size: The maximum number of texts per request.
+    :param max_batch_tokens: The maximum estimated number of tokens per request.
     """
 
     shapes: t.ClassVar[t.Dict] = {'embed-english-v2.0': (4096,)}
     shape: t.Optional[t.Sequence[int]] = None
-    batch_size: int = 100
+    batch_size: int = 96
+    max_batch_tokens: t.Optional[int] = 50000
     signature: str = 'singleton'
 
     def __post_init__(self, db, artifacts):
@@ -70,14 +78,14 @@ class CohereEmbed(Cohere):
 
         :param X: The text to predict the embedding of.
         """
-        client = cohere.Client(get_key(KEY_NAME), **self.client_kwargs)
-        e = client.embed(texts=[X], model=self.identifier, **self.predict_kwargs)
+        e = self.client.embed(texts=[X], model=self.identifier, **self.predict_kwargs)
         return e.embeddings[0]
 
     @retry
     def _predict_a_batch(self, texts: t.List[str]):
-        client = cohere.Client(get_key(KEY_NAME), **self.client_kwargs)
-        out = client.embed(texts=texts, model=self.identifier, **self.predict_kwargs)
+        out = self.client.embed(
+            texts=texts, model=self.identifier, **self.predict_kwargs
+        )
         return [r for r in out.embeddings]
 
     def predict_batches(self, dataset: t.Union[t.List, QueryDataset]) -> t.List:
@@ -85,14 +93,7 @@ class CohereEmbed(Cohere):
 
         :param dataset: The dataset to predict the embeddings of.
         """
-        out = []
-        for i in tqdm.tqdm(range(0, len(dataset), self.batch_size)):
-            out.extend(
-                self._predict_a_batch(
-                    dataset[i : i + self.batch_size], **self.predict_kwargs
-                )
-            )
-        return out
+        return self._predict_in_batches(dataset, self.batch_size, self.max_batch_tokens)
 
 
 class CohereGenerate(Cohere):
@@ -127,8 +128,7 @@ class CohereGenerate(Cohere):
         """
         if context is not None:
             prompt = format_prompt(prompt, self.prompt, context=context)
-        client = cohere.Client(get_key(KEY_NAME), **self.client_kwargs)
-        resp = client.generate(
+        resp = self.client.generate(
             prompt=prompt, model=self.identifier, **self.predict_kwargs
         )
         return resp.generations[0].text
@@ -139,4 +139,6 @@ class CohereGenerate(Cohere):
 
         :param dataset: The dataset to predict the generations of.
         """
-        return [self.predict(dataset[i]) for i in range(len(dataset))]
+        return self._map_requests(
+            self.predict, [dataset[i] for i in range(len(dataset))]
+        )
@@ -1,7 +1,5 @@
 import typing as t
 
-import tqdm
-
 from superduper.backends.ibis.data_backend import IbisDataBackend
 from superduper.backends.query_dataset import QueryDataset
 from superduper.components.model import APIBaseModel
@@ -26,12 +24,14 @@ class Jina(APIBaseModel):
 class JinaEmbedding(Jina):
     """Jina embedding predictor.
 
-    :param batch_size: The batch size to use for the predictor.
+    :param batch_size: The maximum number of texts per request.
+    :param max_batch_tokens: The maximum estimated number of tokens per request.
     :param shape: The shape of the embedding as ``tuple``.
         If not provided, it will be obtained by sending a simple query to the API
     """
 
-    batch_size: int = 100
+    batch_size: int = 2048
+    max_batch_tokens: t.Optional[int] = 50000
     shape: t.Optional[t.Sequence[int]] = None
     signature: str = 'singleton'
 
@@ -70,10 +70,4 @@ class JinaEmbedding(Jina):
 
         :param dataset: The dataset to predict the embeddings of.
         """
-        out = []
-        for i in tqdm.tqdm(range(0, len(dataset), self.batch_size)):
-            batch = [
-                dataset[i] for i in range(i, min(i + self.batch_size, len(dataset)))
-            ]
-            out.extend(self._predict_a_batch(batch))
-        return out
+        return self._predict_in_batches(dataset, self.batch_size, self.max_batch_tokens)
@@ -1,4 +1,3 @@
-import concurrent.futures
 import dataclasses as dc
 import inspect
 import typing as t
@@ -10,6 +9,7 @@ from superduper.backends.query_dataset import QueryDataset
 from superduper.components.component import ensure_initialized
 from superduper.components.model import Model
 from superduper.ext.llm.prompter import Prompter
+from superduper.misc.api_transport import get_rate_limit, get_transport
 
 if t.TYPE_CHECKING:
     from superduper.base.datalayer import Datalayer
@@ -116,37 +116,37 @@ class BaseLLMAPI(BaseLLM):
     """Base class for LLM models with an API.
 
     :param api_url: The URL for the API.
+    :param requests_per_second: Rate limit of the requests of the model.
     """
 
     api_url: str = dc.field(default="")
+    requests_per_second: t.Optional[float] = None
 
     def init(self):
         """Initialize the model."""
         pass
 
-    def _generate_wrapper(self, prompt: str, **kwargs: t.Any) -> str:
-        """Wrapper for the _generate method to handle exceptions."""
-        try:
-            return self._generate(prompt, **kwargs)
-        except Exception as e:
-            logging.error(f"Error generating response for prompt '{prompt}': {e}")
-            return ""
-
     def _batch_generate(self, prompts: t.List[str], **kwargs: t.Any) -> t.List[str]:
         """
-        Base method to batch generate text from a list of prompts using multi-threading.
+        Base method to batch generate text from a list of prompts.
 
-        Handles exceptions in _generate method.
+        The prompts are sent as concurrent requests, at most ``max_batch_size``
+        at once, by the transport shared by all API models.
+        Failed prompts generate an empty string.
 
         :param prompts: The list of prompts to generate text from.
         """
-        with concurrent.futures.ThreadPoolExecutor(
-            max_workers=self.max_batch_size
-        ) as executor:
-            results = list(
-                executor.map(
-                    lambda prompt: self._generate_wrapper(prompt, **kwargs), prompts
+        results = get_transport().map(
+            lambda prompt: self._generate(prompt, **kwargs),
+            prompts,
+            concurrency=self.max_batch_size,
+            rate_limit=get_rate_limit(self.identifier, self.requests_per_second),
+            return_exceptions=True,
+        )
+        for i, (prompt, result) in enumerate(zip(prompts, results)):
+            if isinstance(result, Exception):
+                logging.error(
+                    f"Error generating response for prompt '{prompt}': {result}"
                 )
-            )
-
+                results[i] = ""
         return results
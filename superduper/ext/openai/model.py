@@ -5,7 +5,6 @@ import os
 import typing as t
 
 import requests
-import tqdm
 from httpx import ResponseNotRead
 from openai import (
     APITimeoutError,
@@ -48,11 +47,13 @@ class _OpenAI(APIBaseModel):
     :param openai_api_key: The OpenAI API key.
     :param openai_api_base: The server to use for requests.
     :param client_kwargs: The kwargs to be passed to OpenAI
+    :param max_batch_tokens: The maximum estimated number of tokens per request.
     """
 
     openai_api_key: t.Optional[str] = None
     openai_api_base: t.Optional[str] = None
     client_kwargs: t.Optional[dict] = dc.field(default_factory=dict)
+    max_batch_tokens: t.Optional[int] = None
 
     def __post_init__(self, db, artifacts):
         super().__post_init__(db, artifacts)
@@ -86,27 +87,23 @@ class _OpenAI(APIBaseModel):
 
         :param dataset: The dataset to predict on.
         """
-        out = []
-        for i in tqdm.tqdm(range(0, len(dataset), self.batch_size)):
-            batch = [
-                dataset[i] for i in range(i, min(len(dataset), i + self.batch_size))
-            ]
-            out.extend(self._predict_a_batch(batch))
-        return out
+        return self._predict_in_batches(dataset, self.batch_size, self.max_batch_tokens)
 
 
 class OpenAIEmbedding(_OpenAI):
     """OpenAI embedding predictor.
 
     :param shape: The shape as ``tuple`` of the embedding.
-    :param batch_size: The batch size to use.
+    :param batch_size: The maximum number of texts per request.
+    :param max_batch_tokens: The maximum estimated number of tokens per request.
     """
 
     shapes: t.ClassVar[t.Dict] = {'text-embedding-ada-002': (1536,)}
 
     shape: t.Optional[t.Sequence[int]] = None
     signature: str = 'singleton'
-    batch_size: int = 100
+    batch_size: int = 2048
+    max_batch_tokens: t.Optional[int] = 50000
 
     @property
     def inputs(self):
@@ -210,13 +207,9 @@ class OpenAIChatCompletion(_OpenAI):
 
         :param dataset: The dataset of prompts.
         """
-        out = []
-        for i in range(len(dataset)):
-            args, kwargs = self.handle_input_type(
-                data=dataset[i], signature=self.signature
-            )
-            out.append(self.predict(*args, **kwargs))
-        return out
+        return self._map_requests(
+            self._wrapper, [dataset[i] for i in range(len(dataset))]
+        )
 
 
 class OpenAIImageCreation(_OpenAI):
@@ -281,13 +274,9 @@ class OpenAIImageCreation(_OpenAI):
 
         :param dataset: The dataset of text prompts.
         """
-        out = []
-        for i in range(len(dataset)):
-            args, kwargs = self.handle_input_type(
-                data=dataset[i], signature=self.signature
-            )
-            out.append(self.predict(*args, **kwargs))
-        return out
+        return self._map_requests(
+            self._wrapper, [dataset[i] for i in range(len(dataset))]
+        )
 
 
 class OpenAIImageEdit(_OpenAI):
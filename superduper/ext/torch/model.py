@@ -23,7 +23,7 @@ from superduper.components.model import (
     _DeviceManaged,
     _Fittable,
 )
-from superduper.ext.torch.utils import device_of, eval, to_device
+from superduper.ext.torch.utils import device_of, eval, num_threads, to_device
 
 if t.TYPE_CHECKING:
     from superduper.jobs.job import Job
@@ -120,6 +120,19 @@ class TorchModel(Model, _Fittable, _DeviceManaged):
     :param trainer: `Trainer` object to train the model
     :param preferred_devices: The order of devices to use
     :param device: The device to be used
+    :param bucket_by_size: Sort the inputs of ``predict_batches`` by size, so that
+                           each batch pads its inputs to similar lengths; the
+                           outputs keep the order of the inputs
+    :param bucket_window: The number of consecutive inputs sorted together by
+                          ``bucket_by_size``, which bounds the inputs held in
+                          memory at once
+    :param num_threads: The number of threads torch uses for inference on CPU;
+                        predictions setting it run one at a time
+    :param inference_mode: Predict under ``torch.inference_mode`` instead of
+                           ``torch.no_grad``; the outputs can't be used in
+                           autograd
+    :param quantize: Predict on CPU with a copy of the model whose ``Linear``
+                     layers are dynamically quantized to int8
     """
 
     _artifacts: t.ClassVar[t.Sequence[t.Tuple[str, DataType]]] = (
@@ -140,6 +153,11 @@ class TorchModel(Model, _Fittable, _DeviceManaged):
     collate_fn: t.Optional[t.Callable] = None
     optimizer_state: t.Optional[t.Any] = None
     loader_kwargs: t.Dict = dc.field(default_factory=lambda: {})
+    bucket_by_size: bool = False
+    bucket_window: int = 1024
+    num_threads: t.Optional[int] = None
+    inference_mode: bool = False
+    quantize: bool = False
 
     def __post_init__(self, db, artifacts):
         super().__post_init__(db, artifacts=artifacts)
@@ -212,6 +230,8 @@ class TorchModel(Model, _Fittable, _DeviceManaged):
 
     def train(self):
         """Set the model to training mode."""
+        # The quantized copy is from before training
+        self._quantized = None
         return self.object.train()
 
     def eval(self):
@@ -240,8 +260,18 @@ class TorchModel(Model, _Fittable, _DeviceManaged):
             if was_training:
                 self.object.train()
 
+    def _inference_module(self) -> torch.nn.Module:
+        if not self.quantize or str(device_of(self.object)) != 'cpu':
+            return self.object
+        if getattr(self, '_quantized', None) is None:
+            self._quantized = torch.ao.quantization.quantize_dynamic(
+                self.object, {torch.nn.Linear}, dtype=torch.qint8
+            ).eval()
+        return self._quantized
+
     def __getstate__(self):
         state = self.__dict__.copy()
+        state.pop('_quantized', None)
         if isinstance(self.object, torch.jit.ScriptModule) or isinstance(
             self.object, torch.jit.ScriptFunction
         ):
@@ -260,6 +290,12 @@ class TorchModel(Model, _Fittable, _DeviceManaged):
                     io.BytesIO(state.pop('object_bytes'))
                 )
 
+    @contextmanager
+    def _inference(self):
+        no_grad = torch.inference_mode if self.inference_mode else torch.no_grad
+        with no_grad(), num_threads(self.num_threads), eval(self.object):
+            yield
+
     @ensure_initialized
     def predict(self, *args, **kwargs):
         """Predict on a single input.
@@ -267,7 +303,7 @@ class TorchModel(Model, _Fittable, _DeviceManaged):
         :param args: Input arguments
         :param kwargs: Input keyword arguments
         """
-        with torch.no_grad(), eval(self.object):
+        with self._inference():
             if self.preprocess is not None:
                 out = self.preprocess(*args, **kwargs)
                 args, kwargs = self.handle_input_type(out, self.signature)
@@ -275,7 +311,7 @@ class TorchModel(Model, _Fittable, _DeviceManaged):
             args, kwargs = to_device((args, kwargs), self.device)
             args, kwargs = create_batch((args, kwargs))
 
-            method = getattr(self.object, self.forward_method)
+            method = getattr(self._inference_module(), self.forward_method)
             output = method(*args, **kwargs)
             output = to_device(output, 'cpu')
             args = unpack_batch(output)[0]
@@ -289,32 +325,53 @@ class TorchModel(Model, _Fittable, _DeviceManaged):
 
         :param dataset: Dataset
         """
-        with torch.no_grad(), eval(self.object):
-            inputs = BasicDataset(
-                items=dataset,
-                transform=self.preprocess,
-                signature=self.preprocess_signature,
-            )
-            loader = torch.utils.data.DataLoader(
-                inputs, **self.loader_kwargs, collate_fn=self.collate_fn
-            )
+        inputs = BasicDataset(
+            items=dataset,
+            transform=self.preprocess,
+            signature=self.preprocess_signature,
+        )
+        with self._inference(), tqdm(total=len(inputs)) as progress:
+            if not self.bucket_by_size:
+                return self._predict_loader(inputs, self.loader_kwargs, progress)
             out = []
-            for batch in tqdm(loader, total=len(loader)):
-                batch = to_device(batch, device_of(self.object))
-                args, kwargs = self.handle_input_type(batch, self.signature)
-                method = getattr(self.object, self.forward_method)
-                tmp = method(*args, **kwargs, **self.predict_kwargs)
-                tmp = to_device(tmp, 'cpu')
-                tmp = unpack_batch(tmp)
-                if self.postprocess:
-                    tmp = [
-                        self.handle_input_type(x, self.postprocess_signature)
-                        for x in tmp
-                    ]
-                    tmp = [self.postprocess(*x[0], **x[1]) for x in tmp]
-                out.extend(tmp)
+            loader_kwargs = {**self.loader_kwargs, 'shuffle': False}
+            for start in range(0, len(inputs), self.bucket_window):
+                end = min(start + self.bucket_window, len(inputs))
+                items = [inputs[i] for i in range(start, end)]
+                order = sorted(range(len(items)), key=lambda i: _size_of(items[i]))
+                window = BasicDataset(
+                    items=[items[i] for i in order], transform=None, signature=None
+                )
+                # Put the outputs back in the order of the inputs
+                sorted_out = self._predict_loader(window, loader_kwargs, progress)
+                window_out: t.List[t.Any] = [None] * len(sorted_out)
+                for position, output in zip(order, sorted_out):
+                    window_out[position] = output
+                out.extend(window_out)
             return out
 
+    def _predict_loader(self, inputs, loader_kwargs, progress) -> t.List:
+        module = self._inference_module()
+        loader = torch.utils.data.DataLoader(
+            inputs, **loader_kwargs, collate_fn=self.collate_fn
+        )
+        out = []
+        for batch in loader:
+            batch = to_device(batch, device_of(self.object))
+            args, kwargs = self.handle_input_type(batch, self.signature)
+            method = getattr(module, self.forward_method)
+            tmp = method(*args, **kwargs, **self.predict_kwargs)
+            tmp = to_device(tmp, 'cpu')
+            tmp = unpack_batch(tmp)
+            if self.postprocess:
+                tmp = [
+                    self.handle_input_type(x, self.postprocess_signature) for x in tmp
+                ]
+                tmp = [self.postprocess(*x[0], **x[1]) for x in tmp]
+            out.extend(tmp)
+            progress.update(len(tmp))
+        return out
+
     def train_forward(self, X, y=None):
         """The forward method for training.
 
@@ -338,6 +395,21 @@ class TorchModel(Model, _Fittable, _DeviceManaged):
                 return [method(X), y]
 
 
+def _size_of(item: t.Any) -> int:
+    # Length of an input along the dimension padded by ``collate_fn``
+    if isinstance(item, torch.Tensor):
+        return item.shape[0] if item.dim() else 1
+    if isinstance(item, dict):
+        return max((_size_of(x) for x in item.values()), default=0)
+    if isinstance(item, (list, tuple)):
+        if item and all(isinstance(x, (torch.Tensor, dict, list, tuple)) for x in item):
+            return max(_size_of(x) for x in item)
+        return len(item)
+    if isinstance(item, str):
+        return len(item)
+    return 0
+
+
 def unpack_batch(args):
     """Unpack a batch into lines of tensor output.
 
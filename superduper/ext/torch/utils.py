@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import threading
 import typing as t
 from contextlib import contextmanager
 
@@ -7,6 +8,10 @@ if t.TYPE_CHECKING:
     from torch import device as _device
     from torch.nn.modules import Module
 
+# ``torch.set_num_threads`` is global to the process, so concurrent callers of
+# ``num_threads`` take turns
+_NUM_THREADS_LOCK = threading.RLock()
+
 
 def device_of(module: Module) -> t.Union[_device, str]:
     """
@@ -36,6 +41,30 @@ def eval(module: Module) -> t.Iterator[None]:
             module.train()
 
 
+@contextmanager
+def num_threads(n: t.Optional[int]) -> t.Iterator[None]:
+    """
+    Temporarily set the number of threads used by torch for intra-op parallelism.
+
+    The setting is global to the process, so other threads entering this
+    context wait until it exits.
+
+    :param n: Number of threads; ``None`` keeps the current number
+    """
+    import torch
+
+    if n is None:
+        yield
+        return
+    with _NUM_THREADS_LOCK:
+        before = torch.get_num_threads()
+        try:
+            torch.set_num_threads(n)
+            yield
+        finally:
+            torch.set_num_threads(before)
+
+
 @contextmanager
 def set_device(module: Module, device: _device):
     """
@@ -46,3 +46,39 @@ def format_prompt(X: str, prompt: str, context: t.Optional[t.List[str]] = None)
             raise ValueError(f'A context is required for prompt {prompt}')
 
     return prompt.format(**format_params)
+
+
+def estimate_tokens(text: t.Any) -> int:
+    """Estimate the number of tokens of a text, at about 4 characters per token.
+
+    :param text: The text to estimate; other inputs count as one token.
+    """
+    if not isinstance(text, str):
+        return 1
+    return len(text) // 4 + 1
+
+
+def pack_batches(
+    tokens: t.Sequence[int], max_size: int, max_tokens: t.Optional[int] = None
+) -> t.List[range]:
+    """Pack consecutive inputs into batches by their number and total tokens.
+
+    An input with more than ``max_tokens`` tokens gets a batch of its own.
+
+    :param tokens: The number of tokens of each input.
+    :param max_size: The maximum number of inputs per batch.
+    :param max_tokens: The maximum total tokens per batch, or ``None``.
+    """
+    batches = []
+    start, total = 0, 0
+    for i, n in enumerate(tokens):
+        full = i - start == max_size or (
+            max_tokens is not None and total + n > max_tokens
+        )
+        if full and i > start:
+            batches.append(range(start, i))
+            start, total = i, 0
+        total += n
+    if start < len(tokens):
+        batches.append(range(start, len(tokens)))
+    return batches
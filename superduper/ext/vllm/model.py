@@ -1,10 +1,9 @@
 import dataclasses as dc
 import typing as t
 
-import requests
-
 from superduper import logging
 from superduper.ext.llm.model import BaseLLM, BaseLLMAPI
+from superduper.misc.api_transport import get_transport
 
 __all__ = ["VllmAPI", "VllmModel"]
 
@@ -43,7 +42,7 @@ class VllmAPI(BaseLLMAPI):
     def _generate(self, prompt: str, **kwargs) -> t.Union[str, t.List[str]]:
         """Batch generate text from a prompt."""
         post_data = self.build_post_data(prompt, **kwargs)
-        response = requests.post(self.api_url, json=post_data)
+        response = get_transport().request('POST', self.api_url, json=post_data)
         results = []
         for result in response.json()["text"]:
             results.append(result[len(prompt) :])
@@ -0,0 +1,128 @@
+import hashlib
+import pickle
+import typing as t
+
+from superduper import logging
+
+if t.TYPE_CHECKING:
+    from superduper.base.datalayer import Datalayer
+
+
+class JobProgress:
+    """Progress of a job over a list of ids, checkpointed in the job record.
+
+    The ids are saved once in the artifact store when the job starts. After
+    each chunk of outputs is written, the number of ids done is saved under
+    ``info.progress`` of the job, with ``db.metadata.update_job`` (buffered
+    for at most ``CFG.job_updates.interval`` seconds). A restarted job loads
+    the ids and skips those done, instead of querying them again.
+
+    :param db: Datalayer instance
+    :param job_id: Identifier of the job
+    :param ids: Ids processed by the job, in order
+    :param done: Number of ids processed
+    :param total: Number of ids of the job; defaults to ``len(ids)``
+    """
+
+    def __init__(
+        self,
+        db: 'Datalayer',
+        job_id: str,
+        ids: t.Sequence,
+        done: int = 0,
+        total: t.Optional[int] = None,
+    ):
+        self.db = db
+        self.job_id = job_id
+        self.ids = ids
+        self.done = done
+        self.total = len(ids) if total is None else total
+        self._job_info: t.Optional[t.Dict] = None
+
+    @staticmethod
+    def _ids_file(job_id: str) -> str:
+        return hashlib.sha1(f'{job_id}/progress/ids'.encode()).hexdigest()
+
+    @classmethod
+    def start(cls, db: 'Datalayer', job_id: str, ids: t.Sequence) -> 'JobProgress':
+        """Save the ids of a new job and return its progress.
+
+        :param db: Datalayer instance
+        :param job_id: Identifier of the job
+        :param ids: Ids processed by the job, in order
+        """
+        db.artifact_store.put_bytes(
+            pickle.dumps(list(ids), protocol=4), cls._ids_file(job_id)
+        )
+        progress = cls(db, job_id, ids)
+        progress._save()
+        return progress
+
+    @classmethod
+    def resume(cls, db: 'Datalayer', job_id: str) -> t.Optional['JobProgress']:
+        """Return the checkpointed progress of a job, or ``None`` if it has none.
+
+        :param db: Datalayer instance
+        :param job_id: Identifier of the job
+        """
+        info = cls._info(db, job_id)
+        checkpoint = info.get('progress')
+        if not checkpoint:
+            return None
+        done, total = checkpoint['done'], checkpoint['total']
+        ids: t.Sequence = []
+        if done < total:
+            file_id = cls._ids_file(job_id)
+            if not db.artifact_store.exists(file_id=file_id):
+                logging.warn(f'Ids of job {job_id} are missing; starting again')
+                return None
+            ids = pickle.loads(db.artifact_store.get_bytes(file_id))
+        progress = cls(db, job_id, ids, done=done, total=total)
+        progress._job_info = info
+        return progress
+
+    @staticmethod
+    def _info(db: 'Datalayer', job_id: str) -> t.Dict:
+        record = db.metadata.get_job(job_id)
+        return (record or {}).get('info') or {}
+
+    @property
+    def remaining(self) -> t.Sequence:
+        """Ids not processed yet."""
+        return self.ids[self.done :]
+
+    @property
+    def percent(self) -> float:
+        """Percentage of the ids processed."""
+        if not self.total:
+            return 100.0
+        return round(100.0 * self.done / self.total, 2)
+
+    def advance(self, n: int):
+        """Record that the next ``n`` ids were processed.
+
+        Call this only once the outputs of the ids are written.
+
+        :param n: Number of ids processed
+        """
+        self.done = min(self.total, self.done + n)
+        self._save()
+
+    def finish(self):
+        """Record that the job is complete and drop its saved ids."""
+        self.done = self.total
+        self._save()
+        file_id = self._ids_file(self.job_id)
+        if self.db.artifact_store.exists(file_id=file_id):
+            self.db.artifact_store._delete_bytes(file_id)
+
+    def dict(self) -> t.Dict[str, t.Any]:
+        """Return the progress as saved in the job record."""
+        return {'done': self.done, 'total': self.total, 'percent': self.percent}
+
+    def _save(self):
+        # Other fields of ``info`` are kept; they are read once per job
+        if self._job_info is None:
+            self._job_info = self._info(self.db, self.job_id)
+        self._job_info['progress'] = self.dict()
+        self.db.metadata.update_job(self.job_id, 'info', self._job_info)
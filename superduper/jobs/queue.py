@@ -1,5 +1,9 @@
+import threading
+import time
 import typing as t
 
+from superduper import logging
+
 DependencyType = t.Union[t.Dict[str, str], t.Sequence[t.Dict[str, str]]]
 
 
@@ -39,7 +43,10 @@ class LocalSequentialQueue:
         :param events: list of events
         :param to: Component name for events to be published.
         """
+        self._enqueue(events, to)
+        return self.consume()
 
+    def _enqueue(self, events: t.List[t.Dict], to: DependencyType):
         def _publish(events, to):
             identifier = to['identifier']
             type_id = to['type_id']
@@ -52,19 +59,26 @@ class LocalSequentialQueue:
                 _publish(events, dep)
         else:
             _publish(events, to)
-        return self.consume()
 
     def consume(self):
         """Consume the current queue and run jobs."""
-        from superduper.base.datalayer import Event
+        return self._run_jobs(self._take())
 
-        queue_jobs = {}
+    def _take(self) -> t.Dict[str, t.List[t.Dict]]:
+        queued = {}
         for component_id in self.queue:
             events = self.queue[component_id]
             if not events:
                 continue
             self.queue[component_id] = []
+            queued[component_id] = events
+        return queued
 
+    def _run_jobs(self, queued: t.Dict[str, t.List[t.Dict]]):
+        from superduper.base.datalayer import Event
+
+        queue_jobs = {}
+        for component_id, events in queued.items():
             component = self.components[component_id]
             jobs = []
 
@@ -84,3 +98,165 @@ class LocalSequentialQueue:
                 queue_jobs[component_id] = jobs
 
         return queue_jobs
+
+    def flush(self, timeout: t.Optional[float] = None):
+        """Wait until the jobs of all published events have run.
+
+        :param timeout: Longest time to wait in seconds
+        """
+        pass
+
+    def close(self):
+        """Run the jobs of the queued events and stop consuming."""
+        pass
+
+
+class LocalCoalescingQueue(LocalSequentialQueue):
+    """
+    Local queue which runs the jobs of events in a background thread.
+
+    ``publish`` returns at once. The events of a component are merged until
+    the oldest waited ``window`` seconds, or until ``max_batch_size`` events
+    of a component are queued, so that a stream of small writes triggers few
+    large jobs. ``publish`` blocks while more than ``max_pending`` events
+    are queued, except in the jobs of queued events (e.g. of listeners
+    downstream), which the wait would deadlock. Errors of the jobs are
+    logged and raised by ``flush``.
+
+    :param window: Seconds an event waits to be merged with later events
+    :param max_batch_size: Number of queued events of a component which start
+                           its jobs before the end of the window
+    :param max_pending: Number of queued events above which ``publish`` blocks
+    """
+
+    def __init__(
+        self,
+        window: float = 0.1,
+        max_batch_size: int = 1000,
+        max_pending: int = 100000,
+    ):
+        super().__init__()
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.max_pending = max_pending
+        self._cond = threading.Condition()
+        self._pending = 0
+        self._oldest = 0.0
+        self._full = False
+        self._busy = False
+        self._flushing = 0
+        self._stopping = False
+        self._errors: t.List[Exception] = []
+        self._thread: t.Optional[threading.Thread] = None
+
+    def declare_component(self, component):
+        """Declare component and add it to queue."""
+        with self._cond:
+            super().declare_component(component)
+
+    def publish(self, events: t.List[t.Dict], to: DependencyType):
+        """
+        Queue events for the background thread and return at once.
+
+        :param events: list of events
+        :param to: Component name for events to be published.
+        """
+        if not events:
+            return {}
+        with self._cond:
+            # Backpressure: wait for the queue to drain; a single large
+            # publish is let through when the queue is empty. The consumer
+            # thread doesn't wait, since only it drains the queue
+            if threading.current_thread() is not self._thread:
+                self._cond.wait_for(
+                    lambda: not self._pending
+                    or self._pending + len(events) <= self.max_pending
+                )
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._enqueue(events, to)
+            self._pending += len(events)
+            if max(len(v) for v in self.queue.values()) >= self.max_batch_size:
+                self._full = True
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='event-queue', daemon=True
+                )
+                self._thread.start()
+            self._cond.notify_all()
+        return {}
+
+    def _ready(self) -> bool:
+        # Whether the consumer should take the queued events now
+        if not self._pending:
+            return self._stopping
+        if self._full or self._flushing or self._stopping:
+            return True
+        return time.monotonic() - self._oldest >= self.window
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._ready():
+                    timeout = None
+                    if self._pending:
+                        elapsed = time.monotonic() - self._oldest
+                        timeout = max(0.0, self.window - elapsed)
+                    self._cond.wait(timeout)
+                if not self._pending:
+                    self._thread = None
+                    self._cond.notify_all()
+                    return
+                queued = self._take()
+                self._pending = 0
+                self._full = False
+                self._busy = True
+                self._cond.notify_all()
+            try:
+                n_events = sum(len(v) for v in queued.values())
+                logging.info(
+                    f'Running the jobs of {n_events} queued events '
+                    f'of {len(queued)} components'
+                )
+                self._run_jobs(queued)
+            except Exception as e:
+                logging.error(f'Jobs of queued events failed: {e}')
+                with self._cond:
+                    self._errors.append(e)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def flush(self, timeout: t.Optional[float] = None):
+        """Wait until the jobs of all published events have run.
+
+        Raises the first error of the jobs run since the last flush.
+
+        :param timeout: Longest time to wait in seconds
+        """
+        with self._cond:
+            self._flushing += 1
+            self._cond.notify_all()
+            try:
+                done = self._cond.wait_for(
+                    lambda: not self._pending and not self._busy, timeout
+                )
+            finally:
+                self._flushing -= 1
+            errors, self._errors = self._errors, []
+        if errors:
+            raise errors[0]
+        if not done:
+            raise TimeoutError(f'Queued events not consumed after {timeout}s')
+
+    def close(self):
+        """Run the jobs of the queued events and stop the background thread."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        with self._cond:
+            self._stopping = False
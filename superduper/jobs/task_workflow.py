@@ -4,7 +4,7 @@ import dataclasses as dc
 import typing as t
 
 import networkx
-from networkx import DiGraph, ancestors
+from networkx import DiGraph
 
 from .job import ComponentJob, FunctionJob, Job
 
@@ -55,21 +55,18 @@ class TaskWorkflow:
     def run_jobs(
         self,
     ):
-        """Run all the jobs in this workflow."""
-        pred = self.G.predecessors
-        current_group = [n for n in self.G.nodes if not ancestors(self.G, n)]
-        done = set()
-
-        while current_group:
-            for node in current_group:
-                job: Job = self.G.nodes[node]['job']
-                dependencies = [self.G.nodes[a]['job'].future for a in pred(node)]
-                job(
-                    self.database,
-                    dependencies=dependencies,
-                )
-                done.add(node)
-
-            current_group = [
-                n for n in self.G.nodes if set(pred(n)) <= done and n not in done
+        """Run all the jobs in this workflow.
+
+        Jobs are submitted in topological order, each with the futures of
+        the jobs it depends on; the compute backend starts a job once those
+        are complete, so that independent jobs may run in parallel.
+        """
+        for node in networkx.topological_sort(self.G):
+            job: Job = self.G.nodes[node]['job']
+            dependencies = [
+                self.G.nodes[a]['job'].future for a in self.G.predecessors(node)
             ]
+            job(
+                self.database,
+                dependencies=dependencies,
+            )
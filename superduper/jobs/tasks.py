@@ -36,15 +36,18 @@ def method_job(
     sys.path.append('./')
 
     from superduper import CFG
-    from superduper.base.build import build_datalayer
+    from superduper.jobs.worker import get_runtime
 
     if isinstance(cfg, dict):
         cfg = CFG(**cfg)
 
-    # Set the compute as local since otherwise a new
-    # Ray cluster would be created inside the job
+    # Workers keep their datalayer and the components of their jobs loaded
+    # across jobs
     if db is None:
-        db = build_datalayer(cfg=cfg, cluster__compute___path=None)
+        runtime = get_runtime(cfg)
+        db = runtime.datalayer(cfg)
+        if not component:
+            component = runtime.component(db, type_id, identifier)
 
     if not component:
         component = db.load(type_id, identifier)
@@ -63,7 +66,11 @@ def method_job(
     except Exception as e:
         db.metadata.update_job(job_id, 'status', 'failed')
         raise e
-    db.metadata.update_job(job_id, 'status', 'success')
+    else:
+        db.metadata.update_job(job_id, 'status', 'success')
+    finally:
+        # Updates of jobs are buffered; the final status is written now
+        db.metadata.flush_job_updates()
 
 
 def callable_job(
@@ -88,17 +95,15 @@ def callable_job(
     import sys
 
     from superduper import CFG
-    from superduper.base.build import build_datalayer
+    from superduper.jobs.worker import get_runtime
 
     sys.path.append('./')
 
     if isinstance(cfg, dict):
         cfg = CFG(**cfg)
 
-    # Set the compute as local since otherwise a new
-    # Ray cluster would be created inside the job
     if db is None:
-        db = build_datalayer(cfg=cfg, cluster__compute___path=None)
+        db = get_runtime(cfg).datalayer(cfg)
 
     db.metadata.update_job(job_id, 'status', 'running')
     output = None
@@ -109,4 +114,6 @@ def callable_job(
         raise e
     else:
         db.metadata.update_job(job_id, 'status', 'success')
+    finally:
+        db.metadata.flush_job_updates()
     return output
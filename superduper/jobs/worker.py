@@ -0,0 +1,146 @@
+import collections
+import hashlib
+import json
+import threading
+import time
+import typing as t
+
+from superduper import logging
+
+if t.TYPE_CHECKING:
+    from superduper.base.config import Config
+    from superduper.base.datalayer import Datalayer
+    from superduper.components.component import Component
+
+
+class WorkerRuntime:
+    """State which a worker process keeps across jobs.
+
+    Jobs which aren't given a ``Datalayer`` (e.g. in worker processes) share
+    one per configuration, instead of connecting to the databases again, and
+    share an LRU cache of loaded and unpacked components, keyed by the uuid,
+    version and metadata record of the component. A new version of a
+    component is loaded again, as is a version replaced in place (e.g. by
+    fitting), whose record references its new artifacts.
+
+    :param max_components: Number of components kept loaded
+    """
+
+    def __init__(self, max_components: int = 8):
+        self.max_components = max_components
+        self._datalayers: t.Dict[str, 'Datalayer'] = {}
+        self._components: t.OrderedDict[
+            t.Tuple, 'Component'
+        ] = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.stats: t.Dict[str, t.Dict[str, float]] = {
+            'datalayer': {'cold': 0, 'warm': 0, 'seconds': 0.0},
+            'component': {'cold': 0, 'warm': 0, 'seconds': 0.0},
+        }
+
+    @staticmethod
+    def _cfg_key(cfg: 'Config') -> str:
+        data = json.dumps(cfg.dict(), sort_keys=True, default=str)
+        return hashlib.sha1(data.encode()).hexdigest()
+
+    def datalayer(self, cfg: 'Config') -> 'Datalayer':
+        """Return the ``Datalayer`` of ``cfg``, connecting it on first use.
+
+        The compute of the ``Datalayer`` is local and runs jobs inline, and
+        local change data capture is off, since otherwise a new cluster,
+        worker pool or CDC thread would be created inside jobs.
+
+        :param cfg: Configuration of the ``Datalayer``
+        """
+        from superduper.base.build import build_datalayer
+
+        key = self._cfg_key(cfg)
+        with self._lock:
+            db = self._datalayers.get(key)
+            if db is not None:
+                self.stats['datalayer']['warm'] += 1
+                return db
+            start = time.perf_counter()
+            db = build_datalayer(
+                cfg=cfg,
+                cluster__compute___path=None,
+                cluster__compute__num_workers=0,
+                cluster__cdc__local=False,
+            )
+            self._datalayers[key] = db
+            self._record('datalayer', time.perf_counter() - start)
+            return db
+
+    def component(self, db: 'Datalayer', type_id: str, identifier: str):
+        """Return the latest version of a component, loading it on first use.
+
+        :param db: ``Datalayer`` of the component
+        :param type_id: Type of the component
+        :param identifier: Identifier of the component
+        """
+        # Reading the metadata is cheap, unlike decoding the artifacts
+        info = db.metadata.get_component(type_id=type_id, identifier=identifier)
+        record = json.dumps(info, sort_keys=True, default=str)
+        key = (
+            id(db),
+            info['uuid'],
+            info['version'],
+            hashlib.sha1(record.encode()).hexdigest(),
+        )
+        with self._lock:
+            component = self._components.get(key)
+            if component is not None:
+                self._components.move_to_end(key)
+                self.stats['component']['warm'] += 1
+                logging.info(f'Warm start of {type_id}.{identifier}')
+                return component
+
+            start = time.perf_counter()
+            component = db.load(type_id, identifier, version=info['version'])
+            component.unpack()
+            self._components[key] = component
+            while len(self._components) > self.max_components:
+                self._components.popitem(last=False)
+            elapsed = time.perf_counter() - start
+            self._record('component', elapsed)
+            logging.info(
+                f'Cold start of {type_id}.{identifier}: loaded in {elapsed:.2f}s'
+            )
+            return component
+
+    def _record(self, kind: str, seconds: float):
+        self.stats[kind]['cold'] += 1
+        self.stats[kind]['seconds'] += seconds
+
+    def clear(self):
+        """Drop the cached ``Datalayer`` instances and components."""
+        with self._lock:
+            self._components.clear()
+            self._datalayers.clear()
+
+
+_runtime: t.Optional[WorkerRuntime] = None
+_runtime_lock = threading.Lock()
+
+
+def get_runtime(cfg: t.Optional['Config'] = None) -> WorkerRuntime:
+    """Return the runtime of the current process.
+
+    :param cfg: Configuration setting the size of the component cache
+    """
+    global _runtime
+    with _runtime_lock:
+        if _runtime is None:
+            from superduper import CFG
+
+            max_components = (cfg or CFG).cluster.compute.max_cached_components
+            _runtime = WorkerRuntime(max_components=max_components)
+        return _runtime
+
+
+def worker_stats() -> t.Dict[str, t.Dict[str, float]]:
+    """Return the cold and warm starts of the runtime of the current process.
+
+    Submit this function to a compute backend to read the stats of a worker.
+    """
+    return get_runtime().stats
@@ -0,0 +1,258 @@
+import asyncio
+import concurrent.futures
+import os
+import random
+import threading
+import time
+import typing as t
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from superduper import CFG, logging
+
+RATE_LIMITED = 429
+TOO_LARGE = 413
+BAD_REQUEST = 400
+# Words of the errors of requests exceeding a token or size limit
+TOO_LARGE_WORDS = ('token', 'too large', 'too long', 'too many', 'maximum')
+
+
+class TokenBucket:
+    """Token-bucket rate limit, shared by all threads of a process.
+
+    :param rate: Number of requests allowed per second
+    :param capacity: Largest burst of requests; defaults to one second's worth
+    """
+
+    def __init__(self, rate: float, capacity: t.Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self) -> float:
+        # Take a token if there is one, else return the time until there is
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    async def acquire(self):
+        """Wait until a request is allowed."""
+        while (wait := self._take()) > 0:
+            await asyncio.sleep(wait)
+
+
+def retry_after(result: t.Any) -> t.Optional[float]:
+    """Return the wait asked for by a rate-limited (HTTP 429) request.
+
+    Returns ``None`` if ``result`` isn't rate-limited, and ``0.0`` if the
+    server doesn't say how long to wait.
+
+    :param result: A ``requests.Response``, or an exception raised by an API
+                   client; clients such as ``openai``, ``anthropic`` and
+                   ``cohere`` set ``status_code`` on their errors
+    """
+    response = getattr(result, 'response', None)
+    status = getattr(result, 'status_code', None)
+    if status is None:
+        status = getattr(response, 'status_code', None)
+    if status != RATE_LIMITED:
+        return None
+    headers = getattr(result, 'headers', None) or getattr(response, 'headers', {})
+    try:
+        return float(headers.get('retry-after', 0.0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def too_large(error: Exception) -> bool:
+    """Return whether a request failed for its size, e.g. too many tokens.
+
+    True for HTTP 413, and for HTTP 400 or errors without a status whose
+    message names a size limit; transient errors (timeouts, HTTP 5xx) and
+    rate-limited requests aren't.
+
+    :param error: An exception raised by an API client
+    """
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    if status == TOO_LARGE:
+        return True
+    if status not in (None, BAD_REQUEST):
+        return False
+    message = str(error).lower()
+    return any(word in message for word in TOO_LARGE_WORDS)
+
+
+class APITransport:
+    """Concurrent requests of API models over a shared connection pool.
+
+    Requests are scheduled on an ``asyncio`` event loop in a background
+    thread, which limits concurrency and rate, and backs off and retries
+    rate-limited requests. The blocking API clients run on a thread pool of
+    ``max_concurrency`` threads, so that no more requests are in flight at
+    once across all API models.
+
+    :param max_concurrency: Largest number of requests in flight
+    :param pool_size: Number of keep-alive connections kept per host
+    :param max_retries: Number of retries of a rate-limited request
+    :param backoff: Wait in seconds before the first retry, doubled per retry
+    :param max_backoff: Longest wait in seconds between retries
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        pool_size: int = 16,
+        max_retries: int = 5,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix='api-transport'
+        )
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name='api-transport-loop', daemon=True
+        )
+        self._thread.start()
+
+    def map(
+        self,
+        fn: t.Callable,
+        items: t.Sequence,
+        concurrency: t.Optional[int] = None,
+        rate_limit: t.Optional[TokenBucket] = None,
+        return_exceptions: bool = False,
+    ) -> t.List:
+        """Call ``fn`` on each item concurrently and return the outputs in order.
+
+        ``fn`` must not call ``map`` itself.
+
+        :param fn: Blocking function making one request
+        :param items: Arguments of ``fn``
+        :param concurrency: Largest number of calls of ``fn`` in flight
+        :param rate_limit: Rate limit of the calls
+        :param return_exceptions: Return the exceptions raised by ``fn`` in
+                                  place of outputs, instead of raising the first
+        """
+        coroutine = self._map(
+            fn,
+            items,
+            concurrency or self.max_concurrency,
+            rate_limit,
+            return_exceptions,
+        )
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    async def _map(self, fn, items, concurrency, rate_limit, return_exceptions):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def call(item):
+            async with semaphore:
+                return await self._call(fn, item, rate_limit)
+
+        return await asyncio.gather(
+            *(call(item) for item in items), return_exceptions=return_exceptions
+        )
+
+    async def _call(self, fn, item, rate_limit):
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries + 1):
+            if rate_limit is not None:
+                await rate_limit.acquire()
+            try:
+                return await loop.run_in_executor(self._executor, fn, item)
+            except Exception as e:
+                wait = retry_after(e)
+                if wait is None or attempt == self.max_retries:
+                    raise
+            await asyncio.sleep(self._backoff(attempt, wait))
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Send an HTTP request on the pooled session, retrying if rate-limited.
+
+        :param method: HTTP method, e.g. ``'GET'``
+        :param url: URL of the request
+        :param kwargs: Keyword arguments of ``requests.Session.request``
+        """
+        attempt = 0
+        while True:
+            response = self.session.request(method, url, **kwargs)
+            wait = retry_after(response)
+            if wait is None or attempt == self.max_retries:
+                return response
+            time.sleep(self._backoff(attempt, wait))
+            attempt += 1
+
+    def _backoff(self, attempt: int, minimum: float) -> float:
+        wait = min(self.max_backoff, self.backoff * 2**attempt)
+        # Jitter spreads out the retries of requests limited at the same time
+        wait = max(minimum, wait * random.uniform(0.5, 1.0))
+        logging.warn(f'API request rate-limited; retrying in {wait:.2f}s')
+        return wait
+
+
+_transport: t.Optional[APITransport] = None
+_rate_limits: t.Dict[t.Tuple[str, float], TokenBucket] = {}
+_lock = threading.Lock()
+
+
+def get_transport() -> APITransport:
+    """Return the transport shared by the API models of the process.
+
+    It is configured by ``CFG.api``.
+    """
+    global _transport
+    with _lock:
+        if _transport is None:
+            _transport = APITransport(**CFG.api.dict())
+        return _transport
+
+
+def _reset_after_fork():
+    # Forked processes don't copy the loop thread of the transport, nor the
+    # state of locks held by other threads
+    global _transport, _lock
+    _transport = None
+    _rate_limits.clear()
+    _lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_rate_limit(key: str, rate: t.Optional[float]) -> t.Optional[TokenBucket]:
+    """Return the rate limit shared by all instances of a model.
+
+    :param key: Identifier of the model
+    :param rate: Requests allowed per second; ``None`` for no limit
+    """
+    if rate is None:
+        return None
+    with _lock:
+        bucket = _rate_limits.get((key, rate))
+        if bucket is None:
+            bucket = _rate_limits[(key, rate)] = TokenBucket(rate)
+        return bucket
@@ -0,0 +1,219 @@
+import bisect
+import concurrent.futures
+import dataclasses as dc
+import queue
+import threading
+import time
+import typing as t
+import weakref
+
+from superduper import logging
+
+# Upper bounds of the histogram buckets
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+QUEUE_TIME_MS_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class Histogram:
+    """Counts of values in buckets with fixed upper bounds.
+
+    :param buckets: Increasing upper bounds of the buckets; larger values
+                    are counted in an overflow bucket
+    """
+
+    def __init__(self, buckets: t.Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+
+    def add(self, value: float):
+        """Count ``value``.
+
+        :param value: The value to count
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+    def dict(self) -> t.Dict[str, int]:
+        """Return the non-empty buckets as a mapping of label to count."""
+        labels = [f'<={b:g}' for b in self.buckets] + [f'>{self.buckets[-1]:g}']
+        return {label: n for label, n in zip(labels, self.counts) if n}
+
+    def __str__(self):
+        n = sum(self.counts)
+        mean = self.total / n if n else 0.0
+        buckets = ' '.join(f'{k}:{v}' for k, v in self.dict().items())
+        return f'mean {mean:.3g} [{buckets}]'
+
+
+@dc.dataclass
+class _Request:
+    data: t.Any
+    future: concurrent.futures.Future
+    enqueued_at: float
+
+
+def _stop(requests: queue.Queue, thread: threading.Thread, lock: threading.Lock):
+    # Under the lock of ``submit``, so that no item is queued after ``None``
+    with lock:
+        requests.put(None)
+    if thread is not threading.current_thread():
+        thread.join(timeout=5)
+
+
+def _no_batcher():
+    return None
+
+
+def _serve(ref: 'weakref.ref[MicroBatcher]', requests: queue.Queue):
+    # Holds the batcher only while processing a batch, so that the batcher
+    # can be collected (and its finalizer stop this thread) when unused
+    try:
+        while True:
+            request = requests.get()
+            if request is None:
+                return
+            batcher = ref()
+            if batcher is None:
+                request.future.set_exception(RuntimeError('Micro-batcher is closed'))
+                return
+            stop = batcher._collect(request)
+            del batcher
+            if stop:
+                return
+    finally:
+        # Items left in the queue are never processed; fail their callers
+        # instead of letting them wait forever
+        while True:
+            try:
+                request = requests.get_nowait()
+            except queue.Empty:
+                break
+            if request is not None:
+                request.future.set_exception(RuntimeError('Micro-batcher is closed'))
+
+
+class MicroBatcher:
+    """Collect concurrent single-item calls into batches.
+
+    Items submitted from any thread are queued; a background thread takes
+    the first waiting item, waits at most ``max_latency`` seconds for up to
+    ``max_batch_size - 1`` more, and calls ``fn`` once on the whole batch.
+    Each caller receives the output of its own item.
+
+    :param fn: Function mapping a list of items to a list of outputs
+    :param max_batch_size: Largest number of items per call of ``fn``
+    :param max_latency: Longest time in seconds an item waits for a batch
+    :param name: Name used in logs
+    """
+
+    # Log the histograms after this many batches
+    _REPORT_EVERY = 1000
+
+    def __init__(
+        self,
+        fn: t.Callable[[t.List], t.List],
+        max_batch_size: int,
+        max_latency: float = 0.005,
+        name: str = 'batcher',
+    ):
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.name = name
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_times_ms = Histogram(QUEUE_TIME_MS_BUCKETS)
+        self._stats_lock = threading.Lock()
+        self._requests: queue.Queue = queue.Queue()
+        self._submit_lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=_serve,
+            args=(weakref.ref(self), self._requests),
+            name=f'{name}-micro-batcher',
+            daemon=True,
+        )
+        self._thread.start()
+        self._finalizer = weakref.finalize(
+            self, _stop, self._requests, self._thread, self._submit_lock
+        )
+
+    def submit(self, data: t.Any) -> t.Any:
+        """Process ``data`` in the next batch and return its output.
+
+        :param data: The item to process
+        """
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        with self._submit_lock:
+            if not self._finalizer.alive:
+                raise RuntimeError(f'{self.name} micro-batcher is closed')
+            self._requests.put(_Request(data, future, time.monotonic()))
+        return future.result()
+
+    def _collect(self, request: _Request) -> bool:
+        # Wait for the rest of the batch of ``request`` and process it;
+        # returns whether the batcher was stopped meanwhile
+        batch = [request]
+        deadline = request.enqueued_at + self.max_latency
+        stop = False
+        while len(batch) < self.max_batch_size:
+            try:
+                request = self._requests.get(
+                    timeout=max(0.0, deadline - time.monotonic())
+                )
+            except queue.Empty:
+                break
+            if request is None:
+                stop = True
+                break
+            batch.append(request)
+        self._process(batch)
+        return stop
+
+    def _process(self, batch: t.List[_Request]):
+        started_at = time.monotonic()
+        with self._stats_lock:
+            self.batch_sizes.add(len(batch))
+            for request in batch:
+                self.queue_times_ms.add(1000 * (started_at - request.enqueued_at))
+            n_batches = sum(self.batch_sizes.counts)
+        if n_batches % self._REPORT_EVERY == 0:
+            self.report()
+        try:
+            outputs = self.fn([request.data for request in batch])
+            if len(outputs) != len(batch):
+                raise ValueError(
+                    f'Expected {len(batch)} outputs, got {len(outputs)} outputs'
+                )
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+            return
+        for request, output in zip(batch, outputs):
+            request.future.set_result(output)
+
+    @property
+    def stats(self) -> t.Dict[str, t.Dict[str, int]]:
+        """Histograms of the batch sizes and of the queue times in ms."""
+        with self._stats_lock:
+            return {
+                'batch_size': self.batch_sizes.dict(),
+                'queue_time_ms': self.queue_times_ms.dict(),
+            }
+
+    def report(self):
+        """Log the histograms of the batch sizes and queue times."""
+        with self._stats_lock:
+            logging.info(
+                f'{self.name} micro-batches: batch size {self.batch_sizes}; '
+                f'queue time (ms) {self.queue_times_ms}'
+            )
+
+    def close(self):
+        """Process the queued items and stop the background thread."""
+        if self._finalizer.alive and any(self.batch_sizes.counts):
+            self.report()
+        self._finalizer()
+
+    def __reduce__(self):
+        # Copies of the owner of the batcher start their own batcher
+        return _no_batcher, ()
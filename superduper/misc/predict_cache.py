@@ -0,0 +1,301 @@
+import collections
+import hashlib
+import os
+import pickle
+import shutil
+import threading
+import typing as t
+from abc import ABC, abstractmethod
+
+import numpy
+
+from superduper import CFG, logging
+
+if t.TYPE_CHECKING:
+    from superduper.backends.base.artifacts import ArtifactStore
+    from superduper.components.model import Model
+
+MISSING = object()
+
+
+def hash_input(data: t.Any) -> t.Optional[str]:
+    """Hash the mapped inputs of a model by their content.
+
+    Equal inputs have equal hashes in every process, so that outputs cached
+    by one process are found by others. Returns ``None`` for inputs which
+    can't be hashed.
+
+    :param data: Model inputs, as returned by ``Mapping.__call__``
+    """
+    try:
+        bytes_ = _canonical(data)
+    except Exception:
+        return None
+    return hashlib.sha256(bytes_).hexdigest()
+
+
+def _chunk(tag: bytes, payload: bytes) -> bytes:
+    return tag + len(payload).to_bytes(8, 'big') + payload
+
+
+def _canonical(data: t.Any) -> bytes:
+    # Unlike pickle, the encoding doesn't depend on the order of insertion
+    # into dicts, the iteration order of sets, which differs between
+    # processes, or the memory layout of arrays
+    if isinstance(data, (numpy.ndarray, numpy.generic)):
+        array = numpy.ascontiguousarray(data)
+        if array.dtype.hasobject:
+            payload = _canonical(array.tolist())
+        else:
+            payload = array.tobytes()
+        header = f'{array.dtype.str}{array.shape}'.encode()
+        return _chunk(b'a', _chunk(b'h', header) + payload)
+    if isinstance(data, str):
+        return _chunk(b's', data.encode())
+    if isinstance(data, (bytes, bytearray)):
+        return _chunk(b'b', bytes(data))
+    if data is None or isinstance(data, (bool, int, float, complex)):
+        return _chunk(b'n', f'{type(data).__name__}:{data!r}'.encode())
+    if isinstance(data, dict):
+        items = sorted(_canonical(k) + _canonical(v) for k, v in data.items())
+        return _chunk(b'd', b''.join(items))
+    if isinstance(data, (set, frozenset)):
+        return _chunk(b'e', b''.join(sorted(_canonical(x) for x in data)))
+    if isinstance(data, (list, tuple)):
+        tag = b'l' if isinstance(data, list) else b't'
+        return _chunk(tag, b''.join(_canonical(x) for x in data))
+    if hasattr(data, '__array__'):
+        # e.g. tensors, tagged with their type as their outputs may differ
+        type_ = f'{type(data).__module__}.{type(data).__qualname__}'.encode()
+        return _chunk(b'o', _chunk(b'h', type_) + _canonical(numpy.asarray(data)))
+    return _chunk(b'p', pickle.dumps(data, protocol=4))
+
+
+class PredictCache(ABC):
+    """Cache of model outputs, keyed by a hash of the model inputs.
+
+    :param namespace: Prefix of the keys, identifying the model version
+    """
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        self.stats: t.Dict[str, t.Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def key(self, input_hash: str) -> str:
+        """Return the cache key of model inputs.
+
+        :param input_hash: Hash of the model inputs, see ``hash_input``
+        """
+        return hashlib.sha256(f'{self.namespace}/{input_hash}'.encode()).hexdigest()
+
+    @abstractmethod
+    def get(self, key: str) -> t.Any:
+        """Return the cached output of ``key``, or ``MISSING``.
+
+        :param key: Cache key
+        """
+        pass
+
+    @abstractmethod
+    def put(self, key: str, output: t.Any):
+        """Cache the output of ``key``.
+
+        :param key: Cache key
+        :param output: Model output
+        """
+        pass
+
+    @abstractmethod
+    def clear(self):
+        """Drop all cached outputs."""
+        pass
+
+    def record(self, predict_id: str, hits: int, misses: int):
+        """Count cache hits and misses of the outputs ``predict_id``.
+
+        :param predict_id: Identifier of the outputs, e.g. a listener uuid
+        :param hits: Number of cached outputs
+        :param misses: Number of computed outputs
+        """
+        with self._lock:
+            stats = self.stats.setdefault(predict_id, {'hits': 0, 'misses': 0})
+            stats['hits'] += hits
+            stats['misses'] += misses
+            total = stats['hits'] + stats['misses']
+            logging.info(
+                f'Prediction cache of {predict_id}: {hits}/{hits + misses} hits, '
+                f'{stats["hits"] / max(total, 1):.1%} of {total} overall'
+            )
+
+
+class MemoryPredictCache(PredictCache):
+    """In-process least-recently-used cache of model outputs.
+
+    :param namespace: Prefix of the keys, identifying the model version
+    :param max_size: Maximum number of cached outputs
+    """
+
+    def __init__(self, namespace: str, max_size: int = 100000):
+        super().__init__(namespace)
+        self.max_size = max_size
+        self._outputs: t.OrderedDict[str, t.Any] = collections.OrderedDict()
+
+    def get(self, key: str) -> t.Any:
+        """Return the cached output of ``key``, or ``MISSING``.
+
+        :param key: Cache key
+        """
+        with self._lock:
+            if key not in self._outputs:
+                return MISSING
+            self._outputs.move_to_end(key)
+            return self._outputs[key]
+
+    def put(self, key: str, output: t.Any):
+        """Cache the output of ``key``.
+
+        :param key: Cache key
+        :param output: Model output
+        """
+        with self._lock:
+            self._outputs[key] = output
+            self._outputs.move_to_end(key)
+            while len(self._outputs) > self.max_size:
+                self._outputs.popitem(last=False)
+
+    def clear(self):
+        """Drop all cached outputs."""
+        with self._lock:
+            self._outputs.clear()
+
+
+class DiskPredictCache(PredictCache):
+    """Cache of model outputs in pickle files in a local directory.
+
+    :param namespace: Prefix of the keys, identifying the model version
+    :param path: Directory of the cached outputs of this model version
+    """
+
+    def __init__(self, namespace: str, path: str):
+        super().__init__(namespace)
+        self.path = path
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], f'{key}.pkl')
+
+    def get(self, key: str) -> t.Any:
+        """Return the cached output of ``key``, or ``MISSING``.
+
+        :param key: Cache key
+        """
+        try:
+            with open(self._file(key), 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return MISSING
+
+    def put(self, key: str, output: t.Any):
+        """Cache the output of ``key``.
+
+        :param key: Cache key
+        :param output: Model output
+        """
+        file = self._file(key)
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        # Written under a temporary name, so that readers never see a
+        # partially written file
+        tmp = f'{file}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(output, f, protocol=4)
+        os.replace(tmp, file)
+
+    def clear(self):
+        """Drop all cached outputs."""
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class ArtifactStorePredictCache(PredictCache):
+    """Cache of model outputs in the artifact store of the datalayer.
+
+    The artifact store can't list or overwrite files, so the keys include a
+    generation number, and ``clear`` moves on to the next generation by
+    saving an empty marker file for it.
+
+    :param namespace: Prefix of the keys, identifying the model version
+    :param artifact_store: Artifact store to save the outputs in
+    """
+
+    def __init__(self, namespace: str, artifact_store: 'ArtifactStore'):
+        self.artifact_store = artifact_store
+        self._base_namespace = namespace
+        super().__init__(f'{namespace}/{self._generation()}')
+
+    def _marker_id(self, generation: int) -> str:
+        key = f'{self._base_namespace}/predict_cache/{generation}'
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def _generation(self) -> int:
+        generation = 0
+        while self.artifact_store.exists(file_id=self._marker_id(generation + 1)):
+            generation += 1
+        return generation
+
+    def get(self, key: str) -> t.Any:
+        """Return the cached output of ``key``, or ``MISSING``.
+
+        :param key: Cache key
+        """
+        if not self.artifact_store.exists(file_id=key):
+            return MISSING
+        return pickle.loads(self.artifact_store.get_bytes(key))
+
+    def put(self, key: str, output: t.Any):
+        """Cache the output of ``key``.
+
+        :param key: Cache key
+        :param output: Model output
+        """
+        self.artifact_store.put_bytes(pickle.dumps(output, protocol=4), key)
+
+    def clear(self):
+        """Drop all cached outputs."""
+        generation = self._generation() + 1
+        self.artifact_store.put_bytes(b'', self._marker_id(generation))
+        self.namespace = f'{self._base_namespace}/{generation}'
+
+
+_caches: t.Dict[t.Tuple[str, str], PredictCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_predict_cache(model: 'Model') -> PredictCache:
+    """Return the prediction cache of the current version of ``model``.
+
+    Caches are shared by all instances of a model version in a process.
+
+    :param model: Model with ``predict_cache`` set
+    """
+    kind = model.predict_cache
+    assert kind is not None
+    namespace = f'{model.uuid}/{model.version}'
+    with _caches_lock:
+        cache = _caches.get((kind, namespace))
+        if cache is None:
+            cache = _caches[(kind, namespace)] = _build_predict_cache(
+                kind, namespace, model
+            )
+        return cache
+
+
+def _build_predict_cache(kind: str, namespace: str, model: 'Model') -> PredictCache:
+    if kind == 'memory':
+        return MemoryPredictCache(namespace)
+    if kind == 'disk':
+        path = os.path.join(CFG.predict_cache_home, namespace.replace('/', '-'))
+        return DiskPredictCache(namespace, path)
+    if kind == 'artifact_store':
+        return ArtifactStorePredictCache(namespace, model.db.artifact_store)
+    raise ValueError(
+        f'Unknown prediction cache {kind!r}; expected memory, disk or artifact_store'
+    )
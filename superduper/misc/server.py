@@ -1,8 +1,14 @@
 import base64
 import json
+import os
+import struct
+import typing as t
 from functools import lru_cache
 
+import numpy
+import numpy.typing
 import requests
+from requests.adapters import HTTPAdapter
 
 from superduper import CFG, logging
 from superduper.base import exceptions
@@ -10,6 +16,11 @@ from superduper.misc.auto_schema import DEFAULT_DATATYPE
 
 primitives = (bool, str, int, float, type(None), list, dict)
 
+VECTORS_CONTENT_TYPE = 'application/x-superduper-vectors'
+# magic, number of vectors, dimensions
+_VECTORS_HEADER = struct.Struct('<4sII')
+_VECTORS_MAGIC = b'SDV1'
+
 
 @lru_cache(maxsize=None)
 def _handshake(service: str):
@@ -18,10 +29,60 @@ def _handshake(service: str):
     _request_server(service, args={'cfg': cfg}, endpoint=endpoint)
 
 
+@lru_cache(maxsize=None)
+def _session(pid: int) -> requests.Session:
+    # One session per process, since pooled connections are not fork-safe
+    session = requests.Session()
+    session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+    return session
+
+
+def encode_vectors(
+    vectors: numpy.typing.ArrayLike, ids: t.Optional[t.Sequence[str]] = None
+) -> bytes:
+    """Encode vectors in the binary format of the vector-search service.
+
+    The payload is a header with the number of vectors and dimensions,
+    the vectors as a little-endian ``float32`` buffer and, optionally,
+    the ids as a JSON list.
+
+    :param vectors: 2-D array of vectors, one per row
+    :param ids: Ids of the vectors
+    """
+    h = numpy.ascontiguousarray(vectors, dtype='<f4')
+    if h.ndim == 1:
+        h = h[None, :]
+    header = _VECTORS_HEADER.pack(_VECTORS_MAGIC, h.shape[0], h.shape[1])
+    trailer = json.dumps(list(ids)).encode() if ids is not None else b''
+    return header + h.tobytes() + trailer
+
+
+def decode_vectors(
+    payload: bytes,
+) -> t.Tuple[numpy.ndarray, t.Optional[t.List[str]]]:
+    """Decode vectors encoded with ``encode_vectors``.
+
+    The returned array is a read-only view of ``payload``.
+
+    :param payload: Encoded vectors
+    """
+    magic, n, dimensions = _VECTORS_HEADER.unpack_from(payload)
+    if magic != _VECTORS_MAGIC:
+        raise ValueError('Payload is not in the binary vectors format')
+    offset = _VECTORS_HEADER.size
+    h = numpy.frombuffer(payload, dtype='<f4', count=n * dimensions, offset=offset)
+    trailer = payload[offset + h.nbytes :]
+    ids = json.loads(trailer) if trailer else None
+    return h.reshape(n, dimensions), ids
+
+
 def server_request_decoder(x):
     """
     Decodes a request to `SuperDuperApp` service.
 
+    Binary vector payloads (``VECTORS_CONTENT_TYPE``) are decoded with
+    ``decode_vectors`` instead.
+
     :param x: Object to decode.
     """
     x = x['_b64data']
@@ -52,19 +113,28 @@ def _request_server(
     url = service_uri + '/' + endpoint
     logging.debug(f'Trying to connect {service} at {url} method: {type}')
 
+    session = _session(os.getpid())
     if type == 'post':
-        if data is not None:
-            # TODO: Please use Document.encode with autoschema.
-            # TODO: This is too implicit and hard to read
-            # suggestion: add a parameter
-
-            if not isinstance(data, primitives):
-                data = _server_request_encoder(data)
-
-        response = requests.post(url, json=data, params=args)
+        if isinstance(data, bytes):
+            response = session.post(
+                url,
+                data=data,
+                params=args,
+                headers={'Content-Type': VECTORS_CONTENT_TYPE},
+            )
+        else:
+            if data is not None:
+                # TODO: Please use Document.encode with autoschema.
+                # TODO: This is too implicit and hard to read
+                # suggestion: add a parameter
+
+                if not isinstance(data, primitives):
+                    data = _server_request_encoder(data)
+
+            response = session.post(url, json=data, params=args)
         result = json.loads(response.content)
     else:
-        response = requests.get(url, params=args)
+        response = session.get(url, params=args)
         result = None
     if response.status_code != 200:
         error = json.loads(response.content)
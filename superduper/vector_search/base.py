@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import enum
+import inspect
 import typing as t
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
@@ -8,6 +9,8 @@ from dataclasses import dataclass
 import numpy
 import numpy.typing
 
+from superduper import CFG, logging
+
 if t.TYPE_CHECKING:
     from superduper.components.vector_index import VectorIndex
 
@@ -40,9 +43,24 @@ class BaseVectorSearcher(ABC):
         :param vi: VectorIndex instance
         """
         return cls(
-            identifier=vi.identifier, dimensions=vi.dimensions, measure=vi.measure
+            **cls._searcher_kwargs(
+                identifier=vi.identifier, dimensions=vi.dimensions, measure=vi.measure
+            )
         )
 
+    @classmethod
+    def _searcher_kwargs(cls, **defaults) -> t.Dict[str, t.Any]:
+        # ``CFG.cluster.vector_search.searcher_kwargs`` override ``defaults``
+        # (e.g. settings of the vector index); those ``cls`` doesn't take,
+        # e.g. settings of in-memory searchers given to lance, are dropped
+        parameters = inspect.signature(cls.__init__).parameters
+        configured = CFG.cluster.vector_search.searcher_kwargs
+        kwargs = {k: v for k, v in configured.items() if k in parameters}
+        if len(kwargs) < len(configured):
+            ignored = sorted(set(configured) - set(kwargs))
+            logging.warn(f'{cls.__name__} ignores searcher_kwargs {ignored}')
+        return {**defaults, **kwargs}
+
     @abstractmethod
     def __len__(self):
         pass
@@ -118,6 +136,54 @@ class BaseVectorSearcher(ABC):
         :param within_ids: list of ids to search within
         """
 
+    def find_nearest_from_arrays(
+        self,
+        h: numpy.typing.ArrayLike,
+        n: int = 100,
+        within_ids: t.Sequence[str] = (),
+    ) -> t.List[t.Tuple[t.List[str], t.List[float]]]:
+        """
+        Find the nearest vectors to each of the given vectors.
+
+        Searchers which can score several queries at once should override
+        this method; by default each query is searched separately.
+
+        :param h: 2-D array of vectors, one query per row
+        :param n: number of nearest vectors to return per query
+        :param within_ids: list of ids to search within
+        """
+        return [
+            self.find_nearest_from_array(x, n=n, within_ids=within_ids)
+            for x in self.to_numpy(h)
+        ]
+
+    def save_snapshot(self, path: str, watermark: t.Optional[t.Dict] = None):
+        """Persist the vectors of the index to ``path``.
+
+        Searchers which do not keep their vectors in process memory
+        need not implement snapshots.
+
+        :param path: Directory of the snapshot
+        :param watermark: Information describing when the snapshot was taken
+        """
+
+    def snapshot_watermark(self, path: str) -> t.Dict:
+        """Return the watermark the snapshot at ``path`` was saved with.
+
+        :param path: Directory of the snapshot
+        """
+        return {}
+
+    def load_snapshot(self, path: str) -> t.Optional[t.List[str]]:
+        """Restore the vectors of the index from a snapshot at ``path``.
+
+        Returns the ids of the restored vectors, or ``None`` if no
+        usable snapshot was found.
+
+        :param path: Directory of the snapshot
+        """
+        return None
+
     def post_create(self):
         """Post create method.
 
@@ -126,6 +192,52 @@ class BaseVectorSearcher(ABC):
         """
 
 
+class VectorFilter:
+    """Restriction of a vector search to a subset of the stored vectors.
+
+    ``within_ids`` are resolved once to row positions of the searcher; the
+    filter is then applied either by scoring only those rows, or as a
+    boolean mask over the scores, so the stored vectors are never copied.
+    Ids which are not stored in the searcher are ignored.
+
+    :param rows: Sorted row positions of the ids in the searcher
+    :param size: Number of rows stored by the searcher
+    """
+
+    def __init__(self, rows: numpy.ndarray, size: int):
+        self.rows = rows
+        self.size = size
+
+    @classmethod
+    def from_ids(cls, within_ids: t.Iterable[str], lookup: t.Dict[str, int], size: int):
+        """Build a filter from ids, given the id to row lookup of a searcher.
+
+        :param within_ids: ids to search within
+        :param lookup: mapping of ids to row positions
+        :param size: number of rows stored by the searcher
+        """
+        rows = numpy.fromiter(
+            (lookup.get(str(_id), -1) for _id in within_ids), dtype=numpy.int64
+        )
+        rows = numpy.unique(rows[rows >= 0])
+        return cls(rows, size)
+
+    def __len__(self):
+        return self.rows.shape[0]
+
+    @property
+    def selectivity(self) -> float:
+        """Fraction of the stored rows which pass the filter."""
+        return len(self) / self.size if self.size else 0.0
+
+    @property
+    def mask(self) -> numpy.ndarray:
+        """Boolean mask over the stored rows."""
+        mask = numpy.zeros(self.size, dtype=bool)
+        mask[self.rows] = True
+        return mask
+
+
 class VectorIndexMeasureType(str, enum.Enum):
     """Enum for vector index measure types # noqa."""
 
@@ -171,7 +283,10 @@ def l2(x, y):
     :param x: numpy.ndarray
     :param y: numpy.ndarray
     """
-    return numpy.array([-numpy.linalg.norm(x - y, axis=1)])
+    squared = (
+        (x**2).sum(axis=1)[:, None] + (y**2).sum(axis=1)[None, :] - 2 * dot(x, y)
+    )
+    return -numpy.sqrt(numpy.maximum(squared, 0))
 
 
 def dot(x, y):
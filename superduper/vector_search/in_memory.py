@@ -1,24 +1,57 @@
+import json
+import os
+import shutil
+import tempfile
 import typing as t
 
 import numpy
 
 from superduper import logging
-from superduper.vector_search.base import BaseVectorSearcher, VectorItem, measures
+from superduper.vector_search.base import (
+    BaseVectorSearcher,
+    VectorFilter,
+    VectorItem,
+    measures,
+)
+
+if t.TYPE_CHECKING:
+    from superduper.components.vector_index import VectorIndex
 
 
 class InMemoryVectorSearcher(BaseVectorSearcher):
     """
     Simple hash-set for looking up with vector similarity.
 
+    Vectors are kept in a preallocated ``float32`` matrix whose capacity
+    doubles when full. Upserts overwrite rows in place, deletes only mark
+    rows as deleted, and the matrix is compacted once the fraction of
+    deleted rows exceeds ``compaction_threshold``.
+
+    With ``quantization`` the matrix is stored as ``float16``, or as ``int8``
+    with one scale per vector, and scored in blocks converted back to
+    ``float32``. With ``rerank_factor`` the ``rerank_factor * n`` best
+    candidates are re-scored against full-precision copies of the vectors,
+    which are kept in a memory-mapped temporary file.
+
     :param identifier: Unique string identifier of index
     :param dimensions: Dimension of the vector embeddings
     :param h: array/ tensor of vectors
     :param index: list of IDs
     :param measure: measure to assess similarity
+    :param compaction_threshold: Fraction of deleted rows triggering compaction
+    :param quantization: Storage precision of the vectors (float16|int8)
+    :param rerank_factor: Re-rank this many candidates per result at full
+                          precision (0 disables re-ranking)
     """
 
     name = 'vanilla'
 
+    # Filters matching fewer rows than this fraction are scored row by row
+    _GATHER_SELECTIVITY = 0.01
+    # Quantized vectors are converted to float32 in blocks of this many rows
+    _SCORE_BLOCK_SIZE = 65536
+    _DTYPES = {None: numpy.float32, 'float16': numpy.float16, 'int8': numpy.int8}
+
     def __init__(
         self,
         identifier: str,
@@ -26,51 +59,220 @@ class InMemoryVectorSearcher(BaseVectorSearcher):
         h: t.Optional[numpy.ndarray] = None,
         index: t.Optional[t.List[str]] = None,
         measure: t.Union[str, t.Callable] = 'cosine',
+        compaction_threshold: float = 0.25,
+        quantization: t.Optional[str] = None,
+        rerank_factor: int = 0,
     ):
+        if quantization not in self._DTYPES:
+            raise ValueError(
+                f'Unsupported quantization {quantization}, '
+                f'expected one of {list(self._DTYPES)}'
+            )
         self.identifier = identifier
         self.dimensions = dimensions
-        self._cache: t.Sequence[VectorItem] = []
+        self.compaction_threshold = compaction_threshold
+        self.quantization = quantization
+        self.rerank_factor = rerank_factor
+        self._cache: t.List[VectorItem] = []
         self._CACHE_SIZE = 10000
 
+        self.measure_name = measure if isinstance(measure, str) else None
         self.measure = measure
         if isinstance(measure, str):
             self.measure = measures[measure]
 
+        self._reset(capacity=0, dimensions=dimensions)
         if h is not None:
             assert index is not None
             self._setup(h, index)
-        else:
-            self.h = None
-            self.index = None
-            self.lookup = None
 
-        self.identifier = identifier
+    @classmethod
+    def from_component(cls, vi: 'VectorIndex'):
+        """Create a vector searcher from a vector index.
+
+        :param vi: VectorIndex instance
+        """
+        return cls(
+            **cls._searcher_kwargs(
+                identifier=vi.identifier,
+                dimensions=vi.dimensions,
+                measure=vi.measure,
+                quantization=vi.quantization,
+                rerank_factor=vi.rerank_factor,
+            )
+        )
 
     def __len__(self):
-        if self.h is not None:
-            return self.h.shape[0]
-        else:
-            return 0
+        return self._n - self._n_deleted
+
+    @property
+    def h(self) -> t.Optional[numpy.ndarray]:
+        """The stored rows as ``float32``, including rows marked as deleted."""
+        if self._n == 0:
+            return None
+        return self._decode(slice(0, self._n))
+
+    @property
+    def _reranking(self) -> bool:
+        return self.quantization is not None and self.rerank_factor > 0
+
+    def _allocate(self, capacity: int) -> numpy.ndarray:
+        """Allocate storage for ``capacity`` vectors.
+
+        :param capacity: Number of vectors
+        """
+        return numpy.zeros(
+            (capacity, self._dimensions), dtype=self._DTYPES[self.quantization]
+        )
+
+    def _reset(self, capacity: int, dimensions: int):
+        self._dimensions = dimensions
+        self._h = self._allocate(capacity)
+        self._scale = (
+            numpy.ones(capacity, dtype=numpy.float32)
+            if self.quantization == 'int8'
+            else None
+        )
+        self._full = self._disk_array(capacity, dimensions) if self._reranking else None
+        self._deleted = numpy.zeros(capacity, dtype=bool)
+        self._n = 0
+        self._n_deleted = 0
+        self.index: t.List[t.Optional[str]] = []
+        self.lookup: t.Dict[str, int] = {}
 
     def _setup(self, h, index):
-        h = numpy.array(h) if not isinstance(h, numpy.ndarray) else h
+        h = numpy.asarray(h)
+        self._reset(capacity=len(index), dimensions=h.shape[1])
+        self._write(h, index)
+
+    def _reserve(self, size: int):
+        capacity = self._h.shape[0]
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity)
+        h = self._allocate(capacity)
+        h[: self._n] = self._h[: self._n]
+        deleted = numpy.zeros(capacity, dtype=bool)
+        deleted[: self._n] = self._deleted[: self._n]
+        self._h, self._deleted = h, deleted
+        if self._scale is not None:
+            scale = numpy.ones(capacity, dtype=numpy.float32)
+            scale[: self._n] = self._scale[: self._n]
+            self._scale = scale
+        if self._full is not None:
+            full = self._disk_array(capacity, self._dimensions)
+            full[: self._n] = self._full[: self._n]
+            self._full = full
+
+    @staticmethod
+    def _disk_array(capacity: int, dimensions: int) -> numpy.ndarray:
+        # The full-precision vectors are only read to re-rank candidates,
+        # so they live in a temporary file and are paged in on demand.
+        return numpy.memmap(
+            tempfile.TemporaryFile(),
+            dtype=numpy.float32,
+            mode='w+',
+            shape=(max(capacity, 1), dimensions),
+        )
+
+    def _store(self, rows: numpy.ndarray, h: numpy.ndarray):
+        if self._full is not None:
+            self._full[rows] = h
+        if self._scale is not None:
+            scale = numpy.abs(h).max(axis=1) / 127
+            scale[scale == 0] = 1
+            self._h[rows] = numpy.rint(h / scale[:, None])
+            self._scale[rows] = scale
+        else:
+            self._h[rows] = h
+
+    def _decode(self, rows) -> numpy.ndarray:
+        """The stored vectors of ``rows`` as ``float32``.
 
-        if self.measure == 'cosine':
+        :param rows: Row indices or slice of the rows
+        """
+        h = self._h[rows].astype(numpy.float32, copy=False)
+        if self._scale is not None:
+            h = h * self._scale[rows, None]
+        return h
+
+    def _score(self, h: numpy.ndarray, rows=None) -> numpy.ndarray:
+        """Similarities of the queries ``h`` to the stored ``rows``.
+
+        :param h: 2-D array of vectors, one query per row
+        :param rows: Row indices to score (defaults to all stored rows)
+        """
+        if self.quantization is None:
+            return self.measure(
+                h, self._h[: self._n] if rows is None else self._h[rows]
+            )
+        n = self._n if rows is None else len(rows)
+        similarities = numpy.empty((h.shape[0], n), dtype=numpy.float32)
+        for start in range(0, n, self._SCORE_BLOCK_SIZE):
+            stop = min(start + self._SCORE_BLOCK_SIZE, n)
+            block = slice(start, stop) if rows is None else rows[start:stop]
+            similarities[:, start:stop] = self.measure(h, self._decode(block))
+        return similarities
+
+    def _write(self, h: numpy.ndarray, index: t.Sequence[str]) -> numpy.ndarray:
+        """Upsert rows; ids which are already stored are overwritten in place.
+
+        :param h: vectors to write, one per id
+        :param index: ids of the vectors
+        """
+        if self._n == 0 and h.shape[1] != self._dimensions:
+            self._reset(capacity=len(index), dimensions=h.shape[1])
+
+        h = h.astype(numpy.float32, copy=False)
+        if self.measure_name == 'cosine':
             # Normalization is required for cosine, hence preparing
             # all vectors in advance.
             h = h / numpy.linalg.norm(h, axis=1)[:, None]
-        self.h = h
-        self.index = index
-        self.lookup = dict(zip(index, range(len(index))))
 
-    def find_nearest_from_id(self, _id, n=100):
+        rows = numpy.empty(len(index), dtype=numpy.int64)
+        n_new = 0
+        for i, _id in enumerate(index):
+            row = self.lookup.get(_id)
+            if row is None:
+                row = self._n + n_new
+                self.lookup[_id] = row
+                self.index.append(_id)
+                n_new += 1
+            rows[i] = row
+
+        self._reserve(self._n + n_new)
+        self._store(rows, h)
+        self._n += n_new
+        self._on_write(rows)
+        return rows
+
+    def _on_write(self, rows: numpy.ndarray):
+        """Hook called after ``rows`` have been written."""
+
+    def _on_delete(self, rows: numpy.ndarray):
+        """Hook called after ``rows`` have been marked as deleted."""
+
+    def _on_compact(self, keep: numpy.ndarray):
+        """Hook called after compaction, with the mask of the kept rows."""
+
+    def find_nearest_from_id(self, _id, n=100, within_ids=None):
         """Find the nearest vectors to the given ID.
 
         :param _id: ID of the vector
         :param n: number of nearest vectors to return
+        :param within_ids: list of IDs to search within
+        """
+        return self.find_nearest_from_array(
+            self.get_vector(_id), n=n, within_ids=within_ids
+        )
+
+    def get_vector(self, _id: str) -> numpy.ndarray:
+        """Return the stored vector of an ID.
+
+        :param _id: ID of the vector
         """
         self.post_create()
-        return self.find_nearest_from_array(self.h[self.lookup[_id]], n=n)
+        return self._decode(self.lookup[_id])
 
     def find_nearest_from_array(self, h, n=100, within_ids=None):
         """Find the nearest vectors to the given vector.
@@ -79,49 +281,132 @@ class InMemoryVectorSearcher(BaseVectorSearcher):
         :param n: number of nearest vectors to return
         :param within_ids: list of IDs to search within
         """
+        h = self.to_numpy(h)[None, :]
+        return self.find_nearest_from_arrays(h, n=n, within_ids=within_ids)[0]
+
+    def find_nearest_from_arrays(self, h, n=100, within_ids=None):
+        """Find the nearest vectors to each of the given vectors.
+
+        All queries are scored with a single ``(q, N)`` similarity matrix,
+        and only the top ``n`` entries of each row are selected and sorted.
+
+        :param h: 2-D array of vectors, one query per row
+        :param n: number of nearest vectors to return per query
+        :param within_ids: list of IDs to search within
+        """
         self.post_create()
 
-        if self.h is None:
+        h = self.to_numpy(h).astype(numpy.float32, copy=False)
+        if not len(self):
             logging.error(
                 'Tried to search on an empty vector database',
                 'Vectors are not yet loaded in vector database.',
                 '\nPlease check if model outputs are ready.',
             )
-            return [], []
+            return [([], []) for _ in range(h.shape[0])]
 
-        h = self.to_numpy(h)[None, :]
+        vector_filter = None
         if within_ids:
-            ix = list(map(self.lookup.__getitem__, within_ids))
-            similarities = self.measure(h, self.h[ix, :])  # mypy: ignore
+            vector_filter = VectorFilter.from_ids(within_ids, self.lookup, self._n)
+        return self._search(h, n=n, vector_filter=vector_filter)
+
+    def _search(
+        self,
+        h: numpy.ndarray,
+        n: int,
+        vector_filter: t.Optional[VectorFilter] = None,
+    ) -> t.List[t.Tuple[t.List[str], t.List[float]]]:
+        """Exact search of the queries ``h``, restricted by ``vector_filter``.
+
+        Small filters score only the matching rows; larger filters score
+        all rows and mask out the others, which avoids copying vectors.
+
+        :param h: 2-D array of vectors, one query per row
+        :param n: number of nearest vectors to return per query
+        :param vector_filter: optional restriction of the searched rows
+        """
+        ix = None
+        if vector_filter is None:
+            similarities = self._score(h)
+            if self._n_deleted:
+                similarities[:, self._deleted[: self._n]] = -numpy.inf
+                n = min(n, len(self))
+        elif vector_filter.selectivity < self._GATHER_SELECTIVITY:
+            ix = vector_filter.rows
+            similarities = self._score(h, ix)
         else:
-            similarities = self.measure(h, self.h)  # mypy: ignore
-        similarities = similarities[0, :]
+            similarities = self._score(h)
+            similarities[:, ~vector_filter.mask] = -numpy.inf
+            n = min(n, len(vector_filter))
         logging.debug(similarities)
-        scores = -numpy.sort(-similarities)
-        ## different ways of handling
-        if within_ids:
-            top_n_idxs = numpy.argsort(-similarities)[:n]
-            ix = [ix[i] for i in top_n_idxs]
+
+        top, scores = self._select(h, similarities, n, ix)
+        return [
+            ([self.index[i] for i in row], row_scores)
+            for row, row_scores in zip(top.tolist(), scores.tolist())
+        ]
+
+    def _select(
+        self,
+        h: numpy.ndarray,
+        similarities: numpy.ndarray,
+        n: int,
+        rows: t.Optional[numpy.ndarray] = None,
+    ) -> t.Tuple[numpy.ndarray, numpy.ndarray]:
+        """Select the rows of the ``n`` best results of each query.
+
+        :param h: 2-D array of vectors, one query per row
+        :param similarities: ``(q, N)`` matrix of similarity scores
+        :param n: number of results to select per query
+        :param rows: rows scored by the columns of ``similarities``
+                     (defaults to all stored rows)
+        """
+        if not self._reranking:
+            top, scores = self._top_n(similarities, n)
+            return (top if rows is None else rows[top]), scores
+
+        top, scores = self._top_n(similarities, n * self.rerank_factor)
+        if rows is not None:
+            top = rows[top]
+        assert self._full is not None
+        exact = numpy.stack(
+            [self.measure(q[None, :], self._full[r])[0] for q, r in zip(h, top)]
+        )
+        # Keep excluded rows (deleted or filtered out) excluded
+        exact[numpy.isneginf(scores)] = -numpy.inf
+        order, scores = self._top_n(exact, n)
+        return numpy.take_along_axis(top, order, axis=1), scores
+
+    @staticmethod
+    def _top_n(similarities: numpy.ndarray, n: int):
+        """Select the ``n`` highest scores of each row, in descending order.
+
+        :param similarities: ``(q, N)`` matrix of similarity scores
+        :param n: number of results to select per row
+        """
+        n = min(n, similarities.shape[1])
+        if n == 0:
+            empty = numpy.empty((similarities.shape[0], 0), dtype=numpy.int64)
+            return empty, similarities[:, :0]
+        if n < similarities.shape[1]:
+            top = numpy.argpartition(-similarities, n - 1, axis=1)[:, :n]
         else:
-            ix = numpy.argsort(-similarities)[:n]
-            ix = ix.tolist()
-        scores = scores.tolist()
-        _ids = [self.index[i] for i in ix]
-        return _ids, scores
+            top = numpy.broadcast_to(numpy.arange(n), (similarities.shape[0], n)).copy()
+        top_scores = numpy.take_along_axis(similarities, top, axis=1)
+        order = numpy.argsort(-top_scores, axis=1)
+        top = numpy.take_along_axis(top, order, axis=1)
+        return top, numpy.take_along_axis(top_scores, order, axis=1)
 
     def add(self, items: t.Sequence[VectorItem]) -> None:
         """Add vectors to the index.
 
-        Only adds to cache if cache is not full.
+        Vectors are buffered and written once the cache is full.
 
         :param items: List of vectors to add
         """
-        if len(self._cache) < self._CACHE_SIZE:
-            for item in items:
-                self._cache.append(item)
-        else:
-            self._add(self._cache)
-            self._cache = []
+        self._cache.extend(items)
+        if len(self._cache) >= self._CACHE_SIZE:
+            self.post_create()
 
     def post_create(self):
         """Post create method to incorporate remaining vectors to be added in cache."""
@@ -132,14 +417,7 @@ class InMemoryVectorSearcher(BaseVectorSearcher):
     def _add(self, items: t.Sequence[VectorItem]) -> None:
         index = [item.id for item in items]
         h = numpy.stack([item.vector for item in items])
-
-        if self.h is not None:
-            old_not_in_new = list(set(self.index) - set(index))
-            ix_old = [self.lookup[_id] for _id in old_not_in_new]
-            h = numpy.concatenate((self.h[ix_old], h), axis=0)
-            index = [self.index[i] for i in ix_old] + index
-
-        return self._setup(h, index)
+        self._write(h, index)
 
     def delete(self, ids):
         """Delete vectors from the index.
@@ -147,7 +425,148 @@ class InMemoryVectorSearcher(BaseVectorSearcher):
         :param ids: List of IDs to delete
         """
         self.post_create()
-        ix = list(map(self.lookup.__getitem__, ids))
-        h = numpy.delete(self.h, ix, axis=0)
-        index = [_id for _id in self.index if _id not in set(ids)]
-        self._setup(h, index)
+        rows = numpy.array(
+            [self.lookup.pop(_id) for _id in ids if _id in self.lookup],
+            dtype=numpy.int64,
+        )
+        if not len(rows):
+            return
+        self._deleted[rows] = True
+        for row in rows.tolist():
+            self.index[row] = None
+        self._n_deleted += len(rows)
+        self._on_delete(rows)
+
+        if self._n_deleted > self.compaction_threshold * self._n:
+            self.compact()
+
+    def compact(self):
+        """Drop the rows marked as deleted and renumber the remaining rows."""
+        keep = ~self._deleted[: self._n]
+        n = int(keep.sum())
+        self._h[:n] = self._h[: self._n][keep]
+        if self._scale is not None:
+            self._scale[:n] = self._scale[: self._n][keep]
+        if self._full is not None:
+            self._full[:n] = self._full[: self._n][keep]
+        self._deleted[: self._n] = False
+        self.index = [_id for _id in self.index if _id is not None]
+        self.lookup = dict(zip(self.index, range(n)))
+        self._n = n
+        self._n_deleted = 0
+        self._on_compact(keep)
+
+    def save_snapshot(self, path: str, watermark: t.Optional[t.Dict] = None):
+        """Persist the vectors of the index to ``path``.
+
+        The snapshot holds the vectors as one contiguous matrix in the storage
+        precision, the table of ids and a ``meta.json`` with the watermark.
+        It is written to a temporary directory which then replaces ``path``.
+
+        :param path: Directory of the snapshot
+        :param watermark: Information describing when the snapshot was taken
+        """
+        self.post_create()
+        if self._n_deleted:
+            self.compact()
+
+        tmp_path = f'{path}.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        self._h[: self._n].tofile(os.path.join(tmp_path, 'vectors.bin'))
+        if self._scale is not None:
+            numpy.save(os.path.join(tmp_path, 'scales.npy'), self._scale[: self._n])
+        if self._full is not None:
+            self._full[: self._n].tofile(os.path.join(tmp_path, 'full.f32'))
+        numpy.save(
+            os.path.join(tmp_path, 'ids.npy'), numpy.array(self.index, dtype=str)
+        )
+        self._save_state(tmp_path)
+        meta = {
+            'count': self._n,
+            'dimensions': self._dimensions,
+            'searcher': type(self).__name__,
+            'measure': self.measure_name,
+            'quantization': self.quantization,
+            'reranking': self._reranking,
+            'watermark': watermark or {},
+        }
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+        old_path = f'{path}.old'
+        if os.path.exists(path):
+            os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+        logging.info(f'Saved snapshot of {self._n} vectors to {path}')
+
+    def _save_state(self, path: str):
+        """Hook to save additional state of the searcher in a snapshot."""
+
+    def _load_state(self, path: str):
+        """Hook to load additional state of the searcher from a snapshot."""
+
+    def snapshot_watermark(self, path: str) -> t.Dict:
+        """Return the watermark the snapshot at ``path`` was saved with.
+
+        :param path: Directory of the snapshot
+        """
+        meta_path = os.path.join(path, 'meta.json')
+        if not os.path.exists(meta_path):
+            return {}
+        with open(meta_path) as f:
+            return json.load(f)['watermark']
+
+    def load_snapshot(self, path: str) -> t.Optional[t.List[str]]:
+        """Restore the vectors of the index from a snapshot at ``path``.
+
+        The vector matrix is memory-mapped copy-on-write, so only the pages
+        which are searched or modified are read from disk.
+
+        :param path: Directory of the snapshot
+        """
+        meta_path = os.path.join(path, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        expected = {
+            'searcher': type(self).__name__,
+            'measure': self.measure_name,
+            'quantization': self.quantization,
+            'reranking': self._reranking,
+        }
+        if any(meta.get(k) != v for k, v in expected.items()):
+            logging.warn(f'Ignoring snapshot at {path} built with {meta}')
+            return None
+
+        count, dimensions = meta['count'], meta['dimensions']
+        self._load_state(path)
+        self._reset(capacity=0, dimensions=dimensions)
+        if count:
+            self._h = numpy.memmap(
+                os.path.join(path, 'vectors.bin'),
+                dtype=self._h.dtype,
+                mode='c',
+                shape=(count,) + self._h.shape[1:],
+            )
+            if self._scale is not None:
+                self._scale = numpy.load(os.path.join(path, 'scales.npy'))
+            if self._full is not None:
+                self._full = numpy.memmap(
+                    os.path.join(path, 'full.f32'),
+                    dtype=numpy.float32,
+                    mode='c',
+                    shape=(count, dimensions),
+                )
+            self._deleted = numpy.zeros(count, dtype=bool)
+        self.index = numpy.load(os.path.join(path, 'ids.npy')).tolist()
+        self.lookup = dict(zip(self.index, range(count)))
+        self._n = count
+        self._on_write(numpy.arange(count))
+        logging.info(
+            f'Loaded snapshot of {count} vectors from {path} '
+            f'with watermark {meta["watermark"]}'
+        )
+        return list(self.lookup)
@@ -0,0 +1,220 @@
+import typing as t
+
+import numpy
+
+from superduper import logging
+from superduper.vector_search.in_memory import InMemoryVectorSearcher
+
+
+class InMemoryIVFVectorSearcher(InMemoryVectorSearcher):
+    """
+    Approximate nearest neighbour search with an inverted-file (IVF) index.
+
+    The vectors are clustered with k-means into ``n_lists`` inverted lists.
+    At query time only the ``n_probe`` lists whose centroids are closest
+    to the query are scored, so latency scales with
+    ``n_probe / n_lists`` of the collection instead of the whole collection.
+
+    :param identifier: Unique string identifier of index
+    :param dimensions: Dimension of the vector embeddings
+    :param h: array/ tensor of vectors
+    :param index: list of IDs
+    :param measure: measure to assess similarity
+    :param n_lists: Number of inverted lists (defaults to ``sqrt(len(index))``)
+    :param n_probe: Number of inverted lists to scan per query
+    :param n_iter: Number of k-means iterations used for training
+    :param min_train_size: Below this size, search falls back to brute force
+    :param seed: Random seed for k-means initialisation
+    :param min_postfilter_selectivity: Filters matching a smaller fraction of
+                                       the vectors are searched exactly
+    :param compaction_threshold: Fraction of deleted rows triggering compaction
+    :param quantization: Storage precision of the vectors (float16|int8)
+    :param rerank_factor: Re-rank this many candidates per result at full
+                          precision (0 disables re-ranking)
+    """
+
+    name = 'ivf'
+
+    def __init__(
+        self,
+        identifier: str,
+        dimensions: int,
+        h: t.Optional[numpy.ndarray] = None,
+        index: t.Optional[t.List[str]] = None,
+        measure: t.Union[str, t.Callable] = 'cosine',
+        n_lists: t.Optional[int] = None,
+        n_probe: int = 8,
+        n_iter: int = 10,
+        min_train_size: int = 1024,
+        seed: int = 42,
+        min_postfilter_selectivity: float = 0.1,
+        compaction_threshold: float = 0.25,
+        quantization: t.Optional[str] = None,
+        rerank_factor: int = 0,
+    ):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.min_train_size = min_train_size
+        self.seed = seed
+        self.min_postfilter_selectivity = min_postfilter_selectivity
+
+        self._centroids: t.Optional[numpy.ndarray] = None
+        self._assignment = numpy.empty(0, dtype=numpy.int64)
+        self._list_order: t.Optional[numpy.ndarray] = None
+        self._list_offsets: t.Optional[numpy.ndarray] = None
+        self._trained_size = 0
+        self._stale = True
+        self._lists_stale = True
+
+        super().__init__(
+            identifier=identifier,
+            dimensions=dimensions,
+            h=h,
+            index=index,
+            measure=measure,
+            compaction_threshold=compaction_threshold,
+            quantization=quantization,
+            rerank_factor=rerank_factor,
+        )
+
+    def _on_write(self, rows):
+        if self._centroids is None or len(self) >= 2 * self._trained_size:
+            self._stale = True
+            return
+        if self._assignment.shape[0] < self._n:
+            assignment = numpy.full(self._h.shape[0], -1, dtype=numpy.int64)
+            assignment[: self._assignment.shape[0]] = self._assignment
+            self._assignment = assignment
+        self._assignment[rows] = self._assign(self._decode(rows), self._centroids)
+        self._lists_stale = True
+
+    def _on_delete(self, rows):
+        if self._centroids is not None:
+            self._assignment[rows] = -1
+            self._lists_stale = True
+
+    def _on_compact(self, keep):
+        if self._centroids is not None:
+            self._assignment = self._assignment[: keep.shape[0]][keep]
+            self._lists_stale = True
+
+    def _use_euclidean(self):
+        return self.measure_name == 'l2'
+
+    def _centroid_scores(self, h, centroids):
+        # Highest score is the closest centroid, for any supported measure.
+        if self._use_euclidean():
+            return 2 * h @ centroids.T - (centroids**2).sum(axis=1)
+        return h @ centroids.T
+
+    def _assign(self, h, centroids):
+        return numpy.argmax(self._centroid_scores(h, centroids), axis=1)
+
+    def _train(self, rows: numpy.ndarray, n_lists: int) -> numpy.ndarray:
+        rng = numpy.random.default_rng(self.seed)
+        # Training on a sample keeps k-means cheap for very large collections
+        sample_size = min(rows.shape[0], 256 * n_lists)
+        sample = self._decode(rng.choice(rows, size=sample_size, replace=False))
+        centroids = sample[rng.choice(sample_size, size=n_lists, replace=False)]
+        for _ in range(self.n_iter):
+            assignment = self._assign(sample, centroids)
+            counts = numpy.bincount(assignment, minlength=n_lists)
+            sums = numpy.zeros_like(centroids)
+            numpy.add.at(sums, assignment, sample)
+            nonempty = counts > 0
+            centroids[nonempty] = sums[nonempty] / counts[nonempty, None]
+            if not self._use_euclidean():
+                norms = numpy.linalg.norm(centroids, axis=1)[:, None]
+                centroids = centroids / numpy.maximum(norms, 1e-12)
+        return centroids
+
+    def build(self):
+        """Train the centroids and build the inverted lists.
+
+        This runs on the first search once ``min_train_size`` vectors are
+        stored, and again whenever the collection has doubled in size since
+        the last training. In between, written vectors are assigned to the
+        existing centroids incrementally.
+        """
+        self._stale = False
+        if len(self) < self.min_train_size:
+            self._centroids = None
+            return
+
+        n_lists = self.n_lists or int(numpy.sqrt(len(self)))
+        n_lists = max(1, min(n_lists, len(self)))
+        logging.info(
+            f'Training IVF index {self.identifier} with {n_lists} lists '
+            f'on {len(self)} vectors'
+        )
+        live = numpy.flatnonzero(~self._deleted[: self._n])
+        self._centroids = self._train(live, n_lists)
+        self._trained_size = len(self)
+
+        self._assignment = numpy.full(self._h.shape[0], -1, dtype=numpy.int64)
+        self._assignment[live] = self._assign(self._decode(live), self._centroids)
+        self._build_lists()
+
+    def _build_lists(self):
+        assert self._centroids is not None
+        assignment = self._assignment[: self._n]
+        live = numpy.flatnonzero(assignment >= 0)
+        self._list_order = live[numpy.argsort(assignment[live], kind='stable')]
+        counts = numpy.bincount(assignment[live], minlength=self._centroids.shape[0])
+        self._list_offsets = numpy.concatenate(([0], numpy.cumsum(counts)))
+        self._lists_stale = False
+
+    def _list_rows(self, lists: numpy.ndarray) -> numpy.ndarray:
+        assert self._list_order is not None and self._list_offsets is not None
+        return numpy.concatenate(
+            [
+                self._list_order[self._list_offsets[p] : self._list_offsets[p + 1]]
+                for p in lists
+            ]
+        )
+
+    def post_create(self):
+        """Incorporate cached vectors and refresh the inverted lists."""
+        super().post_create()
+        if self._stale:
+            self.build()
+        elif self._lists_stale and self._centroids is not None:
+            self._build_lists()
+
+    def _search(self, h, n, vector_filter=None):
+        """Approximate search of the queries ``h``.
+
+        Filters are applied after probing, by dropping candidates which do
+        not pass the filter. Queries left with fewer than ``n`` candidates,
+        and filters too selective for probing to find enough matches, fall
+        back to an exact search of the filtered rows.
+
+        :param h: 2-D array of vectors, one query per row
+        :param n: number of nearest vectors to return per query
+        :param vector_filter: optional restriction of the searched rows
+        """
+        if self._centroids is None or (
+            vector_filter is not None
+            and vector_filter.selectivity < self.min_postfilter_selectivity
+        ):
+            return super()._search(h, n=n, vector_filter=vector_filter)
+
+        mask = vector_filter.mask if vector_filter is not None else None
+        n_expected = min(n, len(self) if vector_filter is None else len(vector_filter))
+        n_probe = min(self.n_probe, self._centroids.shape[0])
+        centroid_scores = self._centroid_scores(h, self._centroids)
+        probes = numpy.argpartition(-centroid_scores, n_probe - 1, axis=1)
+        out = []
+        for query, lists in zip(h, probes[:, :n_probe]):
+            candidates = self._list_rows(lists)
+            if mask is not None:
+                candidates = candidates[mask[candidates]]
+            if len(candidates) < n_expected:
+                out.extend(super()._search(query[None, :], n, vector_filter))
+                continue
+            similarities = self._score(query[None, :], candidates)
+            top, scores = self._select(query[None, :], similarities, n, candidates)
+            ids = [self.index[i] for i in top[0].tolist()]
+            out.append((ids, scores[0].tolist()))
+        return out
@@ -0,0 +1,274 @@
+import hashlib
+import io
+import os
+import typing as t
+
+import numpy
+
+from superduper import logging
+from superduper.vector_search.in_memory import InMemoryVectorSearcher
+
+if t.TYPE_CHECKING:
+    from superduper.backends.base.artifacts import ArtifactStore
+    from superduper.components.vector_index import VectorIndex
+
+
+class InMemoryPQVectorSearcher(InMemoryVectorSearcher):
+    """
+    Compressed vector search with product quantization (PQ).
+
+    Each vector is split into ``n_subvectors`` sub-vectors, and each
+    sub-vector is stored as the index of its nearest centroid in a codebook
+    of 256 centroids, so that a vector takes ``n_subvectors`` bytes.
+    Queries are scored with asymmetric distance tables: the similarity of
+    each query sub-vector to every centroid is computed once per query, and
+    the score of a stored vector is the sum of the entries of its codes.
+
+    Vectors are kept at full precision until ``min_train_size`` of them are
+    stored, then the codebooks are trained and all vectors are encoded.
+    If an ``artifact_store`` is given, trained codebooks are saved there
+    under ``codebook_id`` and reused when the searcher is recreated.
+
+    :param identifier: Unique string identifier of index
+    :param dimensions: Dimension of the vector embeddings
+    :param h: array/ tensor of vectors
+    :param index: list of IDs
+    :param measure: measure to assess similarity
+    :param n_subvectors: Number of sub-vectors, i.e. bytes per stored vector
+    :param n_iter: Number of k-means iterations used for training
+    :param min_train_size: Number of vectors required to train the codebooks
+    :param seed: Random seed for k-means initialisation
+    :param compaction_threshold: Fraction of deleted rows triggering compaction
+    :param rerank_factor: Re-rank this many candidates per result at full
+                          precision (0 disables re-ranking)
+    :param artifact_store: Artifact store to save the trained codebooks in
+    :param codebook_id: File id of the codebooks in the artifact store
+    """
+
+    name = 'pq'
+
+    _N_CENTROIDS = 256
+    # Number of training vectors sampled per centroid
+    _SAMPLES_PER_CENTROID = 64
+
+    def __init__(
+        self,
+        identifier: str,
+        dimensions: int,
+        h: t.Optional[numpy.ndarray] = None,
+        index: t.Optional[t.List[str]] = None,
+        measure: t.Union[str, t.Callable] = 'cosine',
+        n_subvectors: int = 8,
+        n_iter: int = 10,
+        min_train_size: int = 10000,
+        seed: int = 42,
+        compaction_threshold: float = 0.25,
+        rerank_factor: int = 0,
+        artifact_store: t.Optional['ArtifactStore'] = None,
+        codebook_id: t.Optional[str] = None,
+    ):
+        if not isinstance(measure, str):
+            raise ValueError('Product quantization requires a named measure')
+        self.n_subvectors = n_subvectors
+        self.n_iter = n_iter
+        self.min_train_size = max(min_train_size, self._N_CENTROIDS)
+        self.seed = seed
+        self.artifact_store = artifact_store
+        self.codebook_id = codebook_id
+        self._codebooks: t.Optional[numpy.ndarray] = None
+
+        super().__init__(
+            identifier=identifier,
+            dimensions=dimensions,
+            measure=measure,
+            compaction_threshold=compaction_threshold,
+            rerank_factor=rerank_factor,
+        )
+        self._codebooks = self._load_codebooks()
+        self._reset(capacity=0, dimensions=dimensions)
+        if h is not None:
+            assert index is not None
+            self._setup(h, index)
+
+    @classmethod
+    def from_component(cls, vi: 'VectorIndex'):
+        """Create a vector searcher from a vector index.
+
+        :param vi: VectorIndex instance
+        """
+        db = getattr(vi, 'db', None)
+        key = f'{vi.identifier}/{vi.indexing_listener.predict_id}/pq_codebooks'
+        return cls(
+            **cls._searcher_kwargs(
+                identifier=vi.identifier,
+                dimensions=vi.dimensions,
+                measure=vi.measure,
+                rerank_factor=vi.rerank_factor,
+                artifact_store=db.artifact_store if db is not None else None,
+                codebook_id=hashlib.sha1(key.encode()).hexdigest(),
+            )
+        )
+
+    @property
+    def _reranking(self) -> bool:
+        return self.rerank_factor > 0
+
+    @property
+    def _subvector_size(self) -> int:
+        return -(-self._dimensions // self.n_subvectors)
+
+    def _allocate(self, capacity: int) -> numpy.ndarray:
+        if self._codebooks is None:
+            return super()._allocate(capacity)
+        return numpy.zeros((capacity, self.n_subvectors), dtype=numpy.uint8)
+
+    def _split(self, h: numpy.ndarray) -> numpy.ndarray:
+        """Split vectors into zero-padded sub-vectors.
+
+        :param h: 2-D array of vectors
+        """
+        size = self._subvector_size * self.n_subvectors
+        if h.shape[1] < size:
+            h = numpy.pad(h, ((0, 0), (0, size - h.shape[1])))
+        return h.reshape(h.shape[0], self.n_subvectors, self._subvector_size)
+
+    def _encode(self, h: numpy.ndarray) -> numpy.ndarray:
+        assert self._codebooks is not None
+        sub = self._split(h)
+        codes = numpy.empty((h.shape[0], self.n_subvectors), dtype=numpy.uint8)
+        for j, codebook in enumerate(self._codebooks):
+            codes[:, j] = self._nearest(sub[:, j], codebook)
+        return codes
+
+    @staticmethod
+    def _nearest(x: numpy.ndarray, centroids: numpy.ndarray) -> numpy.ndarray:
+        # Sub-vectors are strided views, which matrix products handle slowly
+        x = numpy.ascontiguousarray(x)
+        return numpy.argmax(2 * x @ centroids.T - (centroids**2).sum(axis=1), axis=1)
+
+    def _store(self, rows: numpy.ndarray, h: numpy.ndarray):
+        if self._codebooks is None:
+            return super()._store(rows, h)
+        if self._full is not None:
+            self._full[rows] = h
+        self._h[rows] = self._encode(h)
+
+    def _decode(self, rows) -> numpy.ndarray:
+        if self._codebooks is None:
+            return super()._decode(rows)
+        codes = self._h[rows]
+        h = self._codebooks[numpy.arange(self.n_subvectors), codes]
+        return h.reshape(codes.shape[:-1] + (-1,))[..., : self._dimensions]
+
+    def _score(self, h: numpy.ndarray, rows=None) -> numpy.ndarray:
+        if self._codebooks is None:
+            return super()._score(h, rows)
+        if self.measure_name == 'cosine':
+            h = h / numpy.linalg.norm(h, axis=1)[:, None]
+        sub = self._split(h)
+        if self.measure_name == 'l2':
+            tables = -(
+                (sub**2).sum(axis=2)[:, :, None]
+                + (self._codebooks**2).sum(axis=2)[None]
+                - 2 * numpy.einsum('qms,mcs->qmc', sub, self._codebooks)
+            )
+        else:
+            tables = numpy.einsum('qms,mcs->qmc', sub, self._codebooks)
+        # (n_subvectors, q, 256), so that each gather reads contiguous rows
+        tables = numpy.ascontiguousarray(tables.transpose(1, 0, 2), dtype=numpy.float32)
+
+        n = self._n if rows is None else len(rows)
+        similarities = numpy.zeros((h.shape[0], n), dtype=numpy.float32)
+        for start in range(0, n, self._SCORE_BLOCK_SIZE):
+            stop = min(start + self._SCORE_BLOCK_SIZE, n)
+            block = slice(start, stop) if rows is None else rows[start:stop]
+            codes = self._h[block].T.astype(numpy.intp)
+            out = similarities[:, start:stop]
+            for j in range(self.n_subvectors):
+                out += numpy.take(tables[j], codes[j], axis=1)
+        if self.measure_name == 'l2':
+            return -numpy.sqrt(numpy.maximum(-similarities, 0))
+        return similarities
+
+    def _kmeans(self, x: numpy.ndarray, rng) -> numpy.ndarray:
+        centroids = x[rng.choice(x.shape[0], size=self._N_CENTROIDS, replace=False)]
+        for _ in range(self.n_iter):
+            assignment = self._nearest(x, centroids)
+            counts = numpy.bincount(assignment, minlength=self._N_CENTROIDS)
+            sums = numpy.stack(
+                [
+                    numpy.bincount(assignment, weights=x[:, d], minlength=len(counts))
+                    for d in range(x.shape[1])
+                ],
+                axis=1,
+            )
+            nonempty = counts > 0
+            centroids[nonempty] = sums[nonempty] / counts[nonempty, None]
+        return centroids
+
+    def train(self):
+        """Train the codebooks and encode the stored vectors.
+
+        This runs on the first search once ``min_train_size`` vectors are
+        stored; after that, written vectors are encoded directly.
+        """
+        live = numpy.flatnonzero(~self._deleted[: self._n])
+        logging.info(
+            f'Training PQ codebooks of {self.identifier} with '
+            f'{self.n_subvectors} sub-vectors on {len(live)} vectors'
+        )
+        rng = numpy.random.default_rng(self.seed)
+        sample_size = min(len(live), self._SAMPLES_PER_CENTROID * self._N_CENTROIDS)
+        sample = self._split(self._h[rng.choice(live, size=sample_size, replace=False)])
+        self._codebooks = numpy.stack(
+            [self._kmeans(sample[:, j], rng) for j in range(self.n_subvectors)]
+        )
+        self._save_codebooks()
+        self._encode_all()
+
+    def _encode_all(self):
+        h = self._h
+        self._h = self._allocate(h.shape[0])
+        for start in range(0, self._n, self._SCORE_BLOCK_SIZE):
+            stop = min(start + self._SCORE_BLOCK_SIZE, self._n)
+            self._h[start:stop] = self._encode(h[start:stop])
+
+    def _load_codebooks(self) -> t.Optional[numpy.ndarray]:
+        if self.artifact_store is None or self.codebook_id is None:
+            return None
+        if not self.artifact_store.exists(file_id=self.codebook_id):
+            return None
+        codebooks = numpy.load(
+            io.BytesIO(self.artifact_store.get_bytes(self.codebook_id))
+        )
+        expected = (self.n_subvectors, self._N_CENTROIDS, self._subvector_size)
+        if codebooks.shape != expected:
+            logging.warn(
+                f'Ignoring PQ codebooks of shape {codebooks.shape}, '
+                f'expected {expected}'
+            )
+            return None
+        return codebooks
+
+    def _save_codebooks(self):
+        if self.artifact_store is None or self.codebook_id is None:
+            return
+        buffer = io.BytesIO()
+        numpy.save(buffer, self._codebooks)
+        self.artifact_store.put_bytes(buffer.getvalue(), self.codebook_id)
+
+    def post_create(self):
+        """Incorporate cached vectors and train the codebooks when possible."""
+        super().post_create()
+        if self._codebooks is None and len(self) >= self.min_train_size:
+            self.train()
+
+    def _save_state(self, path: str):
+        if self._codebooks is not None:
+            numpy.save(os.path.join(path, 'codebooks.npy'), self._codebooks)
+
+    def _load_state(self, path: str):
+        codebooks_path = os.path.join(path, 'codebooks.npy')
+        self._codebooks = (
+            numpy.load(codebooks_path) if os.path.exists(codebooks_path) else None
+        )
@@ -3,7 +3,7 @@ import typing as t
 import numpy as np
 
 from superduper import CFG
-from superduper.misc.server import request_server
+from superduper.misc.server import encode_vectors, request_server
 from superduper.vector_search.base import BaseVectorSearcher, VectorItem
 
 if t.TYPE_CHECKING:
@@ -63,11 +63,17 @@ class FastVectorSearcher(BaseVectorSearcher):
 
         :param items: t.Sequence of VectorItems
         """
-        vector_items = [{'vector': i.vector, 'id': i.id} for i in items]
         if CFG.cluster.vector_search.uri is not None:
+            if CFG.cluster.vector_search.binary_vectors:
+                data: t.Any = encode_vectors(
+                    np.stack([self.to_numpy(i.vector) for i in items]),
+                    ids=[i.id for i in items],
+                )
+            else:
+                data = [{'vector': i.vector, 'id': i.id} for i in items]
             request_server(
                 service='vector_search',
-                data=vector_items,
+                data=data,
                 endpoint='add/search',
                 args={
                     'vector_index': self.vector_index,
@@ -132,6 +138,8 @@ class FastVectorSearcher(BaseVectorSearcher):
         :param within_ids: list of ids to search within
         """
         if CFG.cluster.vector_search.uri is not None:
+            if CFG.cluster.vector_search.binary_vectors:
+                h = encode_vectors(self.to_numpy(h))
             response = request_server(
                 service='vector_search',
                 data=h,
@@ -142,6 +150,27 @@ class FastVectorSearcher(BaseVectorSearcher):
 
         return self.searcher.find_nearest_from_array(h=h, n=n, within_ids=within_ids)
 
+    def find_nearest_from_arrays(
+        self,
+        h: np.typing.ArrayLike,
+        n: int = 100,
+        within_ids: t.Sequence[str] = (),
+    ) -> t.List[t.Tuple[t.List[str], t.List[float]]]:
+        """
+        Find the nearest vectors to each of the given vectors.
+
+        :param h: 2-D array of vectors, one query per row
+        :param n: number of nearest vectors to return per query
+        :param within_ids: list of ids to search within
+        """
+        if CFG.cluster.vector_search.uri is not None:
+            return [
+                self.find_nearest_from_array(x, n=n, within_ids=within_ids)
+                for x in self.to_numpy(h)
+            ]
+
+        return self.searcher.find_nearest_from_arrays(h=h, n=n, within_ids=within_ids)
+
     def post_create(self):
         """Post create method for vector searcher."""
         if CFG.cluster.is_remote_vector_search:
@@ -1,11 +1,12 @@
 import os
+import time
 import typing as t
 
 import lance
 import numpy as np
 import pyarrow as pa
 
-from superduper import CFG
+from superduper import CFG, logging
 from superduper.vector_search.base import (
     BaseVectorSearcher,
     VectorIndexMeasureType,
@@ -17,13 +18,36 @@ class LanceVectorSearcher(BaseVectorSearcher):
     """
     Implementation of a vector index using the ``lance`` library.
 
+    The dataset handle is kept open between queries and is only reopened
+    when another writer commits a new version. Added vectors are buffered
+    and appended in batches of ``batch_size``, and once the dataset holds
+    ``index_threshold`` vectors an ``IVF_PQ`` index is built, which is
+    retrained whenever the dataset has doubled since the last build.
+
     :param identifier: Unique string identifier of index
     :param dimensions: Dimension of the vector embeddings in the Lance dataset
     :param h: Seed vectors ``numpy.ndarray``
     :param index: list of IDs
     :param measure: measure to assess similarity
+    :param max_prefilter_ids: Largest ``within_ids`` pushed down as a filter
+    :param batch_size: Number of added vectors buffered before they are
+                       appended to the dataset
+    :param index_threshold: Number of vectors from which an ``IVF_PQ`` index
+                            is built (None disables the index)
+    :param num_partitions: Number of IVF partitions of the index
+                           (defaults to the square root of the dataset size)
+    :param num_sub_vectors: Number of PQ sub-vectors of the index
+                            (defaults to about one per 8 dimensions)
+    :param nprobes: Number of IVF partitions searched per query
+    :param refine_factor: Re-rank ``refine_factor * n`` candidates of the
+                          index with the exact vectors
+    :param refresh_interval: Seconds between checks for new dataset versions
     """
 
+    # ``IVF_PQ`` indices of the ``lance`` versions supported only rank
+    # correctly for the l2 metric; other measures are searched exhaustively.
+    _INDEXED_MEASURES = (None, 'l2')
+
     def __init__(
         self,
         identifier: str,
@@ -31,25 +55,76 @@ class LanceVectorSearcher(BaseVectorSearcher):
         h: t.Optional[np.ndarray] = None,
         index: t.Optional[t.List[str]] = None,
         measure: t.Optional[str] = None,
+        max_prefilter_ids: int = 1000,
+        batch_size: int = 10000,
+        index_threshold: t.Optional[int] = 100000,
+        num_partitions: t.Optional[int] = None,
+        num_sub_vectors: t.Optional[int] = None,
+        nprobes: int = 20,
+        refine_factor: t.Optional[int] = 10,
+        refresh_interval: float = 1.0,
     ):
+        self.identifier = identifier
+        self.max_prefilter_ids = max_prefilter_ids
+        self.batch_size = batch_size
+        self.index_threshold = index_threshold
+        self.num_partitions = num_partitions
+        self.num_sub_vectors = num_sub_vectors
+        self.nprobes = nprobes
+        self.refine_factor = refine_factor
+        self.refresh_interval = refresh_interval
         self.dataset_path = os.path.join(CFG.lance_home, f'{identifier}.lance')
         self.dimensions = dimensions
         self.measure = (
             measure.name if isinstance(measure, VectorIndexMeasureType) else measure
         )
+        self._dataset: t.Optional[lance.LanceDataset] = None
+        self._checked_at = 0.0
+        self._cache: t.List[VectorItem] = []
+        self._indexed_rows = 0
         if h is not None:
             if not os.path.exists(self.dataset_path):
                 os.makedirs(self.dataset_path, exist_ok=True)
                 self._create_or_append_to_dataset(h, index, mode='create')
+                self._maybe_build_index()
 
     @property
     def dataset(self):
-        """Return the Lance dataset."""
-        if not os.path.exists(self.dataset_path):
-            self._create_or_append_to_dataset([], [], mode='create')
-        return lance.dataset(self.dataset_path)
+        """Return the Lance dataset.
+
+        The handle is reused, and reopened if a newer version of the dataset
+        was committed, checked at most every ``refresh_interval`` seconds.
+        """
+        if self._dataset is None:
+            if not os.path.exists(self.dataset_path):
+                self._create_or_append_to_dataset([], [], mode='create')
+            else:
+                self._open()
+        elif time.monotonic() - self._checked_at > self.refresh_interval:
+            if self._dataset.latest_version != self._dataset.version:
+                self._open()
+            self._checked_at = time.monotonic()
+        return self._dataset
+
+    def _open(self):
+        self._dataset = lance.dataset(self.dataset_path)
+        self._checked_at = time.monotonic()
+        self._indexed_rows = self._count_indexed_rows(self._dataset)
+
+    @staticmethod
+    def _count_indexed_rows(dataset) -> int:
+        indices = dataset.list_indices()
+        if not indices:
+            return 0
+        fragment_ids = set(indices[0]['fragment_ids'])
+        return sum(
+            fragment.count_rows()
+            for fragment in dataset.get_fragments()
+            if fragment.fragment_id in fragment_ids
+        )
 
     def __len__(self):
+        self._flush()
         return self.dataset.count_rows()
 
     def _create_or_append_to_dataset(self, vectors, ids, mode: str = 'upsert'):
@@ -66,25 +141,78 @@ class LanceVectorSearcher(BaseVectorSearcher):
             dataset.merge_insert(
                 "id"
             ).when_matched_update_all().when_not_matched_insert_all().execute(_table)
+            self._dataset = None
         else:
-            lance.write_dataset(_table, self.dataset_path, mode=mode)
+            self._dataset = lance.write_dataset(_table, self.dataset_path, mode=mode)
+            self._checked_at = time.monotonic()
 
     def add(self, items: t.Sequence[VectorItem]) -> None:
         """Add vectors to the index.
 
+        Vectors are appended to the dataset once ``batch_size`` of them are
+        buffered, or before the next search.
+
         :param items: List of vectors to add
         """
+        self._cache.extend(items)
+        if len(self._cache) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._cache:
+            return
+        items, self._cache = self._cache, []
         ids = [item.id for item in items]
         vectors = [item.vector for item in items]
         self._create_or_append_to_dataset(vectors, ids, mode='append')
+        self._maybe_build_index()
+
+    def _maybe_build_index(self):
+        if self.index_threshold is None or self.measure not in self._INDEXED_MEASURES:
+            return
+        count = self.dataset.count_rows()
+        if count < max(self.index_threshold, 2 * self._indexed_rows):
+            return
+        self.build_index()
+
+    def build_index(self):
+        """Build or retrain the ``IVF_PQ`` index on all vectors of the dataset."""
+        count = self.dataset.count_rows()
+        num_partitions = self.num_partitions or max(1, int(np.sqrt(count)))
+        num_sub_vectors = self.num_sub_vectors or self._default_sub_vectors()
+        logging.info(
+            f'Building IVF_PQ index of {self.identifier} on {count} vectors with '
+            f'{num_partitions} partitions and {num_sub_vectors} sub-vectors'
+        )
+        self._dataset = self.dataset.create_index(
+            'vector',
+            'IVF_PQ',
+            metric=self.measure or 'l2',
+            num_partitions=num_partitions,
+            num_sub_vectors=num_sub_vectors,
+            replace=True,
+        )
+        self._checked_at = time.monotonic()
+        self._indexed_rows = count
+
+    def _default_sub_vectors(self) -> int:
+        # The number of sub-vectors must divide the dimensions
+        for n in range(max(1, self.dimensions // 8), 0, -1):
+            if self.dimensions % n == 0:
+                return n
+        return 1
+
+    def post_create(self):
+        """Append buffered vectors and build the index when due."""
+        self._flush()
 
     def delete(self, ids: t.Sequence[str]) -> None:
         """Delete vectors from the index.
 
         :param ids: List of IDs to delete
         """
-        to_remove = ", ".join(f"'{str(id)}'" for id in ids)
-        self.dataset.delete(f"id IN ({to_remove})")
+        self._flush()
+        self.dataset.delete(self._id_filter(ids))
 
     def find_nearest_from_id(
         self,
@@ -98,18 +226,25 @@ class LanceVectorSearcher(BaseVectorSearcher):
         :param n: Number of results to return
         :param within_ids: List of IDs to search within
         """
-        # The ``lance`` file format has been specifically designed for fast
-        # random access. The logic to take advantage of this is implemented
-        # by the ``.take`` method.
-
-        # See https://blog.lancedb.com/benchmarking-random-access-in-lance-ed690757a826
-        # for further details.
-
-        vector = self.dataset.take([int(_id)], columns=['vector']).to_pydict()[
-            'vector'
-        ][0]
+        self._flush()
+        result = self.dataset.to_table(
+            columns=['vector'], filter=self._id_filter([_id]), limit=1
+        )
+        if not result.num_rows:
+            raise KeyError(_id)
+        vector = np.array(result['vector'][0].as_py(), dtype=np.float32)
         return self.find_nearest_from_array(vector, n=n, within_ids=within_ids)
 
+    def _nearest(self, h, k: int) -> t.Dict:
+        return {
+            'column': 'vector',
+            'q': h,
+            'k': k,
+            'metric': self.measure,
+            'nprobes': self.nprobes,
+            'refine_factor': self.refine_factor,
+        }
+
     def find_nearest_from_array(
         self,
         h: np.typing.ArrayLike,
@@ -122,36 +257,60 @@ class LanceVectorSearcher(BaseVectorSearcher):
         :param n: Number of results to return
         :param within_ids: List of IDs to search within
         """
-        # NOTE: filter is currently applied AFTER vector-search
-        # See https://lancedb.github.io/lance/api/python/lance.html#lance.dataset.LanceDataset.scanner
+        self._flush()
         if within_ids:
-            if isinstance(within_ids, (list, set)):
-                within_ids = tuple(within_ids)
-            assert (
-                type(within_ids) == tuple
-            ), 'within_ids must be a [tuple | list | set] for lance sql parser'
+            return self._find_nearest_within_ids(h, n, set(map(str, within_ids)))
+
+        result = self.dataset.to_table(
+            columns=['id'],
+            nearest=self._nearest(h, n),
+            offset=0,
+        )
+        ids = result['id'].to_pylist()
+        distances = result['_distance'].to_pylist()
+        scores = self._convert_distances_to_scores(distances)
+        return ids, scores
+
+    def _find_nearest_within_ids(self, h, n: int, within_ids: t.Set[str]):
+        # Small id sets are pushed down to lance as a pre-filter; large ones
+        # would produce a huge SQL expression, so the search over-fetches
+        # and filters the results instead.
+        if len(within_ids) <= self.max_prefilter_ids:
             result = self.dataset.to_table(
                 columns=['id'],
-                nearest={
-                    'column': 'vector',
-                    'q': h,
-                    'k': n,
-                    'metric': self.measure,
-                },
-                filter=f"id in {within_ids}",
+                nearest=self._nearest(h, n),
+                filter=self._id_filter(within_ids),
                 prefilter=True,
                 offset=0,
             )
-        else:
+            ids = result['id'].to_pylist()
+            distances = result['_distance'].to_pylist()
+            return ids, self._convert_distances_to_scores(distances)
+
+        total = len(self)
+        k = min(total, int(n * total / len(within_ids)) * 2)
+        while True:
             result = self.dataset.to_table(
-                columns=['id'],
-                nearest={"column": 'vector', "q": h, "k": n, 'metric': self.measure},
-                offset=0,
+                columns=['id'], nearest=self._nearest(h, max(k, n)), offset=0
             )
-        ids = result['id'].to_pylist()
-        distances = result['_distance'].to_pylist()
-        scores = self._convert_distances_to_scores(distances)
-        return ids, scores
+            pairs = [
+                (_id, d)
+                for _id, d in zip(
+                    result['id'].to_pylist(), result['_distance'].to_pylist()
+                )
+                if _id in within_ids
+            ]
+            if len(pairs) >= n or k >= total:
+                break
+            k = min(total, 2 * k)
+        pairs = pairs[:n]
+        ids = [_id for _id, _ in pairs]
+        return ids, self._convert_distances_to_scores([d for _, d in pairs])
+
+    @staticmethod
+    def _id_filter(ids: t.Iterable[str]) -> str:
+        quoted = ", ".join("'" + str(_id).replace("'", "''") + "'" for _id in ids)
+        return f"id IN ({quoted})"
 
     def _convert_distances_to_scores(self, distances: list[float]) -> list[float]:
         if self.measure == "cosine":
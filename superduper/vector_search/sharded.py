@@ -0,0 +1,300 @@
+import multiprocessing
+import os
+import threading
+import typing as t
+import weakref
+import zlib
+
+import numpy
+
+from superduper import logging
+from superduper.vector_search.base import BaseVectorSearcher, VectorItem
+
+if t.TYPE_CHECKING:
+    from superduper.components.vector_index import VectorIndex
+
+
+def _serve_shard(conn, searcher_cls, kwargs):
+    searcher = searcher_cls(**kwargs)
+    while True:
+        request = conn.recv()
+        if request is None:
+            break
+        method, args, kwargs = request
+        try:
+            conn.send((True, getattr(searcher, method)(*args, **kwargs)))
+        except Exception as e:
+            conn.send((False, e))
+    conn.close()
+
+
+def _stop_shards(connections, processes):
+    for conn in connections:
+        try:
+            conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+    for process in processes:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+
+
+class ShardedVectorSearcher(BaseVectorSearcher):
+    """
+    Vector searcher which partitions the vectors across worker processes.
+
+    Each vector is assigned to one of ``n_shards`` shards by a hash of its
+    id. Every shard is a searcher of type ``shard_type`` running in its own
+    process, so shards score queries in parallel and the index is not
+    limited by the memory of a single process. Queries are sent to all
+    shards and the top ``n`` results of each shard are merged.
+
+    :param identifier: Unique string identifier of index
+    :param dimensions: Dimension of the vector embeddings
+    :param h: array/ tensor of vectors
+    :param index: list of IDs
+    :param measure: measure to assess similarity
+    :param n_shards: Number of shards (defaults to the number of CPUs)
+    :param shard_type: Type of the searcher of each shard
+    :param shard_kwargs: Keyword arguments of the searcher of each shard
+    :param start_method: Multiprocessing start method of the shard processes;
+                         with ``spawn`` scripts must guard their entry point
+                         with ``if __name__ == '__main__'``
+    """
+
+    name = 'sharded'
+
+    def __init__(
+        self,
+        identifier: str,
+        dimensions: int,
+        h: t.Optional[numpy.ndarray] = None,
+        index: t.Optional[t.List[str]] = None,
+        measure: t.Union[str, t.Callable] = 'cosine',
+        n_shards: t.Optional[int] = None,
+        shard_type: str = 'in_memory',
+        shard_kwargs: t.Optional[t.Dict] = None,
+        start_method: str = 'spawn',
+    ):
+        from superduper.backends.base.backends import vector_searcher_implementations
+
+        self.identifier = identifier
+        self.dimensions = dimensions
+        self.measure = measure
+        self.n_shards = n_shards or os.cpu_count() or 1
+
+        searcher_cls = vector_searcher_implementations[shard_type]
+        context = multiprocessing.get_context(start_method)
+        self._connections = []
+        self._processes = []
+        for i in range(self.n_shards):
+            conn, child_conn = context.Pipe()
+            kwargs = {
+                'identifier': f'{identifier}/{i}',
+                'dimensions': dimensions,
+                'measure': measure,
+                **(shard_kwargs or {}),
+            }
+            process = context.Process(
+                target=_serve_shard,
+                args=(child_conn, searcher_cls, kwargs),
+                daemon=True,
+            )
+            process.start()
+            child_conn.close()
+            self._connections.append(conn)
+            self._processes.append(process)
+        self._lock = threading.Lock()
+        self._finalizer = weakref.finalize(
+            self, _stop_shards, self._connections, self._processes
+        )
+        logging.info(f'Started {self.n_shards} shards of vector index {identifier}')
+
+        if h is not None:
+            assert index is not None
+            h = self.to_numpy(h)
+            self.add([VectorItem(id=id, vector=v) for id, v in zip(index, h)])
+
+    @classmethod
+    def from_component(cls, vi: 'VectorIndex'):
+        """Create a vector searcher from a vector index.
+
+        :param vi: VectorIndex instance
+        """
+        kwargs = cls._searcher_kwargs(
+            identifier=vi.identifier, dimensions=vi.dimensions, measure=vi.measure
+        )
+        shard_kwargs = kwargs.pop('shard_kwargs', {})
+        if kwargs.get('shard_type', 'in_memory') == 'in_memory':
+            shard_kwargs = {
+                'quantization': vi.quantization,
+                'rerank_factor': vi.rerank_factor,
+                **shard_kwargs,
+            }
+        return cls(shard_kwargs=shard_kwargs, **kwargs)
+
+    def _shard(self, _id) -> int:
+        # Ids of the data backend need not be strings, e.g. ``ObjectId``
+        return zlib.crc32(str(_id).encode()) % self.n_shards
+
+    def _call(self, requests: t.Dict[int, t.Tuple[str, t.Tuple, t.Dict]]):
+        """Call methods of the shards in parallel.
+
+        :param requests: Mapping of shard to ``(method, args, kwargs)``
+        """
+        results = {}
+        error = None
+        # The pipes are shared, so concurrent callers must not interleave
+        # their requests and replies
+        with self._lock:
+            for shard, request in requests.items():
+                self._connections[shard].send(request)
+            for shard in requests:
+                ok, result = self._connections[shard].recv()
+                if ok:
+                    results[shard] = result
+                elif error is None:
+                    error = result
+        if error is not None:
+            raise error
+        return results
+
+    def _call_all(self, method: str, *args, **kwargs):
+        return self._call({i: (method, args, kwargs) for i in range(self.n_shards)})
+
+    def close(self):
+        """Stop the shard processes."""
+        self._finalizer()
+
+    def __len__(self):
+        return sum(self._call_all('__len__').values())
+
+    def add(self, items: t.Sequence[VectorItem]) -> None:
+        """Add vectors to the shards of their ids.
+
+        :param items: List of vectors to add
+        """
+        shards: t.Dict[int, t.List[VectorItem]] = {}
+        for item in items:
+            shards.setdefault(self._shard(item.id), []).append(item)
+        self._call({shard: ('add', (batch,), {}) for shard, batch in shards.items()})
+
+    def delete(self, ids: t.Sequence[str]) -> None:
+        """Delete vectors from the shards of their ids.
+
+        :param ids: List of IDs to delete
+        """
+        shards: t.Dict[int, t.List[str]] = {}
+        for _id in ids:
+            shards.setdefault(self._shard(_id), []).append(_id)
+        self._call({shard: ('delete', (batch,), {}) for shard, batch in shards.items()})
+
+    def post_create(self):
+        """Incorporate cached vectors in all shards."""
+        self._call_all('post_create')
+
+    def find_nearest_from_id(self, _id, n=100, within_ids=None):
+        """Find the nearest vectors to the given ID.
+
+        :param _id: ID of the vector
+        :param n: number of nearest vectors to return
+        :param within_ids: list of IDs to search within
+        """
+        shard = self._shard(_id)
+        h = self._call({shard: ('get_vector', (_id,), {})})[shard]
+        return self.find_nearest_from_array(h, n=n, within_ids=within_ids)
+
+    def find_nearest_from_array(self, h, n=100, within_ids=None):
+        """Find the nearest vectors to the given vector.
+
+        :param h: vector
+        :param n: number of nearest vectors to return
+        :param within_ids: list of IDs to search within
+        """
+        h = self.to_numpy(h)[None, :]
+        return self.find_nearest_from_arrays(h, n=n, within_ids=within_ids)[0]
+
+    def find_nearest_from_arrays(self, h, n=100, within_ids=None):
+        """Find the nearest vectors to each of the given vectors.
+
+        :param h: 2-D array of vectors, one query per row
+        :param n: number of nearest vectors to return per query
+        :param within_ids: list of IDs to search within
+        """
+        h = self.to_numpy(h).astype(numpy.float32, copy=False)
+        if within_ids:
+            shard_ids: t.Dict[int, t.List[str]] = {}
+            for _id in within_ids:
+                shard_ids.setdefault(self._shard(_id), []).append(_id)
+            requests = {
+                shard: ('find_nearest_from_arrays', (h,), {'n': n, 'within_ids': ids})
+                for shard, ids in shard_ids.items()
+            }
+        else:
+            requests = {
+                shard: ('find_nearest_from_arrays', (h,), {'n': n})
+                for shard in range(self.n_shards)
+            }
+        results = list(self._call(requests).values())
+        return [
+            self._merge([shard_results[i] for shard_results in results], n)
+            for i in range(h.shape[0])
+        ]
+
+    @staticmethod
+    def _merge(results: t.List[t.Tuple[t.List[str], t.List[float]]], n: int):
+        ids = [_id for shard_ids, _ in results for _id in shard_ids]
+        scores = numpy.array(
+            [score for _, shard_scores in results for score in shard_scores]
+        )
+        top = numpy.argsort(-scores, kind='stable')[:n]
+        return [ids[i] for i in top], scores[top].tolist()
+
+    def save_snapshot(self, path: str, watermark: t.Optional[t.Dict] = None):
+        """Persist the vectors of every shard under ``path``.
+
+        :param path: Directory of the snapshot
+        :param watermark: Information describing when the snapshot was taken
+        """
+        self._call(
+            {
+                i: ('save_snapshot', (self._shard_path(path, i), watermark), {})
+                for i in range(self.n_shards)
+            }
+        )
+
+    def snapshot_watermark(self, path: str) -> t.Dict:
+        """Return the watermark the snapshot at ``path`` was saved with.
+
+        Every shard is saved with the same watermark.
+
+        :param path: Directory of the snapshot
+        """
+        return self._call(
+            {0: ('snapshot_watermark', (self._shard_path(path, 0),), {})}
+        )[0]
+
+    def load_snapshot(self, path: str) -> t.Optional[t.List[str]]:
+        """Restore the vectors of every shard from a snapshot at ``path``.
+
+        :param path: Directory of the snapshot
+        """
+        results = self._call(
+            {
+                i: ('load_snapshot', (self._shard_path(path, i),), {})
+                for i in range(self.n_shards)
+            }
+        )
+        ids = [_id for shard_ids in results.values() for _id in shard_ids or ()]
+        if any(shard_ids is None for shard_ids in results.values()):
+            # Shards restored from an incomplete snapshot are emptied again, as
+            # the whole index is backfilled.
+            self.delete(ids)
+            return None
+        return ids
+
+    def _shard_path(self, path: str, shard: int) -> str:
+        # The number of shards is part of the path, as it determines which
+        # shard each id belongs to.
+        return os.path.join(path, f'shard-{shard}-of-{self.n_shards}')
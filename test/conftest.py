@@ -136,6 +136,20 @@ def valid_dataset(db):
     return d
 
 
+@pytest.fixture
+def numbers_select(db):
+    # Table ``test`` of documents ``{'x': i, 'id': str(i)}`` for ``i < 10``
+    db.cfg.auto_schema = True
+    data = [Document({"x": i, "id": str(i)}) for i in range(10)]
+    if isinstance(db.databackend.type, MongoDataBackend):
+        db.execute(db['test'].insert_many(data))
+        return db['test'].find({})
+    schema = Schema(identifier="test", fields={"x": dtype(int), "id": dtype(str)})
+    db.apply(Table("test", schema=schema))
+    db.execute(db['test'].insert(data))
+    return db['test'].select("x", "id")
+
+
 def add_random_data_to_sql_db(
     db: Datalayer,
     table_name: str = 'documents',
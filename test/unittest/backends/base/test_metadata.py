@@ -0,0 +1,111 @@
+import time
+from test.db_config import DBConfig
+
+import pytest
+
+
+def _create_job(db, identifier, component='m'):
+    db.metadata.create_job(
+        {
+            'identifier': identifier,
+            'job_id': identifier,
+            'component_identifier': component,
+            'type_id': 'model',
+            'status': 'pending',
+            'info': {},
+        }
+    )
+
+
+@pytest.mark.parametrize(
+    "db", [DBConfig.mongodb_empty, DBConfig.sqldb_empty], indirect=True
+)
+def test_job_updates_are_buffered(db, monkeypatch):
+    writes = []
+    update_jobs = db.metadata._backend.update_jobs
+
+    def counting_update_jobs(updates):
+        writes.append(updates)
+        return update_jobs(updates)
+
+    monkeypatch.setattr(db.metadata._backend, 'update_jobs', counting_update_jobs)
+    monkeypatch.setattr(db.metadata, 'job_updates_interval', 60.0)
+    monkeypatch.setattr(db.metadata, 'job_updates_max_pending', 3)
+
+    for i in range(2):
+        _create_job(db, f'job-{i}')
+    for status in ['running', 'success']:
+        for i in range(2):
+            db.metadata.update_job(f'job-{i}', 'status', status)
+    db.metadata.update_job('job-0', 'info', {'progress': {'done': 1}})
+    assert not writes
+
+    # Reads of jobs write the buffer first, with one write per job
+    assert db.metadata.get_job('job-0')['status'] == 'success'
+    assert db.metadata.get_job('job-0')['info'] == {'progress': {'done': 1}}
+    assert writes == [
+        {
+            'job-0': {'status': 'success', 'info': {'progress': {'done': 1}}},
+            'job-1': {'status': 'success'},
+        }
+    ]
+
+    # The buffer is written once it holds updates of ``max_pending`` jobs
+    for i in range(2, 5):
+        _create_job(db, f'job-{i}')
+        db.metadata.update_job(f'job-{i}', 'status', 'failed')
+    assert len(writes) == 2
+    assert db.metadata.get_job('job-4')['status'] == 'failed'
+
+
+@pytest.mark.parametrize(
+    "db", [DBConfig.mongodb_empty, DBConfig.sqldb_empty], indirect=True
+)
+def test_job_ids_are_cached(db, monkeypatch):
+    reads = []
+    show_job_ids = db.metadata._backend.show_job_ids
+
+    def counting_show_job_ids(*args, **kwargs):
+        reads.append(kwargs)
+        return show_job_ids(*args, **kwargs)
+
+    monkeypatch.setattr(db.metadata._backend, 'show_job_ids', counting_show_job_ids)
+
+    _create_job(db, 'job-0')
+    assert db.metadata.show_job_ids('m', 'model') == ['job-0']
+    _create_job(db, 'job-1')
+    _create_job(db, 'job-2', component='other')
+    assert db.metadata.show_job_ids('m', 'model') == ['job-0', 'job-1']
+    assert len(reads) == 1
+
+    # Jobs created by other processes are seen once the cache expires
+    db.metadata._backend.create_job(
+        {
+            'identifier': 'job-3',
+            'job_id': 'job-3',
+            'component_identifier': 'm',
+            'type_id': 'model',
+            'status': 'pending',
+            'info': {},
+        }
+    )
+    assert db.metadata.show_job_ids('m', 'model') == ['job-0', 'job-1']
+    monkeypatch.setattr(db.metadata, 'job_updates_interval', 0.0)
+    assert db.metadata.show_job_ids('m', 'model') == ['job-0', 'job-1', 'job-3']
+    assert len(reads) == 2
+
+
+# The timer writes from its own thread, which in-memory SQLite doesn't share
+@pytest.mark.parametrize("db", [DBConfig.mongodb_empty], indirect=True)
+def test_job_updates_are_written_by_timer(db, monkeypatch):
+    monkeypatch.setattr(db.metadata, 'job_updates_interval', 0.2)
+    _create_job(db, 'job-0')
+    db.metadata.update_job('job-0', 'status', 'running')
+    assert db.metadata._backend.get_job('job-0')['status'] == 'pending'
+
+    # No further update or read is needed for the update to be written
+    deadline = time.time() + 5
+    while db.metadata._backend.get_job('job-0')['status'] != 'running':
+        assert time.time() < deadline
+        time.sleep(0.05)
+    assert not db.metadata._job_updates
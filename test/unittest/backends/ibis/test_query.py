@@ -209,3 +209,16 @@ def test_post_like(db):
     s = list(db.execute(query))
     assert len(s) == 2
     assert all([d['id'] in ['1', '2', '3'] for d in s])
+
+
+@pytest.mark.parametrize("db", [DBConfig.sqldb_empty], indirect=True)
+def test_native_ids(db):
+    schema = Schema(identifier='ints', fields={'id': dtype(int), 'x': dtype(int)})
+    db.apply(Table('ints', schema=schema, primary_id='id'))
+    db.execute(db['ints'].insert([Document({'id': i, 'x': i}) for i in range(3)]))
+
+    # Vector searchers return ids as strings
+    ids = db['ints']._native_ids('ints', ['0', '2'])
+    assert ids == [0, 2]
+    t = db['ints']
+    assert sorted(r['id'] for r in db.execute(t.filter(t.id.isin(ids)))) == [0, 2]
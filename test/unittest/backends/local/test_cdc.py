@@ -0,0 +1,126 @@
+from test.db_config import DBConfig
+
+import pytest
+
+from superduper import Document
+from superduper.backends.ibis.field_types import dtype
+from superduper.backends.local.cdc import LocalCDC
+from superduper.base.config import LogBasedStrategy, PollingStrategy
+from superduper.components.listener import Listener
+from superduper.components.model import ObjectModel
+from superduper.components.schema import Schema
+from superduper.components.table import Table
+
+
+def _setup(db, n=2):
+    db.cfg.auto_schema = True
+    data = [Document({"x": i, "id": str(i)}) for i in range(n)]
+    if db.databackend.db_type == 'MONGODB':
+        db.execute(db['test'].insert_many(data))
+        select = db['test'].find({})
+    else:
+        schema = Schema(identifier="test", fields={"x": dtype(int), "id": dtype(str)})
+        db.apply(Table("test", schema=schema))
+        db.execute(db['test'].insert(data))
+        select = db['test'].select("x", "id")
+    listener = Listener(
+        model=ObjectModel("m1", object=lambda x: x * 2),
+        select=select,
+        key="x",
+        identifier="listener1",
+    )
+    db.apply(listener)
+    return listener
+
+
+def _insert(db, data):
+    if db.databackend.db_type == 'MONGODB':
+        db.execute(db['test'].insert_many(data))
+    else:
+        db.execute(db['test'].insert(data))
+
+
+def _outputs(db, listener):
+    outputs = []
+    for r in db.execute(listener.outputs_select):
+        try:
+            outputs.append(Document(r.unpack())[listener.outputs_key])
+        except KeyError:
+            # Rows without outputs yet
+            pass
+    return sorted(outputs)
+
+
+@pytest.mark.parametrize(
+    "db", [DBConfig.mongodb_empty, DBConfig.sqldb_empty], indirect=True
+)
+@pytest.mark.parametrize("field", [None, 'x'])
+def test_cdc_polling_batches_inserts(db, field):
+    listener = _setup(db)
+    cdc = LocalCDC(db, strategy=PollingStrategy(auto_increment_field=field))
+    assert cdc.tables() == ['test']
+    assert cdc.poll() == {}
+
+    # Polling without a thread, since SQLite connections can't be shared
+    db.cdc = cdc
+    for i in range(2, 6):
+        _insert(db, [Document({"x": i, "id": str(i)})])
+    assert _outputs(db, listener) == [0, 2]
+
+    changes = cdc.poll()
+    assert len(changes['test']['insert']) == 4
+    assert _outputs(db, listener) == [2 * i for i in range(6)]
+    # One job for the listener, and one for all the inserts
+    assert len(db.metadata.show_jobs('m1', 'model')) == 2
+    assert cdc.poll() == {}
+
+
+@pytest.mark.parametrize("db", [DBConfig.mongodb_empty], indirect=True)
+def test_cdc_thread(db):
+    cdc = LocalCDC(db, strategy=PollingStrategy(frequency='60'), batch_size=3)
+    cdc.start()
+    assert db.cdc is cdc
+    # The table is watched from when the listener is applied
+    listener = _setup(db)
+    assert cdc.watermarks['test']
+
+    for i in range(2, 9):
+        _insert(db, [Document({"x": i, "id": str(i)})])
+    assert _outputs(db, listener) == [0, 2]
+
+    # Changes since the last poll are sent on stop; deletes are captured
+    # by comparing ids
+    db.execute(db['test'].delete_one({'x': 0}))
+    cdc.stop(timeout=5)
+    assert db.cdc is None
+    assert _outputs(db, listener) == [2 * i for i in range(1, 9)]
+    # The listener, 7 inserts in batches of 3, and the delete
+    assert len(db.metadata.show_jobs('m1', 'model')) == 5
+
+    _insert(db, [Document({"x": 9, "id": "9"})])
+    assert 18 in _outputs(db, listener)
+
+
+@pytest.mark.parametrize("db", [DBConfig.mongodb_empty], indirect=True)
+def test_cdc_captured_events(db):
+    _setup(db)
+    cdc = LocalCDC(db, strategy=PollingStrategy(auto_increment_field='y'))
+    assert cdc.captures('insert')
+    assert not cdc.captures('delete') and not cdc.captures('upsert')
+    assert LocalCDC(db, strategy=PollingStrategy()).captures('delete')
+    assert LocalCDC(db, strategy=LogBasedStrategy()).captures('upsert')
+    assert cdc.poll() == {}
+    db.cdc = cdc
+
+    # Deletes aren't captured by the field, so they run the listener at once
+    jobs = len(db.metadata.show_jobs('m1', 'model'))
+    db.execute(db['test'].delete_one({'x': 0}))
+    assert len(db.metadata.show_jobs('m1', 'model')) == jobs + 1
+
+    # Rows without the field are never captured, rather than at every poll
+    _insert(db, [Document({"x": 2, "id": "2"})])
+    assert cdc.poll() == {}
+    _insert(db, [Document({"x": 3, "id": "3", "y": 1})])
+    assert len(cdc.poll()['test']['insert']) == 1
+    assert cdc.watermarks['test'] == 1
+    assert cdc.poll() == {}
@@ -0,0 +1,97 @@
+import time
+from test.db_config import DBConfig
+
+import pytest
+
+from superduper import Document
+from superduper.backends.local.compute import LocalComputeBackend
+from superduper.components.listener import Listener
+from superduper.components.model import ObjectModel
+
+
+def _square(x, **kwargs):
+    return x * x
+
+
+def test_submit_inline():
+    compute = LocalComputeBackend()
+    future = compute.submit(_square, 3, job_id='a')
+    assert future.done() and compute.result('a') == 9
+
+    def fail():
+        raise ValueError('Job failed')
+
+    with pytest.raises(ValueError, match='Job failed'):
+        compute.submit(fail)
+
+
+def test_submit_runs_independent_jobs_in_parallel():
+    compute = LocalComputeBackend(num_workers=2)
+    spans = {}
+
+    def run(name, delay, **kwargs):
+        start = time.monotonic()
+        time.sleep(delay)
+        spans[name] = (start, time.monotonic())
+        return name
+
+    start = time.monotonic()
+    a = compute.submit(run, 'a', 0.2, job_id='a')
+    compute.submit(run, 'b', 0.2, job_id='b')
+    # Dependencies are futures or identifiers of submitted jobs
+    c = compute.submit(run, 'c', 0.0, job_id='c', dependencies=[a, 'b'])
+    assert c.result() == 'c'
+    compute.wait_all()
+
+    assert time.monotonic() - start < 0.35
+    assert spans['c'][0] >= max(spans['a'][1], spans['b'][1])
+    assert compute.result('b') == 'b'
+    compute.shutdown()
+
+
+def test_submit_fails_if_a_dependency_fails():
+    compute = LocalComputeBackend(num_workers=2)
+
+    def fail(**kwargs):
+        raise ValueError('Job failed')
+
+    upstream = compute.submit(fail, job_id='a')
+    downstream = compute.submit(_square, 1, dependencies=['a'])
+    compute.wait_all()
+
+    with pytest.raises(ValueError, match='Job failed'):
+        upstream.result()
+    with pytest.raises(RuntimeError, match='dependency'):
+        downstream.result()
+    compute.shutdown()
+
+
+def test_submit_on_processes():
+    compute = LocalComputeBackend(num_workers=2, pool='process')
+    futures = [compute.submit(_square, i) for i in range(4)]
+    assert [f.result() for f in futures] == [0, 1, 4, 9]
+    compute.shutdown()
+
+
+@pytest.mark.parametrize("db", [DBConfig.mongodb_empty], indirect=True)
+def test_listeners_run_in_parallel(db):
+    db.set_compute(LocalComputeBackend(num_workers=2))
+    db.execute(db['test'].insert_many([Document({'x': i}) for i in range(5)]))
+
+    for i in range(2):
+        db.apply(
+            Listener(
+                model=ObjectModel(f'm{i}', object=lambda x: (time.sleep(0.1), x)[1]),
+                select=db['test'].find(),
+                key='x',
+                identifier=f'listener{i}',
+            )
+        )
+    db.compute.wait_all()
+
+    assert [f.exception() for f in db.compute.tasks.values()] == [None] * len(
+        db.compute.tasks
+    )
+    for r in db.execute(db['test'].find()):
+        assert len(r['_outputs']) == 2
+    db.compute.shutdown()
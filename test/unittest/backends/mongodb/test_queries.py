@@ -155,6 +155,21 @@ def test_like(db):
     assert r['_id'] == s['_id']
 
 
+@pytest.mark.skipif(not torch, reason='Torch not installed')
+def test_like_after_find_with_filter_keyword(db):
+    collection = MongoQuery(table='documents')
+    r, *others = list(db.execute(collection.find()))
+    ids = [doc['_id'] for doc in others[:2]]
+
+    query = collection.find(filter={'_id': {'$in': ids}}).like(
+        r=Document({'x': r['x']}),
+        vector_index='test_vector_search',
+        n=3,
+    )
+    # The vector search is restricted to the documents of the filter
+    assert sorted(doc['_id'] for doc in db.execute(query)) == sorted(ids)
+
+
 @pytest.mark.skipif(not torch, reason='Torch not installed')
 def test_insert_one(db):
     # MARK: empty Collection + a_single_insert
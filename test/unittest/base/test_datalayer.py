@@ -19,6 +19,7 @@ import dataclasses as dc
 from test.db_config import DBConfig
 from unittest.mock import MagicMock, patch
 
+from superduper import CFG
 from superduper.backends.ibis.field_types import dtype
 from superduper.backends.mongodb.data_backend import MongoDataBackend
 from superduper.backends.mongodb.query import MongoQuery
@@ -39,6 +40,7 @@ from superduper.components.listener import Listener
 from superduper.components.model import ObjectModel, _Fittable
 from superduper.components.schema import Schema
 from superduper.components.table import Table
+from superduper.vector_search.base import VectorItem
 
 n_data_points = 250
 
@@ -426,6 +428,21 @@ def test_load(db):
     assert 'e1' in db.datatypes
 
 
+@pytest.mark.parametrize("db", EMPTY_CASES, indirect=True)
+def test_load_cached(db):
+    db.apply(DataType(identifier='e1'))
+    uuid = db.load('datatype', 'e1').uuid
+
+    datatype = db.load(uuid=uuid, cached=True)
+    assert db.load(uuid=uuid, cached=True) is datatype
+    assert db.load(uuid=uuid) is not datatype
+
+    # Removing components clears the cache
+    db.remove('datatype', 'e1', force=True)
+    with pytest.raises(Exception):
+        db.load(uuid=uuid, cached=True)
+
+
 @pytest.mark.parametrize("db", [DBConfig.mongodb_empty], indirect=True)
 def test_insert_mongo_db(db):
     add_fake_model(db)
@@ -709,3 +726,59 @@ def test_retry_on_token_expiry(db):
     db.execute(MongoQuery(table='documents').insert([{'x': 1}]))
 
     assert db.databackend.reconnect.call_count == 1
+
+
+@pytest.mark.parametrize("db", [DBConfig.mongodb, DBConfig.sqldb], indirect=True)
+def test_vector_search_snapshot(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(CFG.cluster.vector_search, 'snapshot_home', str(tmp_path))
+    searcher = db.initialize_vector_searcher('test_vector_search').searcher
+    n_vectors = len(searcher)
+    assert n_vectors > 0
+
+    with patch.object(db, 'execute', wraps=db.execute) as execute:
+        searcher = db.initialize_vector_searcher('test_vector_search').searcher
+    # Nothing was predicted since the snapshot, so nothing is queried
+    assert execute.call_count == 0
+    assert len(searcher) == n_vectors
+
+    # Vectors missing from the snapshot are backfilled
+    stale_id = searcher.index[0]
+    snapshot_path = db._vector_snapshot_path(db.vector_indices['test_vector_search'])
+    searcher.delete([stale_id])
+    searcher.save_snapshot(snapshot_path)
+    searcher = db.initialize_vector_searcher('test_vector_search').searcher
+    assert len(searcher) == n_vectors
+    assert stale_id in searcher.lookup
+
+
+@pytest.mark.parametrize("db", [DBConfig.mongodb, DBConfig.sqldb], indirect=True)
+def test_vector_search_snapshot_refreshes_predicted_outputs(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(CFG.cluster.vector_search, 'snapshot_home', str(tmp_path))
+    vi = db.vector_indices['test_vector_search']
+    snapshot_path = db._vector_snapshot_path(vi)
+    searcher = db.initialize_vector_searcher('test_vector_search').searcher
+    _id = searcher.index[0]
+    vector = searcher.get_vector(_id).copy()
+
+    def tamper(watermark):
+        searcher.add([VectorItem.create(id=_id, vector=-vector)])
+        searcher.save_snapshot(snapshot_path, watermark=watermark)
+
+    # Outputs predicted again since the snapshot are loaded again
+    tamper(searcher.snapshot_watermark(snapshot_path))
+    listener = vi.indexing_listener
+    listener.model.predict_in_db_job(
+        X=listener.key,
+        db=db,
+        predict_id=listener.predict_id,
+        select=listener.select,
+        ids=[_id],
+        overwrite=True,
+    )
+    searcher = db.initialize_vector_searcher('test_vector_search').searcher
+    numpy.testing.assert_allclose(searcher.get_vector(_id), vector)
+
+    # A snapshot of another version of the model is loaded again entirely
+    tamper({**searcher.snapshot_watermark(snapshot_path), 'model': 'other'})
+    searcher = db.initialize_vector_searcher('test_vector_search').searcher
+    numpy.testing.assert_allclose(searcher.get_vector(_id), vector)
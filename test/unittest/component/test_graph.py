@@ -1,3 +1,5 @@
+import threading
+import time
 from test.db_config import DBConfig
 
 import networkx as nx
@@ -163,3 +165,61 @@ def test_to_listeners():
 
     print('\n')
     pprint.pprint(listener_stack)
+
+
+class _LazyDataset:
+    # Dataset read item by item, recording the largest index read
+    def __init__(self, n):
+        self.n = n
+        self.read = []
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, i):
+        self.read.append(i)
+        return i
+
+
+@pytest.mark.parametrize('num_workers', [0, 2])
+def test_graph_streams_batches(num_workers):
+    batch_sizes = []
+    lock = threading.Lock()
+
+    def slow_increment(x):
+        time.sleep(0.01)
+        return x + 1
+
+    def record(model):
+        predict_batches = model.predict_batches
+
+        def wrapper(dataset):
+            with lock:
+                batch_sizes.append(len(dataset))
+            return predict_batches(dataset)
+
+        model.predict_batches = wrapper
+        return model
+
+    model1 = record(ObjectModel('s1', object=slow_increment, signature='singleton'))
+    left = record(ObjectModel('left', object=slow_increment, signature='singleton'))
+    right = record(ObjectModel('right', object=slow_increment, signature='singleton'))
+    g = Graph(
+        identifier='streaming-graph',
+        input=model1,
+        outputs=[left, right],
+        batch_size=4,
+        num_workers=num_workers,
+    )
+    g.connect(model1, left)
+    g.connect(model1, right)
+
+    dataset = _LazyDataset(10)
+    start = time.time()
+    assert g.predict_batches(dataset) == [list(range(2, 12)), list(range(2, 12))]
+    elapsed = time.time() - start
+    assert dataset.read == list(range(10))
+    assert max(batch_sizes) == 4 and len(batch_sizes) == 9
+    if num_workers:
+        # The independent branches run at the same time
+        assert elapsed < 0.25
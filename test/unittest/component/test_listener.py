@@ -274,3 +274,41 @@ def test_listener_cleanup_ibis(db, data, flatten):
     db.remove('listener', listener1.identifier, force=True)
 
     assert listener1.outputs not in db.databackend.conn.tables
+
+
+@pytest.mark.parametrize(
+    "db", [DBConfig.mongodb_empty, DBConfig.sqldb_empty], indirect=True
+)
+def test_listener_pipelined_predictions(db, numbers_select):
+    select = numbers_select
+
+    listener = Listener(
+        model=ObjectModel("m1", object=lambda x: x * 2),
+        select=select,
+        key="x",
+        identifier="listener1",
+        predict_kwargs={'max_chunk_size': 3, 'pipeline_depth': 1},
+    )
+    db.add(listener)
+
+    outputs = [
+        Document(doc.unpack())[listener.outputs_key]
+        for doc in db.execute(listener.outputs_select)
+    ]
+    assert sorted(outputs) == [2 * i for i in range(10)]
+
+    def fail(x):
+        if x == 7:
+            raise ValueError('Prediction failed')
+        return x
+
+    failing = ObjectModel("m2", object=fail)
+    with pytest.raises(ValueError, match='Prediction failed'):
+        failing.predict_in_db(
+            X='x',
+            db=db,
+            select=select,
+            predict_id='failing',
+            max_chunk_size=3,
+            pipeline_depth=1,
+        )
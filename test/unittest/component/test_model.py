@@ -1,6 +1,8 @@
+import copy
 import dataclasses as dc
+import os
 from test.db_config import DBConfig
-from unittest.mock import MagicMock, patch
+from unittest.mock import ANY, MagicMock, patch
 
 import bson
 import numpy as np
@@ -100,6 +102,27 @@ def test_predict_core_multikey(predict_mixin_multikey):
     assert isinstance(output, list)
 
 
+def worker_pid(x):
+    return os.getpid()
+
+
+def test_predict_batches_worker_pool():
+    m = ObjectModel('test', object=worker_pid, signature='singleton', num_workers=2)
+    pids = m.predict_batches(list(range(20)))
+    pool = m._worker_pool
+    pids += m.predict_batches(list(range(20)))
+
+    # The workers are started once and reused across calls
+    assert m._worker_pool is pool
+    assert len(set(pids)) <= 2
+    assert os.getpid() not in pids
+    assert copy.deepcopy(m)._worker_pool is None
+
+    m.shutdown_workers()
+    assert m._worker_pool is None
+    assert not any(worker.is_alive() for worker in pool._pool._pool)
+
+
 def test_pm_core_predict(predict_mixin):
     # make sure predict is called
     with patch.object(predict_mixin, 'predict', return_self):
@@ -129,6 +152,7 @@ def test_pm_create_predict_job(mock_job, predict_mixin):
         component_identifier=predict_mixin.identifier,  # Adjust according to your setup
         method_name='predict_in_db',
         type_id='model',
+        identifier=ANY,
         kwargs={
             'X': X,
             'select': b'encoded_select',
@@ -137,10 +161,19 @@ def test_pm_create_predict_job(mock_job, predict_mixin):
             'max_chunk_size': max_chunk_size,
             'in_memory': in_memory,
             'overwrite': overwrite,
+            'pipeline_depth': 0,
+            'job_id': None,
         },
         compute_kwargs={},
     )
 
+    # A checkpointing job saves its progress under its own id
+    predict_mixin.predict_in_db_job(
+        X=X, db=mock_db, select=mock_select, predict_id='test', checkpoint=True
+    )
+    kwargs = mock_job.call_args.kwargs
+    assert kwargs['kwargs']['job_id'] == kwargs['identifier']
+
 
 def test_pm_predict_batches(predict_mixin):
     # Check the logic of predict method, the mock method will be tested below
@@ -227,6 +260,55 @@ def test_pm_predict_with_select_ids(monkeypatch, predict_mixin):
             assert kwargs.get('outputs') == [str({'out': 2}) for _ in range(10)]
 
 
+@pytest.mark.parametrize(
+    "db", [DBConfig.mongodb_empty, DBConfig.sqldb_empty], indirect=True
+)
+@pytest.mark.parametrize("pipeline_depth", [0, 1])
+def test_predict_in_db_resumes_from_checkpoint(db, numbers_select, pipeline_depth):
+    select = numbers_select
+
+    seen = []
+
+    def fail(x):
+        seen.append(x)
+        if x == 7:
+            raise ValueError('Prediction failed')
+        return x * 2
+
+    model = ObjectModel("m", object=fail)
+    job = ComponentJob(
+        component_identifier='m', type_id='model', method_name='predict_in_db'
+    )
+    db.metadata.create_job(job.dict())
+    kwargs = dict(
+        X='x',
+        db=db,
+        select=select,
+        predict_id='m',
+        max_chunk_size=3,
+        pipeline_depth=pipeline_depth,
+        job_id=job.identifier,
+    )
+    with pytest.raises(ValueError, match='Prediction failed'):
+        model.predict_in_db(**kwargs)
+
+    # The first two chunks were written before the failure
+    progress = db.metadata.get_job(job.identifier)['info']['progress']
+    assert progress == {'done': 6, 'total': 10, 'percent': 60.0}
+
+    # The ids are loaded from the checkpoint instead of queried again
+    seen.clear()
+    model.object = lambda x: seen.append(x) or x * 2
+    with patch.object(model, '_get_ids_from_select', side_effect=AssertionError):
+        model.predict_in_db(**kwargs)
+    assert len(seen) == 4
+
+    progress = db.metadata.get_job(job.identifier)['info']['progress']
+    assert progress == {'done': 10, 'total': 10, 'percent': 100.0}
+    missing = db.execute(select.select_ids_of_missing_outputs(predict_id='m'))
+    assert not list(missing)
+
+
 def test_model_append_metrics():
     @dc.dataclass
     class _Tmp(ObjectModel, _Fittable):
@@ -1,4 +1,11 @@
+from test.db_config import DBConfig
+
+import numpy as np
+import pytest
+
+from superduper.backends.mongodb.query import MongoQuery
 from superduper.base.datalayer import ibatch
+from superduper.components.vector_index import sqlvector
 
 
 def test_ibatch():
@@ -8,3 +15,31 @@ def test_ibatch():
 
 
 # TODO: test superduper.components.vector_index
+
+
+def test_sqlvector_dtype():
+    datatype = sqlvector(shape=(3,), dtype='float16')
+    encoded = datatype.encoder([1.0, 2.0, 3.0])
+    assert len(encoded) == 6
+    assert datatype.decoder(encoded) == [1.0, 2.0, 3.0]
+    assert datatype.identifier == 'sqlvector[3,float16]'
+    assert sqlvector(shape=(3,)).identifier == 'sqlvector[3]'
+
+    with pytest.raises(TypeError):
+        datatype.encoder(np.array([1, 2, 3]))
+
+
+@pytest.mark.parametrize("db", [(DBConfig.mongodb, {'n_data': 20})], indirect=True)
+def test_select_nearest_batch(db):
+    import torch
+
+    likes = [{'x': torch.randn(32)} for _ in range(3)]
+    r = db.execute(MongoQuery(table='documents').find_one())
+    likes.append({'_id': r['_id']})
+
+    results = db.select_nearest_batch(likes, vector_index='test_vector_search', n=5)
+    assert len(results) == 4
+    for like, (ids, scores) in zip(likes, results):
+        expected = db.select_nearest(like, vector_index='test_vector_search', n=5)
+        assert ids == expected[0]
+        assert np.allclose(scores, expected[1], atol=1e-6)
@@ -1,3 +1,6 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 
 try:
@@ -97,3 +100,105 @@ def test_fit(db, valid_dataset, model):
         datasets=[valid_dataset],
     )
     db.apply(m)
+
+
+class _SumOfEmbeddings(torch.nn.Module if torch else object):
+    # Padding with zeros doesn't change the output
+    def __init__(self):
+        super().__init__()
+        self.embedding = torch.nn.Embedding(10, 16, padding_idx=0)
+        self.linear = torch.nn.Linear(16, 1, bias=False)
+
+    def forward(self, x):
+        return self.linear(self.embedding(x)).sum(dim=(1, 2))
+
+
+@pytest.mark.skipif(not torch, reason='Torch not installed')
+def test_predict_batches_bucket_by_size():
+    widths = []
+
+    def collate(items):
+        width = max(len(x) for x in items)
+        widths.append(width)
+        padded = torch.zeros(len(items), width, dtype=torch.long)
+        for i, x in enumerate(items):
+            padded[i, : len(x)] = x
+        return padded
+
+    torch.manual_seed(0)
+    data = [torch.randint(1, 10, (n,)) for n in [1, 50, 2, 49, 3, 48, 4, 47]]
+    model = TorchModel(
+        object=_SumOfEmbeddings(),
+        identifier='test',
+        preferred_devices=('cpu',),
+        collate_fn=collate,
+        loader_kwargs={'batch_size': 2},
+    )
+    expected = model.predict_batches(data)
+    assert widths == [50, 49, 48, 47]
+
+    widths.clear()
+    model.bucket_by_size = True
+    model.num_threads = 1
+    threads = torch.get_num_threads()
+    outputs = model.predict_batches(data)
+    assert widths == [2, 4, 48, 50]
+    assert torch.allclose(torch.stack(outputs), torch.stack(expected))
+    assert torch.get_num_threads() == threads
+
+    # Inputs are sorted within windows of ``bucket_window`` inputs
+    widths.clear()
+    model.bucket_window = 4
+    outputs = model.predict_batches(data)
+    assert widths == [2, 50, 4, 48]
+    assert torch.allclose(torch.stack(outputs), torch.stack(expected))
+
+
+@pytest.mark.skipif(not torch, reason='Torch not installed')
+def test_predict_inference_mode():
+    model = TorchModel(
+        object=torch.nn.Linear(4, 2),
+        identifier='test',
+        preferred_devices=('cpu',),
+    )
+    x = torch.randn(4)
+    assert not model.predict(x).is_inference()
+    model.inference_mode = True
+    assert model.predict(x).is_inference()
+
+
+@pytest.mark.skipif(not torch, reason='Torch not installed')
+def test_num_threads_is_serialised():
+    from superduper.ext.torch.utils import num_threads
+
+    threads = torch.get_num_threads()
+    seen = []
+
+    def set_threads(n):
+        with num_threads(n):
+            time.sleep(0.01)
+            seen.append((n, torch.get_num_threads()))
+
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(set_threads, [1, 2, 3, 4] * 4))
+    assert all(n == m for n, m in seen)
+    assert torch.get_num_threads() == threads
+
+
+@pytest.mark.skipif(not torch, reason='Torch not installed')
+def test_predict_quantized():
+    torch.manual_seed(0)
+    module = torch.nn.Sequential(torch.nn.Linear(64, 64), torch.nn.ReLU())
+    model = TorchModel(
+        object=module, identifier='test', preferred_devices=('cpu',), quantize=True
+    )
+    x = torch.randn(64)
+    with torch.no_grad():
+        expected = module(x)
+    output = model.predict(x)
+    assert torch.allclose(output, expected, atol=0.1)
+    assert any('quantized' in type(m).__module__ for m in model._quantized.modules())
+    assert type(model.object[0]) is torch.nn.Linear
+
+    model.train()
+    assert model._quantized is None
@@ -1,6 +1,11 @@
 import pytest
 
-from superduper.ext.utils import format_prompt, get_key
+from superduper.ext.utils import (
+    estimate_tokens,
+    format_prompt,
+    get_key,
+    pack_batches,
+)
 
 
 def test_patch_environment_variable(monkeypatch):
@@ -39,3 +44,16 @@ def test_format_prompt_valid(X, prompt, context, output):
 def test_format_prompt_invalid():
     with pytest.raises(ValueError):
         format_prompt('X', 'This is a prompt {context}')
+
+
+def test_pack_batches():
+    assert estimate_tokens('a' * 40) == 11
+    assert pack_batches([1] * 5, max_size=2) == [range(0, 2), range(2, 4), range(4, 5)]
+    # A long input gets a batch of its own
+    assert pack_batches([3, 3, 20, 3, 3, 3], max_size=10, max_tokens=8) == [
+        range(0, 2),
+        range(2, 3),
+        range(3, 5),
+        range(5, 6),
+    ]
+    assert pack_batches([], max_size=10) == []
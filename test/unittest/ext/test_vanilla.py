@@ -141,3 +141,36 @@ def test_function_predict_with_mix_flatten_outputs(data_in_db):
         5,
     ]
     assert [o['_source'] for o in out] == source_ids
+
+
+@pytest.mark.parametrize("db", [DBConfig.mongodb_empty], indirect=True)
+def test_function_predict_deduplicated(db):
+    X = [1, 2, 1, 3, 2, 1]
+    db.execute(
+        MongoQuery(table='documents').insert_many([Document({'X': x}) for x in X])
+    )
+    calls = []
+
+    def triple(x):
+        calls.append(x)
+        return [x] * 3
+
+    function = ObjectModel(
+        object=triple,
+        identifier='test',
+        flatten=True,
+        deduplicate=True,
+        model_update_kwargs={'document_embedded': False},
+    )
+    function.predict_in_db(
+        X='X',
+        db=db,
+        select=MongoQuery(table='documents').find(),
+        predict_id='test',
+    )
+    assert sorted(calls) == [1, 2, 3]
+
+    docs = {d['_id']: d['X'] for d in db.execute(MongoQuery(table='documents').find())}
+    out = list(db.execute(MongoQuery(table='_outputs.test').find({})))
+    assert len(out) == 3 * len(X)
+    assert all(o['_outputs']['test'] == docs[o['_source']] for o in out)
@@ -0,0 +1,153 @@
+import threading
+import time
+from test.db_config import DBConfig
+
+import pytest
+
+from superduper import Document
+from superduper.backends.local.compute import LocalComputeBackend
+from superduper.base.config import EventQueue
+from superduper.components.model import ObjectModel
+from superduper.jobs.queue import LocalCoalescingQueue
+
+
+class _Component:
+    type_id = 'listener'
+
+    def __init__(self, identifier, delay=0.0, fail=False):
+        self.identifier = identifier
+        self.delay = delay
+        self.fail = fail
+        self.calls = []
+
+    def run_jobs(self, db, ids, overwrite, event_type):
+        time.sleep(self.delay)
+        if self.fail:
+            raise ValueError('Job failed')
+        self.calls.append((event_type, ids))
+        return []
+
+
+def _events(ids, type='insert'):
+    return [{'identifier': i, 'type': type} for i in ids]
+
+
+def _to(component):
+    return {'type_id': component.type_id, 'identifier': component.identifier}
+
+
+def test_coalescing_queue_merges_events():
+    queue = LocalCoalescingQueue(window=0.2)
+    a, b = _Component('a'), _Component('b')
+    queue.declare_component(a)
+    queue.declare_component(b)
+
+    start = time.monotonic()
+    for i in range(5):
+        assert queue.publish(_events([i]), to=_to(a)) == {}
+    queue.publish(_events([5]), to=[_to(a), _to(b)])
+    queue.publish(_events([0], type='delete'), to=_to(b))
+    assert time.monotonic() - start < 0.1
+    assert not a.calls
+
+    queue.flush()
+    assert a.calls == [('insert', [0, 1, 2, 3, 4, 5])]
+    assert b.calls == [('insert', [5]), ('delete', [0])]
+    queue.close()
+
+
+def test_coalescing_queue_batch_size_and_backpressure():
+    queue = LocalCoalescingQueue(window=10.0, max_batch_size=3, max_pending=3)
+    a = _Component('a', delay=0.1)
+    queue.declare_component(a)
+
+    # A full batch doesn't wait for the window
+    queue.publish(_events([0, 1, 2]), to=_to(a))
+    time.sleep(0.05)
+    # The queue is full while the first batch runs, so this blocks until
+    # the consumer takes the next events
+    queue.publish(_events([3, 4, 5]), to=_to(a))
+    start = time.monotonic()
+    queue.publish(_events([6]), to=_to(a))
+    assert time.monotonic() - start >= 0.03
+
+    queue.flush(timeout=1.0)
+    assert [ids for _, ids in a.calls] == [[0, 1, 2], [3, 4, 5], [6]]
+    queue.close()
+
+
+class _Chained(_Component):
+    # Publishes the ids of its events to a downstream component
+    def __init__(self, identifier, queue, downstream, started, release):
+        super().__init__(identifier)
+        self.queue = queue
+        self.downstream = downstream
+        self.started = started
+        self.release = release
+
+    def run_jobs(self, db, ids, overwrite, event_type):
+        self.started.set()
+        self.release.wait(1.0)
+        self.calls.append((event_type, ids))
+        self.queue.publish(_events(ids), to=_to(self.downstream))
+        return []
+
+
+def test_coalescing_queue_chained_publish_skips_backpressure():
+    queue = LocalCoalescingQueue(window=0.0, max_pending=2)
+    started, release = threading.Event(), threading.Event()
+    b = _Component('b')
+    a = _Chained('a', queue, b, started, release)
+    queue.declare_component(a)
+    queue.declare_component(b)
+
+    # The queue is full when the job of ``a`` publishes to ``b``
+    queue.publish(_events([0]), to=_to(a))
+    assert started.wait(1.0)
+    queue.publish(_events([1, 2]), to=_to(a))
+    release.set()
+
+    queue.flush(timeout=2.0)
+    assert a.calls == [('insert', [0]), ('insert', [1, 2])]
+    assert b.calls == [('insert', [0]), ('insert', [1, 2])]
+    queue.close()
+
+
+def test_coalescing_queue_raises_errors_on_flush():
+    queue = LocalCoalescingQueue(window=0.0)
+    a = _Component('a', fail=True)
+    queue.declare_component(a)
+    queue.publish(_events([0]), to=_to(a))
+    with pytest.raises(ValueError, match='Job failed'):
+        queue.flush()
+    # Errors are raised once
+    queue.flush()
+
+    # Queued events are consumed when the queue closes
+    a.fail = False
+    queue.window = 10.0
+    queue.publish(_events([1]), to=_to(a))
+    thread = threading.Thread(target=queue.close)
+    thread.start()
+    thread.join(timeout=1.0)
+    assert a.calls == [('insert', [1])]
+
+
+@pytest.mark.parametrize("db", [DBConfig.mongodb_empty], indirect=True)
+def test_inserts_return_before_listeners_run(db):
+    db.set_compute(LocalComputeBackend(queue=EventQueue(asynchronous=True, window=0.2)))
+    db.execute(db['test'].insert_many([Document({'x': 0})]))
+    model = ObjectModel('m', object=lambda x: x + 1)
+    db.apply(model.to_listener(select=db['test'].find(), key='x', identifier='l'))
+    db.compute.wait_all()
+
+    for i in range(1, 6):
+        db.execute(db['test'].insert_many([Document({'x': i})]))
+    assert sum('_outputs' in r for r in db.execute(db['test'].find())) == 1
+
+    db.compute.wait_all()
+    outputs = [r['_outputs'] for r in db.execute(db['test'].find())]
+    assert len(outputs) == 6
+    # One job for the listener, and one for all the inserts
+    assert len(db.metadata.show_jobs('m', 'model')) == 2
+    db.compute.shutdown()
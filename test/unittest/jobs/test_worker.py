@@ -0,0 +1,64 @@
+import dataclasses as dc
+
+from superduper import CFG
+from superduper.components.model import ObjectModel
+from superduper.jobs import worker
+from superduper.jobs.tasks import method_job
+
+
+@dc.dataclass(kw_only=True)
+class _Counter(ObjectModel):
+    def count(self, db):
+        self.calls = getattr(self, 'calls', 0) + 1
+        return self.calls
+
+
+def test_method_job_keeps_components_loaded(monkeypatch, tmp_path):
+    runtime = worker.WorkerRuntime(max_components=1)
+    monkeypatch.setattr(worker, '_runtime', runtime)
+    cfg = CFG(
+        data_backend='mongomock:///test_worker',
+        artifact_store=f'filesystem://{tmp_path}',
+    )
+    db = runtime.datalayer(cfg)
+    db.apply(_Counter('counter', object=lambda x: x))
+
+    def run():
+        method_job(cfg.dict(), 'model', 'counter', 'count', (), {}, job_id='job')
+
+    run()
+    run()
+    assert runtime.stats['datalayer']['cold'] == 1
+    assert runtime.stats['datalayer']['warm'] == 2
+    assert runtime.stats['component']['cold'] == 1
+    assert runtime.stats['component']['warm'] == 1
+    component = runtime.component(db, 'model', 'counter')
+    assert component.calls == 2
+
+    # A new version is loaded again, and evicts the old one
+    db.apply(_Counter('counter', object=lambda x: x + 1))
+    run()
+    assert runtime.stats['component']['cold'] == 2
+    assert runtime.component(db, 'model', 'counter').version == 1
+    assert len(runtime._components) == 1
+    assert worker.worker_stats() is runtime.stats
+
+
+def test_component_is_loaded_again_after_replace(tmp_path):
+    runtime = worker.WorkerRuntime(max_components=2)
+    cfg = CFG(
+        data_backend='mongomock:///test_worker_replace',
+        artifact_store=f'filesystem://{tmp_path}',
+    )
+    db = runtime.datalayer(cfg)
+    model = ObjectModel('model', object=lambda x: x + 1)
+    db.apply(model)
+    assert runtime.component(db, 'model', 'model').predict(1) == 2
+    assert runtime.component(db, 'model', 'model').predict(1) == 2
+    assert runtime.stats['component']['cold'] == 1
+
+    # Fitting replaces the artifacts under the same uuid and version
+    model.object = lambda x: x + 10
+    db.replace(model)
+    assert runtime.component(db, 'model', 'model').predict(1) == 11
+    assert runtime.stats['component']['cold'] == 2
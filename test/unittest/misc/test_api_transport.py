@@ -0,0 +1,221 @@
+import json
+import multiprocessing
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from superduper.components.model import APIBaseModel, APIModel
+from superduper.misc.api_transport import (
+    APITransport,
+    TokenBucket,
+    get_transport,
+    too_large,
+)
+
+
+class _MockAPI(BaseHTTPRequestHandler):
+    # Answers ``/double/<x>`` with ``2 * x`` after a delay, rate-limiting
+    # the first ``limited`` requests
+    limited = 0
+    delay = 0.05
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            limited = cls.limited > 0
+            cls.limited -= 1
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        time.sleep(cls.delay)
+        with cls.lock:
+            cls.in_flight -= 1
+        if limited:
+            self.send_response(429)
+            self.send_header('Retry-After', '0')
+            body = b'{}'
+        else:
+            self.send_response(200)
+            body = json.dumps(2 * int(self.path.split('/')[-1])).encode()
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def mock_api():
+    _MockAPI.limited = 0
+    _MockAPI.max_in_flight = 0
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _MockAPI)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=20, capacity=1)
+    transport = APITransport(max_concurrency=8)
+    start = time.monotonic()
+    transport.map(lambda x: x, range(5), rate_limit=bucket)
+    # The first request uses the initial token, the others wait 1/20s each
+    assert time.monotonic() - start >= 0.19
+
+
+def test_api_model_predict_batches(mock_api):
+    model = APIModel(
+        'double',
+        url=mock_api + '/double/{x}',
+        max_batch_size=4,
+        signature='**kwargs',
+    )
+    start = time.monotonic()
+    assert model.predict_batches([{'x': i} for i in range(16)]) == [
+        2 * i for i in range(16)
+    ]
+    # 16 requests of 0.05s, 4 at a time
+    assert time.monotonic() - start < 0.7
+    assert 1 < _MockAPI.max_in_flight <= 4
+
+
+def test_api_model_rate_limited(mock_api):
+    _MockAPI.limited = 1
+    model = APIModel('double', url=mock_api + '/double/{x}')
+    assert model.predict(x=5) == 10
+
+    transport = APITransport(max_retries=1, backoff=0.01)
+    _MockAPI.limited = 2
+    assert transport.request('GET', mock_api + '/double/1').status_code == 429
+
+
+def test_transport_retries_client_errors():
+    class RateLimitError(Exception):
+        status_code = 429
+
+    calls = []
+
+    def flaky(x):
+        calls.append(x)
+        if calls.count(x) < 3:
+            raise RateLimitError
+        return x
+
+    transport = APITransport(backoff=0.01)
+    assert transport.map(flaky, [1, 2]) == [1, 2]
+    assert len(calls) == 6
+
+    def fail(x):
+        raise ValueError(x)
+
+    outputs = transport.map(fail, [1], return_exceptions=True)
+    assert isinstance(outputs[0], ValueError)
+
+
+class _Embedding(APIBaseModel):
+    # Fails on requests of more than ``max_tokens`` estimated tokens
+    max_tokens: int = 40
+    signature: str = 'singleton'
+
+    def predict(self, X):
+        return self._predict_a_batch([X])[0]
+
+    def _predict_a_batch(self, batch):
+        self.requests.append(len(batch))
+        if sum(len(x) // 4 + 1 for x in batch) > self.max_tokens:
+            raise ValueError('Too many tokens')
+        return [len(x) for x in batch]
+
+
+def test_predict_in_batches():
+    texts = ['a' * 8] * 10 + ['b' * 120] + ['c' * 8] * 10
+    model = _Embedding('embedding')
+    model.requests = []
+
+    # Packing by tokens puts the long text on its own
+    outputs = model._predict_in_batches(texts, batch_size=100, max_batch_tokens=30)
+    assert outputs == [len(x) for x in texts]
+    assert sorted(model.requests) == [1, 10, 10]
+
+    # Fixed-size batches which fail are split until they succeed
+    model.requests = []
+    assert model._predict_in_batches(texts, batch_size=21) == outputs
+    assert model.requests[0] == 21 and sum(model.requests) > 21
+
+    model.max_tokens = 10
+    with pytest.raises(ValueError, match='Too many tokens'):
+        model._predict_in_batches(texts, batch_size=100)
+
+    # Transient errors are raised without splitting the batch
+    class ServerError(Exception):
+        status_code = 500
+
+    def unavailable(batch):
+        model.requests.append(len(batch))
+        raise ServerError('Too many requests in flight')
+
+    model.requests = []
+    model._predict_a_batch = unavailable
+    with pytest.raises(ServerError):
+        model._predict_in_batches(texts, batch_size=100)
+    assert model.requests == [21]
+
+
+def test_too_large():
+    class APIError(Exception):
+        def __init__(self, message, status_code=None):
+            super().__init__(message)
+            self.status_code = status_code
+
+    assert too_large(APIError('Payload', 413))
+    assert too_large(APIError('Maximum context length exceeded', 400))
+    assert too_large(ValueError('Too many tokens'))
+    assert not too_large(APIError('Request timed out'))
+    assert not too_large(APIError('Too many tokens', 500))
+    assert not too_large(APIError('Too many requests', 429))
+
+
+class _Length(APIBaseModel):
+    signature: str = 'singleton'
+
+    def predict(self, X):
+        return len(X)
+
+
+def test_predict_in_batches_default():
+    # Without a batched endpoint each input is one request
+    model = _Length('length')
+    assert model._predict_in_batches(['a', 'bb', 'ccc'], batch_size=2) == [1, 2, 3]
+
+
+def _double(x):
+    return 2 * x
+
+
+def _map_in_child(results):
+    results.put(get_transport().map(_double, [1, 2, 3]))
+
+
+@pytest.mark.skipif(
+    'fork' not in multiprocessing.get_all_start_methods(), reason='Needs fork'
+)
+def test_transport_after_fork():
+    # The loop thread of the parent's transport isn't copied by fork
+    assert get_transport().map(_double, [1]) == [2]
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    process = context.Process(target=_map_in_child, args=(results,))
+    process.start()
+    try:
+        assert results.get(timeout=10) == [2, 4, 6]
+    finally:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.kill()
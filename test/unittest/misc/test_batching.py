@@ -0,0 +1,137 @@
+import concurrent.futures
+import pickle
+import threading
+
+import pytest
+
+from superduper.components.model import ObjectModel
+from superduper.misc.batching import Histogram, MicroBatcher, _Request
+
+
+def test_histogram():
+    histogram = Histogram((1, 2, 4))
+    for value in (1, 2, 3, 4, 10):
+        histogram.add(value)
+    assert histogram.dict() == {'<=1': 1, '<=2': 1, '<=4': 2, '>4': 1}
+    assert str(histogram).startswith('mean 4 ')
+
+
+def _run_concurrently(fn, inputs):
+    outputs = [None] * len(inputs)
+    barrier = threading.Barrier(len(inputs))
+
+    def run(i):
+        barrier.wait()
+        outputs[i] = fn(inputs[i])
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(inputs))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outputs
+
+
+def test_micro_batcher():
+    batches = []
+
+    def double(items):
+        batches.append(len(items))
+        return [2 * x for x in items]
+
+    batcher = MicroBatcher(double, max_batch_size=4, max_latency=0.5)
+    assert _run_concurrently(batcher.submit, list(range(10))) == [
+        2 * x for x in range(10)
+    ]
+    assert max(batches) > 1 and max(batches) <= 4 and sum(batches) == 10
+    assert sum(batcher.stats['batch_size'].values()) == len(batches)
+
+    batcher.close()
+    with pytest.raises(RuntimeError):
+        batcher.submit(1)
+
+
+def test_micro_batcher_error():
+    def fail(items):
+        raise ValueError('bad batch')
+
+    batcher = MicroBatcher(fail, max_batch_size=4)
+    with pytest.raises(ValueError, match='bad batch'):
+        batcher.submit(1)
+    batcher.close()
+
+
+def test_model_predict_online():
+    batches = []
+
+    def add(x, y=1):
+        return x + y
+
+    model = ObjectModel('add', object=add, micro_batch_size=8, micro_batch_latency=0.5)
+    predict_batches = model.predict_batches
+
+    def record(dataset):
+        batches.append(len(dataset))
+        return predict_batches(dataset)
+
+    model.predict_batches = record
+    outputs = _run_concurrently(lambda x: model.predict_online(x, y=x), list(range(8)))
+    assert outputs == [2 * x for x in range(8)]
+    assert max(batches) > 1
+    assert sum(model.micro_batch_stats['batch_size'].values()) == len(batches)
+
+    # Copies start their own batcher
+    assert pickle.loads(pickle.dumps(model._micro_batcher)) is None
+
+    model.shutdown_workers()
+    assert model.micro_batch_stats is None
+    assert model.predict_online(1, y=2) == 3
+
+
+def test_micro_batcher_is_collected():
+    import gc
+    import weakref
+
+    batcher = MicroBatcher(lambda items: items, max_batch_size=4, max_latency=0.01)
+    assert batcher.submit(1) == 1
+    thread = batcher._thread
+    ref = weakref.ref(batcher)
+
+    del batcher
+    gc.collect()
+    assert ref() is None
+    # The finalizer stops the thread of the batcher
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+
+
+def test_micro_batcher_close_during_submits():
+    # Each submit racing ``close`` either returns or raises; none waits forever
+    for _ in range(20):
+        batcher = MicroBatcher(lambda items: items, max_batch_size=4, max_latency=0)
+        results = []
+
+        def submit(x):
+            try:
+                results.append(batcher.submit(x))
+            except RuntimeError:
+                results.append(None)
+
+        threads = [threading.Thread(target=submit, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        batcher.close()
+        for thread in threads:
+            thread.join(timeout=5)
+        assert len(results) == 8
+
+
+def test_micro_batcher_fails_items_left_queued():
+    batcher = MicroBatcher(lambda items: items, max_batch_size=4)
+    future: concurrent.futures.Future = concurrent.futures.Future()
+    batcher._requests.put(None)
+    batcher._requests.put(_Request(1, future, 0.0))
+    batcher._thread.join(timeout=5)
+    with pytest.raises(RuntimeError, match='closed'):
+        future.result(timeout=5)
+    batcher.close()
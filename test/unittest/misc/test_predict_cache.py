@@ -0,0 +1,105 @@
+import os
+import subprocess
+import sys
+from test.db_config import DBConfig
+
+import numpy as np
+import pytest
+
+from superduper import CFG, Document
+from superduper.components.model import ObjectModel
+from superduper.misc.predict_cache import (
+    MISSING,
+    MemoryPredictCache,
+    get_predict_cache,
+    hash_input,
+)
+
+
+def test_hash_input():
+    x = np.arange(4)
+    assert hash_input(((x,), {})) == hash_input(((np.arange(4),), {}))
+    assert hash_input(((x,), {})) != hash_input(((x + 1,), {}))
+    assert hash_input(lambda x: x) is None
+
+    # Equal inputs hash equally, whatever their order or memory layout
+    assert hash_input({'a': 1, 'b': {2, 3}}) == hash_input({'b': {3, 2}, 'a': 1})
+    y = np.arange(12.0).reshape(3, 4)
+    assert hash_input(y.T) == hash_input(np.ascontiguousarray(y.T))
+    assert hash_input(y) != hash_input(y.reshape(4, 3))
+    assert hash_input(y) != hash_input(y.astype('float32'))
+    assert hash_input([1, 2]) != hash_input((1, 2))
+
+
+_CACHE_SCRIPT = """
+import sys
+from superduper.misc.predict_cache import DiskPredictCache, MISSING, hash_input
+
+cache = DiskPredictCache('model/0', sys.argv[1])
+key = cache.key(hash_input(({'text': 'a', 'tags': {f'tag-{i}' for i in range(20)}},)))
+print('miss' if cache.get(key) is MISSING else 'hit')
+cache.put(key, 1)
+"""
+
+
+def test_hash_input_in_other_process(tmp_path):
+    # Sets of strings are iterated in an order which depends on the hash seed
+    # of the process
+    def run(seed):
+        env = {**os.environ, 'PYTHONHASHSEED': str(seed)}
+        return subprocess.run(
+            [sys.executable, '-c', _CACHE_SCRIPT, str(tmp_path)],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+
+    assert run(1) == 'miss'
+    assert run(2) == 'hit'
+
+
+def test_memory_predict_cache_lru():
+    cache = MemoryPredictCache('model/0', max_size=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert cache.get('b') is MISSING
+    assert cache.get('a') == 1 and cache.get('c') == 3
+
+
+@pytest.mark.parametrize("kind", ['memory', 'disk', 'artifact_store'])
+@pytest.mark.parametrize("db", [DBConfig.mongodb_empty], indirect=True)
+def test_predict_cache(db, kind, tmp_path, monkeypatch):
+    monkeypatch.setattr(CFG, 'predict_cache_home', str(tmp_path))
+    db.execute(db['documents'].insert_many([Document({'x': i}) for i in range(10)]))
+    calls = []
+
+    def double(x):
+        calls.append(x)
+        return 2 * x
+
+    model = ObjectModel('double', object=double, predict_cache=kind)
+    select = db['documents'].find({})
+
+    def predict():
+        model.predict_in_db(
+            X='x', db=db, select=select, predict_id='outputs', overwrite=True
+        )
+
+    predict()
+    assert sorted(calls) == list(range(10))
+
+    # Unchanged inputs are not predicted again
+    db.execute(db['documents'].update_one({'x': 3}, {'$set': {'x': 30}}))
+    predict()
+    assert sorted(calls[10:]) == [30]
+    outputs = {r['x']: r['_outputs']['outputs'] for r in db.execute(select)}
+    assert outputs[30] == 60 and outputs[4] == 8
+
+    assert get_predict_cache(model).stats['outputs'] == {'hits': 9, 'misses': 11}
+
+    model.clear_predict_cache()
+    predict()
+    assert len(calls) == 21
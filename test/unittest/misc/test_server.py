@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from superduper import CFG
+from superduper.misc import server
+from superduper.misc.server import (
+    VECTORS_CONTENT_TYPE,
+    _server_request_encoder,
+    decode_vectors,
+    encode_vectors,
+    server_request_decoder,
+)
+
+
+def test_encode_vectors():
+    h = np.random.default_rng(0).normal(size=(100, 32))
+    ids = [str(i) for i in range(100)]
+
+    payload = encode_vectors(h, ids=ids)
+    decoded, decoded_ids = decode_vectors(payload)
+    assert decoded.dtype == np.float32
+    assert np.allclose(decoded, h.astype(np.float32))
+    assert decoded_ids == ids
+
+    decoded, decoded_ids = decode_vectors(encode_vectors(h[0]))
+    assert decoded.shape == (1, 32) and decoded_ids is None
+
+    # JSON payloads are unchanged
+    assert np.allclose(server_request_decoder(_server_request_encoder(h)), h)
+
+    # The raw buffer is a fraction of the size of the base64 encoded pickle
+    legacy = _server_request_encoder(h)['_b64data']
+    assert len(encode_vectors(h)) * 2 < len(legacy)
+
+    with pytest.raises(ValueError):
+        decode_vectors(b'\0' * 64)
+
+
+def test_request_server_session(monkeypatch):
+    monkeypatch.setattr(CFG.cluster.vector_search, 'uri', 'http://localhost:8000')
+    server._session.cache_clear()
+    calls = []
+
+    class Response:
+        status_code = 200
+        content = b'{"ids": [], "scores": []}'
+
+    def post(url, **kwargs):
+        calls.append((url, kwargs))
+        return Response()
+
+    session = server._session(0)
+    monkeypatch.setattr(session, 'post', post)
+    monkeypatch.setattr(server.os, 'getpid', lambda: 0)
+
+    payload = encode_vectors(np.zeros((1, 4)))
+    server._request_server(data=payload, endpoint='query/search', args={'n': 1})
+    server._request_server(data=[1, 2], endpoint='delete/search')
+
+    assert server._session(0) is session
+    (url, kwargs), (_, json_kwargs) = calls
+    assert url == 'http://localhost:8000/query/search'
+    assert kwargs['data'] == payload
+    assert kwargs['headers']['Content-Type'] == VECTORS_CONTENT_TYPE
+    assert json_kwargs['json'] == [1, 2]
+    server._session.cache_clear()
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_vector_search_payloads(monkeypatch, binary):
+    from superduper.vector_search import interface
+    from superduper.vector_search.base import VectorItem
+
+    monkeypatch.setattr(CFG.cluster.vector_search, 'uri', 'http://localhost:8000')
+    monkeypatch.setattr(CFG.cluster.vector_search, 'binary_vectors', binary)
+    calls = []
+
+    def request_server(**kwargs):
+        calls.append(kwargs)
+        return {'ids': [], 'scores': []}
+
+    monkeypatch.setattr(interface, 'request_server', request_server)
+    searcher = interface.FastVectorSearcher.__new__(interface.FastVectorSearcher)
+    searcher.vector_index = 'test'
+
+    searcher.add([VectorItem(id='0', vector=np.zeros(4))])
+    searcher.find_nearest_from_array(np.zeros(4), n=1)
+    add, query = calls
+    if binary:
+        assert decode_vectors(add['data'])[1] == ['0']
+        assert decode_vectors(query['data'])[0].shape == (1, 4)
+    else:
+        # JSON payloads until the service decodes binary vectors
+        assert add['data'][0]['id'] == '0'
+        assert isinstance(query['data'], np.ndarray)
@@ -1,3 +1,4 @@
+import concurrent.futures
 import tempfile
 import uuid
 
@@ -7,7 +8,10 @@ import pytest
 from superduper import CFG
 from superduper.vector_search.base import VectorItem
 from superduper.vector_search.in_memory import InMemoryVectorSearcher
+from superduper.vector_search.in_memory_ivf import InMemoryIVFVectorSearcher
+from superduper.vector_search.in_memory_pq import InMemoryPQVectorSearcher
 from superduper.vector_search.lance import LanceVectorSearcher
+from superduper.vector_search.sharded import ShardedVectorSearcher
 
 
 @pytest.fixture
@@ -20,7 +24,13 @@ def index_data(monkeypatch):
 
 
 @pytest.mark.parametrize(
-    "vector_index_cls", [InMemoryVectorSearcher, LanceVectorSearcher]
+    "vector_index_cls",
+    [
+        InMemoryVectorSearcher,
+        InMemoryIVFVectorSearcher,
+        InMemoryPQVectorSearcher,
+        LanceVectorSearcher,
+    ],
 )
 @pytest.mark.parametrize("measure", ['l2', 'dot', 'cosine'])
 def test_index(index_data, measure, vector_index_cls):
@@ -39,3 +49,447 @@ def test_index(index_data, measure, vector_index_cls):
     res, _ = h.find_nearest_from_array(y, 1)
 
     assert res[0] == 'new'
+
+
+def _recall_at_k(searcher, exact, queries, k):
+    hits = 0
+    for q in queries:
+        expected, _ = exact.find_nearest_from_array(q, k)
+        found, _ = searcher.find_nearest_from_array(q, k)
+        hits += len(set(expected) & set(found))
+    return hits / (k * len(queries))
+
+
+@pytest.mark.parametrize("measure", ['l2', 'dot', 'cosine'])
+def test_ivf_recall(measure):
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(32, 16))
+    h = centers[rng.integers(0, 32, size=4000)] + 0.3 * rng.normal(size=(4000, 16))
+    ids = [str(i) for i in range(h.shape[0])]
+    queries = h[rng.choice(h.shape[0], size=20, replace=False)]
+
+    exact = InMemoryVectorSearcher(
+        'exact', dimensions=16, h=h, index=ids, measure=measure
+    )
+    ivf = InMemoryIVFVectorSearcher(
+        'ivf', dimensions=16, h=h, index=ids, measure=measure, n_lists=32, n_probe=4
+    )
+    assert ivf._centroids is None
+    ivf.post_create()
+    assert ivf._centroids.shape == (32, 16)
+
+    assert _recall_at_k(ivf, exact, queries, 10) >= 0.9
+
+    # Probing every list is equivalent to brute-force search
+    ivf.n_probe = 32
+    assert _recall_at_k(ivf, exact, queries, 10) == 1.0
+
+
+def test_ivf_tiny_lists_fall_back_to_exact_search():
+    rng = np.random.default_rng(0)
+    h = rng.normal(size=(64, 8))
+    ids = [str(i) for i in range(h.shape[0])]
+    exact = InMemoryVectorSearcher('exact', dimensions=8, h=h, index=ids)
+    ivf = InMemoryIVFVectorSearcher(
+        'ivf', dimensions=8, h=h, index=ids, n_lists=32, n_probe=1, min_train_size=1
+    )
+    ivf.post_create()
+    assert ivf._centroids is not None
+
+    # One probed list holds far fewer than ``n`` rows
+    query = h[0]
+    found, _ = ivf.find_nearest_from_array(query, 20)
+    expected, _ = exact.find_nearest_from_array(query, 20)
+    assert found == expected
+
+
+@pytest.mark.parametrize("measure", ['l2', 'dot', 'cosine'])
+@pytest.mark.parametrize(
+    "quantization, rerank_factor, min_recall, max_bytes",
+    [('float16', 0, 0.95, 2), ('int8', 0, 0.85, 1), ('int8', 4, 0.99, 1)],
+)
+def test_quantization(measure, quantization, rerank_factor, min_recall, max_bytes):
+    rng = np.random.default_rng(4)
+    h = rng.normal(size=(3000, 32))
+    ids = [str(i) for i in range(h.shape[0])]
+    queries = h[:20] + 0.1 * rng.normal(size=(20, 32))
+
+    exact = InMemoryVectorSearcher('exact', dimensions=32, measure=measure)
+    exact.add([VectorItem(id=id, vector=v) for id, v in zip(ids, h)])
+    quantized = InMemoryVectorSearcher(
+        'quantized',
+        dimensions=32,
+        measure=measure,
+        quantization=quantization,
+        rerank_factor=rerank_factor,
+    )
+    quantized.add([VectorItem(id=id, vector=v) for id, v in zip(ids, h)])
+    quantized.post_create()
+
+    assert quantized._h.itemsize == max_bytes
+    assert _recall_at_k(quantized, exact, queries, 10) >= min_recall
+
+    within_ids = ids[:100]
+    res, _ = quantized.find_nearest_from_array(queries[0], n=5, within_ids=within_ids)
+    assert set(res) <= set(within_ids)
+
+    quantized.delete(ids[:5])
+    res, _ = quantized.find_nearest_from_array(queries[0], n=3000)
+    assert len(res) == 2995 and '0' not in res
+
+
+@pytest.mark.parametrize(
+    "vector_index_cls", [InMemoryVectorSearcher, InMemoryIVFVectorSearcher]
+)
+@pytest.mark.parametrize("measure", ['l2', 'dot', 'cosine'])
+def test_find_nearest_from_arrays(vector_index_cls, measure):
+    rng = np.random.default_rng(1)
+    h = rng.normal(size=(2000, 8))
+    ids = [str(i) for i in range(h.shape[0])]
+    searcher = vector_index_cls(
+        'my-index', dimensions=8, h=h, index=ids, measure=measure
+    )
+    queries = rng.normal(size=(5, 8))
+
+    results = searcher.find_nearest_from_arrays(queries, n=7)
+    assert len(results) == 5
+    for query, (batch_ids, batch_scores) in zip(queries, results):
+        single_ids, single_scores = searcher.find_nearest_from_array(query, n=7)
+        assert batch_ids == single_ids
+        assert np.allclose(batch_scores, single_scores)
+        assert len(batch_ids) == 7
+        assert batch_scores == sorted(batch_scores, reverse=True)
+
+    within_ids = ids[:50]
+    results = searcher.find_nearest_from_arrays(queries, n=3, within_ids=within_ids)
+    for batch_ids, _ in results:
+        assert set(batch_ids) <= set(within_ids)
+
+
+@pytest.mark.parametrize(
+    "vector_index_cls, kwargs",
+    [
+        (InMemoryVectorSearcher, {}),
+        (InMemoryIVFVectorSearcher, {'n_probe': 1000}),
+        (
+            InMemoryPQVectorSearcher,
+            {'n_subvectors': 2, 'min_train_size': 256, 'rerank_factor': 50},
+        ),
+    ],
+)
+def test_in_memory_upsert_delete_compact(vector_index_cls, kwargs):
+    rng = np.random.default_rng(2)
+    searcher = vector_index_cls('my-index', dimensions=4, measure='l2', **kwargs)
+    h = rng.normal(size=(1500, 4))
+    ids = [str(i) for i in range(h.shape[0])]
+    for i in range(0, 1500, 100):
+        searcher.add(
+            [VectorItem(id=id, vector=v) for id, v in zip(ids[i : i + 100], h[i:])]
+        )
+    searcher.post_create()
+    assert len(searcher) == 1500
+    assert searcher._h.shape[0] >= 1500
+
+    # Upserts overwrite the existing row instead of appending a new one
+    row = searcher.lookup['0']
+    searcher.add([VectorItem(id='0', vector=np.array([100.0, 0, 0, 0]))])
+    searcher.post_create()
+    assert len(searcher) == 1500
+    assert searcher.lookup['0'] == row
+    assert searcher.find_nearest_from_array(np.array([100.0, 0, 0, 0]), n=1)[0] == ['0']
+
+    # Deletes are tombstoned and excluded from results
+    searcher.delete(['0', '1'])
+    assert len(searcher) == 1498
+    assert searcher._n == 1500
+    res, _ = searcher.find_nearest_from_array(np.array([1.0, 0, 0, 0]), n=1500)
+    assert len(res) == 1498
+    assert '0' not in res and '1' not in res
+
+    # Deleting beyond the compaction threshold compacts the store
+    searcher.delete(ids[2:500])
+    assert len(searcher) == 1000
+    assert searcher._n == 1000
+    assert searcher.index == ids[500:]
+    res, _ = searcher.find_nearest_from_array(h[700], n=1)
+    assert res == ['700']
+
+
+@pytest.mark.parametrize("measure", ['l2', 'dot', 'cosine'])
+def test_pq(tmp_path, measure):
+    from superduper.backends.local.artifacts import FileSystemArtifactStore
+
+    rng = np.random.default_rng(5)
+    h = rng.normal(size=(3000, 4)) @ rng.normal(size=(4, 32))
+    ids = [str(i) for i in range(h.shape[0])]
+    queries = h[:20] + 0.1 * rng.normal(size=(20, 32))
+    exact = InMemoryVectorSearcher(
+        'exact', dimensions=32, h=h, index=ids, measure=measure
+    )
+
+    artifact_store = FileSystemArtifactStore(str(tmp_path / 'artifacts'))
+    kwargs = dict(
+        measure=measure,
+        n_subvectors=8,
+        min_train_size=1000,
+        artifact_store=artifact_store,
+        codebook_id='codebooks',
+    )
+    pq = InMemoryPQVectorSearcher('pq', dimensions=32, **kwargs)
+    pq.add([VectorItem(id=id, vector=v) for id, v in zip(ids, h)])
+    pq.post_create()
+    assert pq._h.dtype == np.uint8 and pq._h.shape[1] == 8
+    assert _recall_at_k(pq, exact, queries, 10) >= 0.5
+
+    reranked = InMemoryPQVectorSearcher('pq', dimensions=32, rerank_factor=10, **kwargs)
+    reranked.add([VectorItem(id=id, vector=v) for id, v in zip(ids, h)])
+    assert _recall_at_k(reranked, exact, queries, 10) >= 0.95
+
+    # The trained codebooks are reused, so vectors are encoded on arrival
+    reloaded = InMemoryPQVectorSearcher('pq', dimensions=32, **kwargs)
+    assert np.array_equal(reloaded._codebooks, pq._codebooks)
+    reloaded.add([VectorItem(id=id, vector=v) for id, v in zip(ids[:10], h)])
+    reloaded.post_create()
+    assert reloaded._h.dtype == np.uint8
+    assert np.array_equal(reloaded._h[:10], pq._h[:10])
+
+    path = str(tmp_path / 'snapshot')
+    pq.save_snapshot(path)
+    restored = InMemoryPQVectorSearcher('pq', dimensions=32, measure=measure)
+    assert sorted(restored.load_snapshot(path)) == sorted(ids)
+    query = queries[:1]
+    expected = pq.find_nearest_from_arrays(query, n=10)
+    assert restored.find_nearest_from_arrays(query, n=10) == expected
+    plain = InMemoryVectorSearcher('pq', dimensions=32, measure=measure)
+    assert plain.load_snapshot(path) is None
+
+
+@pytest.mark.parametrize(
+    "vector_index_cls", [InMemoryVectorSearcher, InMemoryIVFVectorSearcher]
+)
+@pytest.mark.parametrize(
+    "kwargs",
+    [{}, {'quantization': 'int8'}, {'quantization': 'int8', 'rerank_factor': 2}],
+)
+def test_in_memory_snapshot(tmp_path, vector_index_cls, kwargs):
+    rng = np.random.default_rng(3)
+    h = rng.normal(size=(200, 8))
+    ids = [str(i) for i in range(h.shape[0])]
+    searcher = vector_index_cls('my-index', dimensions=8, measure='l2', **kwargs)
+    searcher.add([VectorItem(id=id, vector=v) for id, v in zip(ids, h)])
+    searcher.delete(ids[:100])
+    path = str(tmp_path / 'snapshot')
+    searcher.save_snapshot(path, watermark={'created_at': 'now'})
+
+    restored = vector_index_cls('my-index', dimensions=8, measure='l2', **kwargs)
+    assert sorted(restored.load_snapshot(path)) == sorted(ids[100:])
+    assert isinstance(restored._h, np.memmap)
+    assert restored.find_nearest_from_array(h[150], n=1)[0] == ['150']
+
+    # Writes after loading do not modify the snapshot on disk
+    restored.add([VectorItem(id='new', vector=h[0])])
+    restored.delete(['150'])
+    assert restored.find_nearest_from_array(h[0], n=1)[0] == ['new']
+    reloaded = vector_index_cls('my-index', dimensions=8, measure='l2', **kwargs)
+    assert '150' in reloaded.load_snapshot(path)
+
+    other_measure = vector_index_cls('my-index', dimensions=8, measure='dot')
+    assert other_measure.load_snapshot(path) is None
+    assert restored.load_snapshot(str(tmp_path / 'missing')) is None
+
+    other_quantization = vector_index_cls(
+        'my-index', dimensions=8, measure='l2', quantization='float16'
+    )
+    assert other_quantization.load_snapshot(path) is None
+
+
+@pytest.mark.parametrize(
+    "vector_index_cls", [InMemoryVectorSearcher, InMemoryIVFVectorSearcher]
+)
+@pytest.mark.parametrize("n_within", [5, 1500])
+def test_find_nearest_within_ids(vector_index_cls, n_within):
+    rng = np.random.default_rng(3)
+    h = rng.normal(size=(3000, 8))
+    ids = [str(i) for i in range(h.shape[0])]
+    searcher = vector_index_cls('my-index', dimensions=8, h=h, index=ids, measure='l2')
+    exact = InMemoryVectorSearcher('exact', dimensions=8, h=h, index=ids, measure='l2')
+
+    within_ids = [str(i) for i in rng.choice(3000, size=n_within, replace=False)]
+    # Ids without a vector are ignored
+    within_ids.append('missing')
+    query = rng.normal(size=8)
+
+    res, scores = searcher.find_nearest_from_array(query, n=3, within_ids=within_ids)
+    assert len(res) == 3
+    assert set(res) <= set(within_ids)
+    assert scores == sorted(scores, reverse=True)
+
+    # Selective filters are searched exactly
+    if n_within == 5:
+        expected = sorted(
+            within_ids[:-1], key=lambda i: np.linalg.norm(h[int(i)] - query)
+        )
+        assert res == expected[:3]
+    exact_res, _ = exact.find_nearest_from_array(query, n=3, within_ids=within_ids)
+    assert res[0] == exact_res[0]
+
+
+@pytest.mark.parametrize("max_prefilter_ids", [1000, 1])
+def test_lance_within_ids(index_data, max_prefilter_ids):
+    _, _, ud = index_data
+    rng = np.random.default_rng(4)
+    h = rng.normal(size=(200, 3))
+    ids = [str(i) for i in range(200)]
+    searcher = LanceVectorSearcher(
+        identifier='my-index',
+        dimensions=3,
+        h=h,
+        index=ids,
+        measure='l2',
+        max_prefilter_ids=max_prefilter_ids,
+    )
+    within_ids = ['3', '50', '199']
+    res, _ = searcher.find_nearest_from_array(h[50], n=2, within_ids=within_ids)
+    assert len(res) == 2
+    assert res[0] == '50'
+    assert set(res) <= set(within_ids)
+
+
+def test_lance_index(index_data):
+    rng = np.random.default_rng(7)
+    centers = rng.normal(size=(16, 16))
+    h = centers[rng.integers(0, 16, size=3000)] + 0.3 * rng.normal(size=(3000, 16))
+    ids = [f'id-{i}' for i in range(h.shape[0])]
+    exact = InMemoryVectorSearcher('exact', dimensions=16, h=h, index=ids, measure='l2')
+
+    searcher = LanceVectorSearcher(
+        identifier='my-index',
+        dimensions=16,
+        measure='l2',
+        batch_size=1000,
+        index_threshold=2000,
+    )
+    items = [VectorItem(id=id, vector=v) for id, v in zip(ids, h)]
+    for start in range(0, 3000, 100):
+        searcher.add(items[start : start + 100])
+    # Buffered additions are appended in 3 batches, plus one index build
+    assert searcher.dataset.version == 4
+    assert searcher.dataset.has_index
+    assert searcher._indexed_rows == 2000
+    searcher.post_create()
+    assert len(searcher) == 3000
+
+    queries = h[:20] + 0.01
+    assert _recall_at_k(searcher, exact, queries, 10) >= 0.9
+    res, _ = searcher.find_nearest_from_id('id-5', n=1)
+    assert res == ['id-5']
+
+    # Other handles of the dataset see new versions
+    reader = LanceVectorSearcher(
+        identifier='my-index', dimensions=16, measure='l2', refresh_interval=0
+    )
+    assert reader.dataset.has_index
+    assert reader._indexed_rows == 2000
+    searcher.delete(['id-5'])
+    res, _ = reader.find_nearest_from_array(h[5], n=1)
+    assert res != ['id-5']
+    with pytest.raises(KeyError):
+        reader.find_nearest_from_id('id-5')
+
+
+@pytest.mark.parametrize("measure", ['l2', 'cosine'])
+def test_sharded(tmp_path, measure):
+    rng = np.random.default_rng(6)
+    h = rng.normal(size=(2000, 8))
+    ids = [str(i) for i in range(h.shape[0])]
+    queries = h[:10] + 0.01
+    exact = InMemoryVectorSearcher(
+        'exact', dimensions=8, h=h, index=ids, measure=measure
+    )
+
+    sharded = ShardedVectorSearcher(
+        'sharded', dimensions=8, measure=measure, n_shards=3, start_method='fork'
+    )
+    try:
+        sharded.add([VectorItem(id=id, vector=v) for id, v in zip(ids, h)])
+        sharded.post_create()
+        assert len(sharded) == 2000
+
+        assert sharded.find_nearest_from_arrays(
+            queries, n=10
+        ) == exact.find_nearest_from_arrays(queries, n=10)
+        assert sharded.find_nearest_from_id('5', n=5) == exact.find_nearest_from_id(
+            '5', n=5
+        )
+        res, _ = sharded.find_nearest_from_array(h[0], n=5, within_ids=ids[100:110])
+        assert set(res) <= set(ids[100:110])
+
+        # Concurrent searches get their own replies
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as pool:
+            found = list(pool.map(lambda x: sharded.find_nearest_from_array(x), h[:40]))
+        assert found == [exact.find_nearest_from_array(x) for x in h[:40]]
+
+        sharded.delete(ids[:100])
+        assert len(sharded) == 1900
+        res, _ = sharded.find_nearest_from_array(h[0], n=2000)
+        assert len(res) == 1900 and '0' not in res
+        with pytest.raises(KeyError):
+            sharded.find_nearest_from_id('0')
+
+        path = str(tmp_path / 'snapshot')
+        sharded.save_snapshot(path)
+        restored = ShardedVectorSearcher(
+            'sharded', dimensions=8, measure=measure, n_shards=3, start_method='fork'
+        )
+        try:
+            assert sorted(restored.load_snapshot(path)) == sorted(ids[100:])
+            assert restored.find_nearest_from_arrays(
+                queries, n=10
+            ) == sharded.find_nearest_from_arrays(queries, n=10)
+        finally:
+            restored.close()
+    finally:
+        sharded.close()
+
+
+def test_sharded_non_str_ids():
+    from bson import ObjectId
+
+    rng = np.random.default_rng(7)
+    h = rng.normal(size=(20, 8))
+    ids = [*range(10), *(ObjectId() for _ in range(10))]
+    sharded = ShardedVectorSearcher(
+        'sharded', dimensions=8, measure='l2', n_shards=3, start_method='fork'
+    )
+    try:
+        sharded.add([VectorItem(id=id, vector=v) for id, v in zip(ids, h)])
+        sharded.post_create()
+        assert len(sharded) == 20
+        res, _ = sharded.find_nearest_from_id(ids[15], n=1)
+        assert res == [ids[15]]
+        sharded.delete([ids[0], ids[15]])
+        assert len(sharded) == 18
+    finally:
+        sharded.close()
+
+
+def test_from_component_searcher_kwargs(monkeypatch, tmp_path):
+    from types import SimpleNamespace
+
+    monkeypatch.setattr(CFG, 'lance_home', str(tmp_path))
+    monkeypatch.setattr(
+        CFG.cluster.vector_search,
+        'searcher_kwargs',
+        {'quantization': 'int8', 'rerank_factor': 2, 'n_probe': 3},
+    )
+    vi = SimpleNamespace(
+        identifier='vi', dimensions=4, measure='l2', quantization=None, rerank_factor=0
+    )
+
+    # The configured kwargs override those of the vector index
+    searcher = InMemoryVectorSearcher.from_component(vi)
+    assert (searcher.quantization, searcher.rerank_factor) == ('int8', 2)
+    assert InMemoryIVFVectorSearcher.from_component(vi).n_probe == 3
+
+    # Kwargs of in-memory searchers aren't given to other searchers
+    assert isinstance(LanceVectorSearcher.from_component(vi), LanceVectorSearcher)